@@ -0,0 +1,163 @@
+"""Rules installed by the last successful update of each Twitter app
+
+Updates are planned from this local state instead of fetching all the
+rules from Twitter. Only the stream groups whose hash changed are compared.
+The installed rules are fetched again when the state is older than the drift
+check interval, or when a drift check is forced, in case they were changed
+outside of twcompose.
+"""
+import dataclasses
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from twcompose.cache import get_cache_dir
+from twcompose.compose import TwitterComposeModel, TwitterStreamRuleModel
+from twcompose.rules import TwitterRule, TwitterRuleAPI
+
+# Fetching the installed rules at least once an hour
+DEFAULT_DRIFT_CHECK_INTERVAL = 60 * 60
+
+
+def get_group_hash(rules: Iterable[TwitterStreamRuleModel]) -> str:
+    """Hash of the rules of a stream group, regardless of their order"""
+    identities = sorted([r.value, r.tag] for r in rules)
+    return hashlib.sha256(json.dumps(identities).encode()).hexdigest()
+
+
+@dataclasses.dataclass
+class AppliedGroup:
+    """Rules installed for a stream group
+
+    Attributes:
+        hash (str): Hash of the rules of the group in the compose file
+        rules (list[TwitterRule]): The installed rules, with their ids
+    """
+
+    hash: str
+    rules: List[TwitterRule]
+
+
+@dataclasses.dataclass
+class AppliedRules:
+    """Rules installed on a Twitter app by the last successful update
+
+    Attributes:
+        project_name (str): The project that installed the rules
+        groups (dict[str, AppliedGroup]): Installed rules of each stream group
+        checked_at (float): Time when the installed rules were last
+            fetched from Twitter
+    """
+
+    project_name: str
+    groups: Dict[str, AppliedGroup]
+    checked_at: float
+
+    @classmethod
+    def from_installed_rules(
+        cls,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        installed_rules: Iterable[TwitterRule],
+        checked_at: float,
+    ) -> "AppliedRules":
+        """Assigns rules installed from the compose file to its stream groups"""
+        installed = {r.identity(): r for r in installed_rules}
+        groups = {}
+        for name, rules in compose_config.streams.items():
+            identities = [TwitterRule.from_rule_model(r).identity() for r in rules]
+            groups[name] = AppliedGroup(
+                hash=get_group_hash(rules),
+                rules=[installed[i] for i in identities if i in installed],
+            )
+        return cls(project_name=project_name, groups=groups, checked_at=checked_at)
+
+    def rules(self) -> Set[TwitterRule]:
+        return {r for group in self.groups.values() for r in group.rules}
+
+    def changed_groups(self, compose_config: TwitterComposeModel) -> Set[str]:
+        """Names of the stream groups added, removed or modified since"""
+        changed = set(self.groups) - set(compose_config.streams)
+        for name, rules in compose_config.streams.items():
+            group = self.groups.get(name)
+            if group is None or group.hash != get_group_hash(rules):
+                changed.add(name)
+        return changed
+
+    def needs_drift_check(self, interval: float) -> bool:
+        """Whether the installed rules were fetched more than `interval` ago"""
+        return time.time() - self.checked_at >= interval
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AppliedRules":
+        return cls(
+            project_name=data["project_name"],
+            groups={
+                name: AppliedGroup(
+                    hash=group["hash"],
+                    rules=[TwitterRule(**r) for r in group["rules"]],
+                )
+                for name, group in data["groups"].items()
+            },
+            checked_at=data["checked_at"],
+        )
+
+
+def _default_store_path() -> pathlib.Path:
+    return get_cache_dir() / "applied"
+
+
+@dataclasses.dataclass
+class AppliedRulesStore:
+    """JSON files of the applied rules, one per Twitter app and API
+
+    Attributes:
+        path (pathlib.Path): The folder of the files.
+            Defaults to `applied` in the twcompose cache directory.
+    """
+
+    path: pathlib.Path = dataclasses.field(default_factory=_default_store_path)
+
+    def _get_file(self, twitter_api: TwitterRuleAPI) -> pathlib.Path:
+        # The rules belong to the app of the token, never stored in clear
+        key = f"{twitter_api.url_rules}\n{twitter_api.twitter_token}"
+        return self.path / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def load(
+        self, twitter_api: TwitterRuleAPI, project_name: str
+    ) -> Optional[AppliedRules]:
+        """The rules applied by the project, `None` if unknown
+
+        The rules applied by another project with the same Twitter app are
+        unknown, they are fetched again.
+        """
+        try:
+            data = json.loads(self._get_file(twitter_api).read_text())
+            applied_rules = AppliedRules.from_dict(data)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if applied_rules.project_name != project_name:
+            return None
+        return applied_rules
+
+    def save(self, twitter_api: TwitterRuleAPI, applied_rules: AppliedRules) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path, suffix=".tmp", delete=False
+        ) as f:
+            json.dump(applied_rules.to_dict(), f)
+        os.replace(f.name, self._get_file(twitter_api))
+
+    def clear(self, twitter_api: TwitterRuleAPI) -> None:
+        """Forgets the applied rules, the next update fetches them"""
+        try:
+            self._get_file(twitter_api).unlink()
+        except FileNotFoundError:
+            pass
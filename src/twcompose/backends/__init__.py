@@ -1,6 +1,16 @@
+from typing import Optional
+
+from twcompose.compose import TwitterComposeModel
+
 from .abstract import AbstractCollectionBackend
 from .docker import DockerCollectionBackend
+from .process import SubprocessCollectionBackend
 
 
-def get_collections_backend() -> AbstractCollectionBackend:
+def get_collections_backend(
+    compose_config: Optional[TwitterComposeModel] = None,
+) -> AbstractCollectionBackend:
+    """The backend selected in the compose file, Docker by default"""
+    if compose_config is not None and compose_config.backend == "subprocess":
+        return SubprocessCollectionBackend()
     return DockerCollectionBackend()
@@ -1,7 +1,7 @@
 import abc
 import dataclasses
 import pathlib
-from typing import Dict, Generic, TypeVar
+from typing import Dict, Generic, Iterable, List, Optional, TypeVar, Union
 
 from twcompose.compose import TwitterComposeModel
 
@@ -18,6 +18,26 @@ class CollectorDoesNotExist(Exception):
     pass
 
 
+def get_collector_arguments(
+    compose_config: TwitterComposeModel,
+    credentials_file: Union[str, pathlib.Path],
+    output_folder: Union[str, pathlib.Path],
+) -> List[str]:
+    """Command line arguments of twcollect for the configuration"""
+    command_parameters: List[str] = ["-c", str(credentials_file)]
+
+    stream_parameters = compose_config.parameters.to_querystring()
+    if stream_parameters:
+        command_parameters += ["-p", stream_parameters]
+
+    if "max_file_size" in compose_config.output.options:
+        command_parameters += [
+            "--max-file-size",
+            str(compose_config.output.options["max_file_size"]),
+        ]
+    return command_parameters + [str(output_folder)]
+
+
 class AbstractCollectionBackend(abc.ABC):
     """Abstract class for a backend to collect Tweet streams"""
 
@@ -68,3 +88,60 @@ class AbstractCollectionBackend(abc.ABC):
         Returns:
             bool: True if the collection is running the project
         """
+
+    def prepare(
+        self, compose_configs: Iterable[TwitterComposeModel], check: bool = False
+    ) -> List[str]:
+        """Prepares what the collectors need before any of them is changed
+
+        Does nothing by default.
+
+        Args:
+            compose_configs (Iterable[TwitterComposeModel]): The configurations
+                of the collectors to update
+            check (bool): Only resolves what the collectors would need,
+                without changing anything. Defaults to `False`.
+
+        Returns:
+            List[str]: Messages describing what was prepared
+        """
+        return []
+
+    def get_pinned_image(self, compose_config: TwitterComposeModel) -> Optional[str]:
+        """The exact image the collector would run, to run it again later
+
+        `None` by default, for backends that do not run images.
+
+        Raises:
+            ValueError: If the image of the configuration cannot be pinned
+        """
+        return None
+
+    def pin_image(self, compose_config: TwitterComposeModel, image: str) -> None:
+        """Runs the collectors of the configuration with the given image
+
+        The image is a reference returned by `get_pinned_image`, it is used
+        instead of the image of the tag without pulling it. Does nothing
+        by default.
+        """
+
+    def prefetch(self, project_names: Optional[Iterable[str]] = None) -> None:
+        """Fetches the state of many collectors at once
+
+        Backends caching the state of the collectors can implement this
+        to avoid a call per collector. Does nothing by default.
+
+        Args:
+            project_names (Iterable[str] | None): The projects to fetch,
+                all the projects of the backend if `None`
+        """
+
+    def invalidate(self, project_name: Optional[str] = None) -> None:
+        """Forgets the cached state of a collector after it was changed
+
+        Does nothing by default.
+
+        Args:
+            project_name (str | None): The project to forget,
+                all the projects if `None`
+        """
@@ -1,17 +1,52 @@
 import dataclasses
+import hashlib
+import json
+import logging
 import pathlib
-from typing import Dict, List, Optional, Set, Tuple
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 import docker
 import docker.errors
 from docker.models.containers import Container
+from docker.models.images import Image
 
 from twcompose.backends.abstract import (
     AbstractCollectionBackend,
     CollectorDoesNotExist,
     CollectorValueDifference,
+    get_collector_arguments,
 )
 from twcompose.compose import TwitterComposeModel
+from twcompose.output import deduplicate_handoff
+
+_logger = logging.getLogger(__name__)
+
+CONTAINER_NAME_PREFIX = "stream_"
+CONFIG_HASH_LABEL = "twcompose.config-hash"
+# Output sub-folder of the collector with the handoff update strategy
+SLOT_LABEL = "twcompose.slot"
+OUTPUT_SLOTS = ("blue", "green")
+HANDOFF_NAME_SUFFIX = "_next"
+# Errors logged by twcollect with the default logging format
+COLLECTOR_ERROR_PATTERN = re.compile(rb"^(ERROR|CRITICAL):twcollect\b", re.MULTILINE)
+
+
+def get_name_from_container(container: Container) -> str:
+    """Returns the name of a container, also from `containers.list(sparse=True)`"""
+    if container.attrs.get("Name") is not None:
+        return container.attrs["Name"].lstrip("/")
+    return container.attrs["Names"][0].lstrip("/")
+
+
+def get_labels_from_container(container: Container) -> Dict[str, str]:
+    """Returns the labels of a container, also from `containers.list(sparse=True)`"""
+    if "Config" in container.attrs:
+        return container.attrs["Config"].get("Labels") or {}
+    return container.attrs.get("Labels") or {}
 
 
 def get_command_from_container(container: Container) -> List[str]:
@@ -29,6 +64,43 @@ def get_image_name_from_container(container: Container) -> str:
     return container.attrs["Config"]["Image"]
 
 
+def get_repo_digest(image: Image, image_name: str) -> Optional[str]:
+    """Returns the `<image_name>@sha256:<digest>` reference of an image"""
+    for repo_digest in image.attrs.get("RepoDigests") or []:
+        if repo_digest.split("@")[0] == image_name:
+            return repo_digest
+    return None
+
+
+@dataclasses.dataclass
+class ImagePull:
+    """Result of the pull of an image
+
+    Attributes:
+        image (str): The `<image_name>:<image_tag>` reference of the image
+        digest (str | None): The digest reference the tag resolved to
+        seconds (float): The time it took to pull the image
+        error (str | None): The error message if the pull failed
+        pulled (bool): Whether the image was pulled, or only its digest was
+            resolved from the registry
+    """
+
+    image: str
+    digest: Optional[str]
+    seconds: float
+    error: Optional[str] = None
+    pulled: bool = True
+
+    def __str__(self) -> str:
+        if not self.pulled:
+            if self.error is not None:
+                return f"Failed to resolve image {self.image}: {self.error}"
+            return f"Resolved image {self.image} ({self.digest}), not pulled"
+        if self.error is not None:
+            return f"Failed to pull image {self.image}: {self.error}"
+        return f"Pulled image {self.image} ({self.digest}) in {self.seconds:.1f}s"
+
+
 def _volume_set_to_str(volumes: Set[str]) -> str:
     return " ; ".join(sorted(volumes))
 
@@ -39,70 +111,275 @@ def _command_to_str(command: List[str]) -> str:
 
 @dataclasses.dataclass
 class DockerCollectionBackend(AbstractCollectionBackend):
+    """Collects Tweets in a docker container per project
+
+    Containers are looked up once and kept in a snapshot for the lifetime
+    of the backend, which is created for each command. The snapshot of a
+    project is invalidated when its container is changed.
+
+    With the `handoff` update strategy, collectors write in alternating
+    `blue` and `green` sub-folders of the output. A new collector is started
+    next to the running one, which is stopped only once the new one streams.
+
+    Attributes:
+        docker_client (docker.DockerClient): Connection to the Docker daemon
+        poll_interval (float): Seconds between checks of a starting collector
+    """
+
     docker_client: docker.DockerClient = dataclasses.field(
         default_factory=docker.from_env
     )
+    poll_interval: float = 1.0
+    _containers: Dict[str, Optional[Container]] = dataclasses.field(
+        default_factory=dict, init=False, repr=False
+    )
+    _images: Dict[str, Optional[Image]] = dataclasses.field(
+        default_factory=dict, init=False, repr=False
+    )
+    # Digest references resolved from the registry without pulling the images
+    _digests: Dict[str, str] = dataclasses.field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
 
     def get_container_name(self, project_name: str) -> str:
-        return f"stream_{project_name}"
+        return f"{CONTAINER_NAME_PREFIX}{project_name}"
 
     def get_container(self, project_name: str) -> Optional[Container]:
         """Get the container for the Tweet collection project"""
+        with self._lock:
+            if project_name in self._containers:
+                return self._containers[project_name]
         try:
-            return self.docker_client.containers.get(
+            container: Optional[Container] = self.docker_client.containers.get(
                 self.get_container_name(project_name)
             )
         except docker.errors.NotFound:
-            return None
+            container = None
+        with self._lock:
+            return self._containers.setdefault(project_name, container)
 
-    def _get_container_image(self, compose_config: TwitterComposeModel) -> str:
+    def _get_inspected_container(self, project_name: str) -> Optional[Container]:
+        """Get the container with all its attributes, even if listed sparsely"""
+        container = self.get_container(project_name)
+        if container is not None and "Args" not in container.attrs:
+            container.reload()
+        return container
+
+    def prefetch(self, project_names: Optional[Iterable[str]] = None) -> None:
+        """Lists all the stream containers in a single call"""
+        containers = self.docker_client.containers.list(
+            all=True, sparse=True, filters={"name": CONTAINER_NAME_PREFIX}
+        )
+        snapshot: Dict[str, Optional[Container]] = {}
+        for container in containers:
+            name = get_name_from_container(container)
+            if name.startswith(CONTAINER_NAME_PREFIX):
+                snapshot[name[len(CONTAINER_NAME_PREFIX) :]] = container
+        for project_name in project_names or ():
+            snapshot.setdefault(project_name, None)
+
+        with self._lock:
+            self._containers.update(snapshot)
+
+    def invalidate(self, project_name: Optional[str] = None) -> None:
+        with self._lock:
+            if project_name is None:
+                self._containers.clear()
+            else:
+                self._containers.pop(project_name, None)
+
+    def _get_image_tag(self, compose_config: TwitterComposeModel) -> str:
         return f"{compose_config.image_name}:{compose_config.image_tag}"
 
-    def _get_container_command(self, compose_config: TwitterComposeModel) -> List[str]:
-        command_parameters: List[str] = ["-c", "/app/credentials.yml"]
+    def _resolve_image(self, compose_config: TwitterComposeModel) -> Optional[Image]:
+        """The local image of the tag, `None` if it was never pulled"""
+        image_tag = self._get_image_tag(compose_config)
+        with self._lock:
+            if image_tag in self._images:
+                return self._images[image_tag]
+        try:
+            image: Optional[Image] = self.docker_client.images.get(image_tag)
+        except docker.errors.ImageNotFound:
+            image = None
+        with self._lock:
+            return self._images.setdefault(image_tag, image)
+
+    def _get_container_image(self, compose_config: TwitterComposeModel) -> str:
+        """The image reference pinned to the digest of the tag when known"""
+        with self._lock:
+            repo_digest = self._digests.get(self._get_image_tag(compose_config))
+        if repo_digest is not None:
+            return repo_digest
+        image = self._resolve_image(compose_config)
+        if image is not None:
+            repo_digest = get_repo_digest(image, compose_config.image_name)
+            if repo_digest is not None:
+                return repo_digest
+        return self._get_image_tag(compose_config)
+
+    def get_pinned_image(self, compose_config: TwitterComposeModel) -> str:
+        """The digest reference of the image of the tag
+
+        Raises:
+            ValueError: If the image was neither pulled nor resolved
+        """
+        image = self._get_container_image(compose_config)
+        if "@" not in image:
+            raise ValueError(f"The digest of the image {image} is unknown")
+        return image
+
+    def pin_image(self, compose_config: TwitterComposeModel, image: str) -> None:
+        with self._lock:
+            self._digests[self._get_image_tag(compose_config)] = image
+
+    def _pull_image(self, image_name: str, image_tag: str) -> ImagePull:
+        started_at = time.monotonic()
+        try:
+            image = self.docker_client.images.pull(image_name, tag=image_tag)
+        except docker.errors.APIError as e:
+            return ImagePull(
+                image=f"{image_name}:{image_tag}",
+                digest=None,
+                seconds=time.monotonic() - started_at,
+                error=str(e),
+            )
+        with self._lock:
+            self._images[f"{image_name}:{image_tag}"] = image
+        return ImagePull(
+            image=f"{image_name}:{image_tag}",
+            digest=get_repo_digest(image, image_name),
+            seconds=time.monotonic() - started_at,
+        )
 
-        stream_parameters = compose_config.parameters.to_querystring()
-        if stream_parameters:
-            command_parameters += ["-p", stream_parameters]
+    def _resolve_digest(self, image_name: str, image_tag: str) -> ImagePull:
+        started_at = time.monotonic()
+        try:
+            registry_data = self.docker_client.images.get_registry_data(
+                f"{image_name}:{image_tag}"
+            )
+        except docker.errors.APIError as e:
+            return ImagePull(
+                image=f"{image_name}:{image_tag}",
+                digest=None,
+                seconds=time.monotonic() - started_at,
+                error=str(e),
+                pulled=False,
+            )
+        repo_digest = f"{image_name}@{registry_data.id}"
+        with self._lock:
+            self._digests[f"{image_name}:{image_tag}"] = repo_digest
+        return ImagePull(
+            image=f"{image_name}:{image_tag}",
+            digest=repo_digest,
+            seconds=time.monotonic() - started_at,
+            pulled=False,
+        )
+
+    def pull_images(
+        self, compose_configs: Iterable[TwitterComposeModel], pull: bool = True
+    ) -> List[ImagePull]:
+        """Pulls the images of the collectors concurrently
+
+        The digests the tags resolved to are used to run and compare
+        the collectors. Without `pull`, the digests are only read from the
+        manifests of the registry.
+        """
+        images = sorted({(c.image_name, c.image_tag) for c in compose_configs})
+        if not images:
+            return []
+        get_image = self._pull_image if pull else self._resolve_digest
+        with ThreadPoolExecutor(max_workers=len(images)) as executor:
+            return list(executor.map(lambda i: get_image(*i), images))
+
+    def prepare(
+        self, compose_configs: Iterable[TwitterComposeModel], check: bool = False
+    ) -> List[str]:
+        return [
+            str(image_pull)
+            for image_pull in self.pull_images(compose_configs, pull=not check)
+        ]
+
+    def _get_container_command(self, compose_config: TwitterComposeModel) -> List[str]:
+        return get_collector_arguments(
+            compose_config, "/app/credentials.yml", "/app/output"
+        )
 
-        if "max_file_size" in compose_config.output.options:
-            command_parameters += [
-                "--max-file-size",
-                str(compose_config.output.options["max_file_size"]),
-            ]
-        return command_parameters + ["/app/output"]
+    def _get_output_folder(
+        self, compose_config: TwitterComposeModel, slot: Optional[str] = None
+    ) -> pathlib.Path:
+        output_folder = pathlib.Path(compose_config.output.path).absolute()
+        if slot is not None:
+            return output_folder / slot
+        return output_folder
 
     def _get_volumes(
-        self, compose_config: TwitterComposeModel, credentials_file: pathlib.Path
+        self,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+        slot: Optional[str] = None,
     ) -> Set[str]:
-        output_folder = pathlib.Path(compose_config.output.path).absolute()
+        output_folder = self._get_output_folder(compose_config, slot)
         return {
             f"{credentials_file.absolute()}:/app/credentials.yml",
             f"{output_folder}:/app/output",
         }
 
+    def _get_config_hash(
+        self, compose_config: TwitterComposeModel, credentials_file: pathlib.Path
+    ) -> str:
+        """Content hash of the configuration of the container"""
+        config = {
+            "image": self._get_container_image(compose_config),
+            "command": self._get_container_command(compose_config),
+            "volumes": sorted(self._get_volumes(compose_config, credentials_file)),
+        }
+        return hashlib.sha256(
+            json.dumps(config, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
     def diff(
         self,
         project_name: str,
         compose_config: TwitterComposeModel,
         credentials_file: pathlib.Path,
     ) -> Dict[str, CollectorValueDifference[str]]:
+        """Differences with the running collector
+
+        Containers are labelled with the hash of their configuration, the
+        attributes of the container are compared only if the hash differs.
+        """
         container = self.get_container(project_name)
 
         if container is None:
             raise CollectorDoesNotExist()
 
+        config_hash = self._get_config_hash(compose_config, credentials_file)
+        if get_labels_from_container(container).get(CONFIG_HASH_LABEL) == config_hash:
+            return {}
+
+        container = self._get_inspected_container(project_name)
+        assert container is not None
+        slot = get_labels_from_container(container).get(SLOT_LABEL)
+
+        expected_image = self._get_container_image(compose_config)
+        current_image = get_image_name_from_container(container)
+        image = self._resolve_image(compose_config)
+        if image is not None and container.attrs.get("Image") == image.id:
+            # The same image referenced by its tag or by its digest
+            current_image = expected_image
+
         # Getting attribute name, actual_value, expected_value
         attributes: List[Tuple[str, str, str]] = [
-            (
-                "image_name",
-                get_image_name_from_container(container),
-                self._get_container_image(compose_config),
-            ),
+            ("image_name", current_image, expected_image),
             (
                 "volumes",
                 _volume_set_to_str(get_volumes_map_from_container(container)),
-                _volume_set_to_str(self._get_volumes(compose_config, credentials_file)),
+                _volume_set_to_str(
+                    self._get_volumes(compose_config, credentials_file, slot)
+                ),
             ),
             (
                 "command",
@@ -122,17 +399,126 @@ class DockerCollectionBackend(AbstractCollectionBackend):
         project_name: str,
         compose_config: TwitterComposeModel,
         credentials_file: pathlib.Path,
-    ) -> None:
+        slot: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> Container:
         """Runs the streams collector container"""
-        self.docker_client.containers.run(
+        labels = {
+            CONFIG_HASH_LABEL: self._get_config_hash(compose_config, credentials_file)
+        }
+        if slot is not None:
+            labels[SLOT_LABEL] = slot
+        return self.docker_client.containers.run(
             image=self._get_container_image(compose_config),
             command=self._get_container_command(compose_config),
-            name=self.get_container_name(project_name),
-            volumes=list(self._get_volumes(compose_config, credentials_file)),
+            name=name or self.get_container_name(project_name),
+            volumes=list(self._get_volumes(compose_config, credentials_file, slot)),
+            labels=labels,
             restart_policy={"Name": "on-failure", "MaximumRetryCount": 10},
             detach=True,
         )
 
+    def _wait_until_streaming(
+        self, container: Container, warmup: float, timeout: float
+    ) -> None:
+        """Waits until the collector has been running `warmup` seconds without errors
+
+        The container must also be healthy if it defines a health check.
+        Only the logs written since the previous poll are searched for
+        the errors of twcollect.
+
+        Raises:
+            ValueError: If the collector failed or is not streaming after
+                `timeout` seconds
+        """
+        started_at = time.monotonic()
+        running_since: Optional[float] = None
+        logs_since: Optional[float] = None
+        while time.monotonic() - started_at < timeout:
+            container.reload()
+            state = container.attrs["State"]
+            if state["Status"] in ("exited", "dead") or container.attrs.get(
+                "RestartCount"
+            ):
+                raise ValueError(f"Collector {container.name} stopped while starting")
+            polled_at = time.time()
+            if logs_since is None:
+                logs = container.logs()
+            else:
+                logs = container.logs(since=logs_since)
+            if COLLECTOR_ERROR_PATTERN.search(logs):
+                raise ValueError(f"Collector {container.name} failed to stream")
+            # Lines of the same second can be read twice, not missed
+            logs_since = int(polled_at)
+
+            is_healthy = state.get("Health", {}).get("Status", "healthy") == "healthy"
+            if state["Status"] == "running" and is_healthy:
+                running_since = running_since or time.monotonic()
+                if time.monotonic() - running_since >= warmup:
+                    return
+            time.sleep(self.poll_interval)
+
+        raise ValueError(f"Collector {container.name} not streaming after {timeout}s")
+
+    def _handoff(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+        existing_container: Container,
+    ) -> None:
+        """Replaces the running collector without interrupting the collection
+
+        The new collector writes in the other output slot, tweets collected
+        by both collectors are removed from the output of the old one.
+        """
+        container_name = self.get_container_name(project_name)
+        old_slot = get_labels_from_container(existing_container).get(SLOT_LABEL)
+        new_slot = OUTPUT_SLOTS[1] if old_slot == OUTPUT_SLOTS[0] else OUTPUT_SLOTS[0]
+
+        # Removing the new collector of a cancelled handoff
+        next_name = f"{container_name}{HANDOFF_NAME_SUFFIX}"
+        try:
+            self.docker_client.containers.get(next_name).remove(force=True)
+        except docker.errors.NotFound:
+            pass
+
+        started_at = time.time()
+        new_container = self._run_container(
+            project_name,
+            compose_config,
+            credentials_file,
+            slot=new_slot,
+            name=next_name,
+        )
+        try:
+            self._wait_until_streaming(
+                new_container,
+                compose_config.handoff_warmup,
+                compose_config.handoff_timeout,
+            )
+        except ValueError:
+            # The running collector is left untouched
+            new_container.remove(force=True)
+            raise
+
+        existing_container.stop()
+        existing_container.remove()
+        new_container.rename(container_name)
+
+        try:
+            removed = deduplicate_handoff(
+                self._get_output_folder(compose_config, old_slot),
+                self._get_output_folder(compose_config, new_slot),
+                since=started_at,
+            )
+        except ValueError as e:
+            raise ValueError(
+                f"Collector {project_name} was replaced, "
+                f"but the tweets collected twice were not removed: {e}"
+            ) from e
+        _logger.info(f"Removed {removed} tweets collected twice by {project_name}")
+
     def update(
         self,
         project_name: str,
@@ -152,20 +538,38 @@ class DockerCollectionBackend(AbstractCollectionBackend):
         # we start it and return
         if existing_container and not needs_update:
             existing_container.start()
+            self.invalidate(project_name)
             return
 
+        slot: Optional[str] = None
+        if compose_config.update_strategy == "handoff":
+            if existing_container and existing_container.status == "running":
+                self._handoff(
+                    project_name, compose_config, credentials_file, existing_container
+                )
+                self.invalidate(project_name)
+                return
+            # Nothing is collected, keeping the slot of the stopped collector
+            slot = OUTPUT_SLOTS[0]
+            if existing_container:
+                slot = get_labels_from_container(existing_container).get(
+                    SLOT_LABEL, slot
+                )
+
         # If there is a container, we need to stop and remove it
         # before starting a new one
         if existing_container and needs_update:
             existing_container.stop()
             existing_container.remove()
 
-        self._run_container(project_name, compose_config, credentials_file)
+        self._run_container(project_name, compose_config, credentials_file, slot)
+        self.invalidate(project_name)
 
     def stop(self, project_name: str) -> None:
         container = self.get_container(project_name)
         if container is not None:
             container.stop()
+            self.invalidate(project_name)
 
     def is_running(self, project_name: str) -> bool:
         container = self.get_container(project_name)
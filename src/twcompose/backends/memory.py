@@ -0,0 +1,111 @@
+"""Collection backend keeping its collectors in memory, for tests and benchmarks"""
+import dataclasses
+import pathlib
+import threading
+import time
+from typing import Dict, List
+
+from twcompose.backends.abstract import (
+    AbstractCollectionBackend,
+    CollectorDoesNotExist,
+    CollectorValueDifference,
+    get_collector_arguments,
+)
+from twcompose.compose import TwitterComposeModel
+
+
+@dataclasses.dataclass
+class BackendLatencies:
+    """Seconds each operation of the in-memory backend takes
+
+    Defaults to 0 seconds, a local Docker daemon takes about 10ms to
+    inspect a container and a few seconds to start one.
+    """
+
+    diff: float = 0.0
+    update: float = 0.0
+    stop: float = 0.0
+    is_running: float = 0.0
+
+
+@dataclasses.dataclass
+class _MemoryCollector:
+    command: List[str]
+    running: bool = True
+
+
+@dataclasses.dataclass
+class InMemoryCollectionBackend(AbstractCollectionBackend):
+    """Collectors that only exist in memory, nothing is collected
+
+    Attributes:
+        latencies (BackendLatencies): Time taken by each operation
+        calls (dict[str, int]): Number of calls of each operation
+    """
+
+    latencies: BackendLatencies = dataclasses.field(default_factory=BackendLatencies)
+    calls: Dict[str, int] = dataclasses.field(default_factory=dict, init=False)
+    _collectors: Dict[str, _MemoryCollector] = dataclasses.field(
+        default_factory=dict, init=False, repr=False
+    )
+    _lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock, init=False, repr=False
+    )
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        latency = getattr(self.latencies, operation)
+        if latency > 0:
+            time.sleep(latency)
+
+    def _get_command(
+        self, compose_config: TwitterComposeModel, credentials_file: pathlib.Path
+    ) -> List[str]:
+        return [
+            f"{compose_config.image_name}:{compose_config.image_tag}"
+        ] + get_collector_arguments(
+            compose_config, credentials_file, compose_config.output.path
+        )
+
+    def diff(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+    ) -> Dict[str, CollectorValueDifference[str]]:
+        self._call("diff")
+        with self._lock:
+            collector = self._collectors.get(project_name)
+        if collector is None:
+            raise CollectorDoesNotExist()
+
+        current = " ".join(collector.command)
+        new = " ".join(self._get_command(compose_config, credentials_file))
+        if current == new:
+            return {}
+        return {"command": CollectorValueDifference(current=current, new=new)}
+
+    def update(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+    ) -> None:
+        self._call("update")
+        with self._lock:
+            self._collectors[project_name] = _MemoryCollector(
+                self._get_command(compose_config, credentials_file)
+            )
+
+    def stop(self, project_name: str) -> None:
+        self._call("stop")
+        with self._lock:
+            if project_name in self._collectors:
+                self._collectors[project_name].running = False
+
+    def is_running(self, project_name: str) -> bool:
+        self._call("is_running")
+        with self._lock:
+            collector = self._collectors.get(project_name)
+            return collector is not None and collector.running
@@ -0,0 +1,280 @@
+"""Collection of Tweet streams in local processes, without Docker
+
+Each collector is a detached supervisor process running twcollect and
+restarting it with an exponential backoff when it fails. The supervisor
+is started with `python -m twcompose.backends.process <state file>`.
+"""
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from twcompose.backends.abstract import (
+    AbstractCollectionBackend,
+    CollectorDoesNotExist,
+    CollectorValueDifference,
+    get_collector_arguments,
+)
+from twcompose.cache import get_cache_dir
+from twcompose.compose import TwitterComposeModel
+from twcompose.twitter.http import RetryPolicy
+
+_logger = logging.getLogger(__name__)
+
+# A collector running longer than this is considered started successfully
+STABLE_RUN_SECONDS = 60.0
+
+
+def _default_state_dir() -> pathlib.Path:
+    return get_cache_dir() / "collectors"
+
+
+def _write_atomic(path: pathlib.Path, content: str) -> None:
+    with tempfile.NamedTemporaryFile(
+        "w", dir=path.parent, suffix=".tmp", delete=False
+    ) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+def _read_pid(pid_file: pathlib.Path) -> Optional[int]:
+    try:
+        return int(pid_file.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    # Ignoring zombie processes, when /proc is available
+    try:
+        stat = pathlib.Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return True
+    return stat.rsplit(")", 1)[-1].split()[0] != "Z"
+
+
+@dataclasses.dataclass
+class Supervisor:
+    """Runs a command and restarts it with a backoff when it exits
+
+    Gives up after `retry_policy.max_retries` consecutive runs shorter
+    than `STABLE_RUN_SECONDS`.
+
+    Attributes:
+        command (list[str]): The command of the collector
+        pid_file (pathlib.Path | None): Where to write the pid of the collector
+        retry_policy (RetryPolicy): Delays between restarts
+    """
+
+    command: List[str]
+    pid_file: Optional[pathlib.Path] = None
+    retry_policy: RetryPolicy = dataclasses.field(
+        default_factory=lambda: RetryPolicy(
+            max_retries=10, backoff_factor=1.0, max_backoff=300.0
+        )
+    )
+    _stopped: threading.Event = dataclasses.field(
+        default_factory=threading.Event, init=False, repr=False
+    )
+    _process: Optional[subprocess.Popen] = dataclasses.field(
+        default=None, init=False, repr=False
+    )
+
+    def run(self) -> int:
+        """Runs the command until stopped or failing too often
+
+        Returns:
+            int: The number of times the command was started
+        """
+        runs = 0
+        retry = 0
+        while not self._stopped.is_set():
+            started_at = time.monotonic()
+            self._process = subprocess.Popen(self.command)
+            runs += 1
+            if self.pid_file is not None:
+                _write_atomic(self.pid_file, str(self._process.pid))
+            return_code = self._process.wait()
+            if self._stopped.is_set():
+                break
+
+            if time.monotonic() - started_at >= STABLE_RUN_SECONDS:
+                retry = 0
+            if retry >= self.retry_policy.max_retries:
+                _logger.error(f"Collector failed {retry + 1} times, giving up")
+                break
+
+            delay = self.retry_policy.backoff(retry)
+            retry += 1
+            _logger.warning(
+                f"Collector exited with code {return_code}, restarting in {delay:.1f}s"
+            )
+            self._stopped.wait(delay)
+
+        if self.pid_file is not None:
+            self.pid_file.unlink(missing_ok=True)
+        return runs
+
+    def stop(self, *args: Any) -> None:
+        """Stops the command, can be used as a signal handler"""
+        self._stopped.set()
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+
+
+@dataclasses.dataclass
+class SubprocessCollectionBackend(AbstractCollectionBackend):
+    """Collects Tweets in a supervised local process per project
+
+    The image of the configuration is not used, twcollect is run with the
+    Python interpreter of twcompose. Collectors are recreated on updates,
+    the `handoff` update strategy is refused by the compose file model.
+    The state of each collector is kept in `state_dir`: its command
+    (`<project>.json`), the pid of its supervisor (`<project>.pid`),
+    of twcollect (`<project>.collector.pid`) and its logs (`<project>.log`).
+
+    Attributes:
+        state_dir (pathlib.Path): Defaults to `collectors` in the twcompose
+            cache directory
+        stop_timeout (float): Seconds to wait for a collector to stop
+            before killing it. Defaults to 10.
+    """
+
+    state_dir: pathlib.Path = dataclasses.field(default_factory=_default_state_dir)
+    stop_timeout: float = 10.0
+
+    def _state_file(self, project_name: str) -> pathlib.Path:
+        return self.state_dir / f"{project_name}.json"
+
+    def _pid_file(self, project_name: str) -> pathlib.Path:
+        return self.state_dir / f"{project_name}.pid"
+
+    def _get_command(
+        self, compose_config: TwitterComposeModel, credentials_file: pathlib.Path
+    ) -> List[str]:
+        return [sys.executable, "-m", "twcollect"] + get_collector_arguments(
+            compose_config,
+            credentials_file.absolute(),
+            pathlib.Path(compose_config.output.path).absolute(),
+        )
+
+    def _read_state(self, project_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._state_file(project_name).read_text())
+        except FileNotFoundError:
+            return None
+
+    def diff(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+    ) -> Dict[str, CollectorValueDifference[str]]:
+        state = self._read_state(project_name)
+        if state is None:
+            raise CollectorDoesNotExist()
+
+        current = " ".join(state["command"])
+        new = " ".join(self._get_command(compose_config, credentials_file))
+        if current == new:
+            return {}
+        return {"command": CollectorValueDifference(current=current, new=new)}
+
+    def _start(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+    ) -> None:
+        """Starts the supervisor of the collector in a new session"""
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        state_file = self._state_file(project_name)
+        command = self._get_command(compose_config, credentials_file)
+        _write_atomic(state_file, json.dumps({"command": command}))
+
+        with (self.state_dir / f"{project_name}.log").open("ab") as log_file:
+            supervisor = subprocess.Popen(
+                [sys.executable, "-m", "twcompose.backends.process", str(state_file)],
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        _write_atomic(self._pid_file(project_name), str(supervisor.pid))
+
+    def update(
+        self,
+        project_name: str,
+        compose_config: TwitterComposeModel,
+        credentials_file: pathlib.Path,
+    ) -> None:
+        """Runs the collection in a supervised process"""
+        try:
+            needs_update = (
+                len(self.diff(project_name, compose_config, credentials_file)) > 0
+            )
+        except CollectorDoesNotExist:
+            needs_update = True
+
+        if self.is_running(project_name):
+            if not needs_update:
+                return
+            self.stop(project_name)
+
+        self._start(project_name, compose_config, credentials_file)
+
+    def stop(self, project_name: str) -> None:
+        pid = _read_pid(self._pid_file(project_name))
+        if pid is None or not _is_alive(pid):
+            return
+
+        os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.stop_timeout
+        while _is_alive(pid):
+            if time.monotonic() > deadline:
+                # Killing twcollect too, the supervisor leads its process group
+                try:
+                    os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                break
+            time.sleep(0.1)
+        self._pid_file(project_name).unlink(missing_ok=True)
+        (self.state_dir / f"{project_name}.collector.pid").unlink(missing_ok=True)
+
+    def is_running(self, project_name: str) -> bool:
+        pid = _read_pid(self._pid_file(project_name))
+        return pid is not None and _is_alive(pid)
+
+
+def main() -> None:
+    """Supervises the collector of a state file given as argument"""
+    logging.basicConfig(level=logging.INFO)
+    state_file = pathlib.Path(sys.argv[1])
+    state = json.loads(state_file.read_text())
+    supervisor = Supervisor(
+        command=state["command"],
+        pid_file=state_file.with_suffix(".collector.pid"),
+    )
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
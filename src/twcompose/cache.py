@@ -0,0 +1,16 @@
+"""Local directory used to cache data between twitter-compose runs"""
+import os
+import pathlib
+
+
+def get_cache_dir() -> pathlib.Path:
+    """The twcompose cache directory
+
+    Defined by `TWCOMPOSE_CACHE_DIR`, otherwise `$XDG_CACHE_HOME/twcompose`
+    which defaults to `~/.cache/twcompose`.
+    """
+    cache_dir = os.environ.get("TWCOMPOSE_CACHE_DIR")
+    if cache_dir:
+        return pathlib.Path(cache_dir)
+    xdg_cache = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(xdg_cache) / "twcompose"
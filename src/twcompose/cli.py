@@ -1,4 +1,5 @@
 import argparse
+import importlib
 import pathlib
 from typing import Any, Callable, Optional
 
@@ -9,33 +10,58 @@ from twcollect.utils import (
     valid_file_type,
 )
 
-from twcompose.commands.config import config_command
-from twcompose.commands.status import status_command
-from twcompose.commands.stop import stop_command
-from twcompose.commands.update import update_command
-from twcompose.commands.volume import volume_command
-from twcompose.compose import parse_compose_file
+from twcompose import profiling
+
+
+def import_command(command_path: str) -> Callable[..., Any]:
+    """Imports a command function from its `module:function` path"""
+    module_name, function_name = command_path.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
 
 
 def add_subparser(
     subparsers: "argparse._SubParsersAction[argparse.ArgumentParser]",
     name: str,
-    command_fun: Callable[..., Any],
+    command_path: str,
     help: Optional[str] = None,
+    parse_compose: bool = True,
 ) -> argparse.ArgumentParser:
     """Add a subparser for a subcommand
 
+    The command function is imported only when the command is called,
+    so that each command imports only the modules it needs.
+
     Args:
         subparsers (_SubParsersAction):
         name (str): The name of the parser command
-        command_fun (Callable): The function to execute the command
+        command_path (str): The `module:function` path of the function
+            executing the command
         help (str | None): The help text for the command
+        parse_compose (bool): Whether the command uses the twitter-compose
+            file of the current project. Defaults to `True`.
     """
     command = subparsers.add_parser(name, help=help)
-    command.set_defaults(func=command_fun)
+    command.set_defaults(func=command_path, parse_compose=parse_compose)
     return command
 
 
+def add_drift_check_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options fetching the installed rules instead of the last applied"""
+    parser.add_argument(
+        "--drift-check",
+        action="store_true",
+        help="Fetch the rules installed on Twitter instead of comparing the "
+        "compose file to the rules applied by the last update",
+    )
+    parser.add_argument(
+        "--drift-check-interval",
+        default=3600,
+        type=float,
+        help="Seconds after which the installed rules are fetched again "
+        "(Defaults to 3600)",
+    )
+
+
 def cli() -> None:
     parser = argparse.ArgumentParser(
         "twitter-compose", description="Manage Twitter streams"
@@ -47,7 +73,7 @@ def cli() -> None:
         "--file",
         dest="tc_file",
         type=valid_file_type,
-        default="twitter-compose.yml",
+        default=pathlib.Path("twitter-compose.yml"),
         help="The file name of the twitter-compose configuration",
     )
     parser.add_argument(
@@ -58,39 +84,112 @@ def cli() -> None:
         help="Name of the current project",
     )
     add_credentials_file_argument(parser)
+    # Defaults are checked after parsing, projects of a fleet have their own files
+    parser.set_defaults(credentials=pathlib.Path("credentials.yml"))
     add_log_level_argument(parser)
+    parser.add_argument(
+        "--profile",
+        dest="profile_file",
+        type=pathlib.Path,
+        default=None,
+        help="Write the timings of the phases of the command to this trace file",
+    )
+    parser.add_argument(
+        "--profile-format",
+        default="json",
+        choices=profiling.TRACE_FORMATS,
+        help="Format of the --profile trace file: nested JSON spans or the "
+        "Chrome trace event format (Defaults to json)",
+    )
 
     # Commands
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Config
     add_subparser(
-        subparsers, "config", config_command, help="Show parsed configuration"
+        subparsers,
+        "config",
+        "twcompose.commands.config:config_command",
+        help="Show parsed configuration",
     )
 
     # Update
     update_parser = add_subparser(
-        subparsers, "up", update_command, help="Update Twitter streams"
+        subparsers,
+        "up",
+        "twcompose.commands.update:update_command",
+        help="Update Twitter streams",
     )
     update_parser.add_argument(
         "--check",
         action="store_true",
         help="Do not perform changes, prints to console only",
     )
+    add_drift_check_arguments(update_parser)
+    update_parser.add_argument(
+        "--plan",
+        dest="plan_file",
+        default=None,
+        type=pathlib.Path,
+        help="Write the changes to this JSON file instead of performing them, "
+        "to run them later with apply",
+    )
+
+    # Apply
+    apply_parser = add_subparser(
+        subparsers,
+        "apply",
+        "twcompose.commands.apply:apply_command",
+        help="Perform the changes of a plan written by up --plan",
+        parse_compose=False,
+    )
+    apply_parser.add_argument(
+        "plan_file", type=pathlib.Path, help="The plan written by up --plan"
+    )
 
     # Status
     add_subparser(
-        subparsers, "status", status_command, help="Status of defined streams"
+        subparsers,
+        "status",
+        "twcompose.commands.status:status_command",
+        help="Status of defined streams",
     )
 
     # Stop
-    add_subparser(subparsers, "stop", stop_command, help="Stop Twitter streams")
+    add_subparser(
+        subparsers,
+        "stop",
+        "twcompose.commands.stop:stop_command",
+        help="Stop Twitter streams",
+    )
+
+    # Watch
+    watch_parser = add_subparser(
+        subparsers,
+        "watch",
+        "twcompose.commands.watch:watch_command",
+        help="Update Twitter streams each time the twitter-compose file changes",
+    )
+    watch_parser.add_argument(
+        "--debounce",
+        default=0.2,
+        type=float,
+        help="Changes less than this number of seconds apart are applied "
+        "at once (Defaults to 0.2)",
+    )
+    watch_parser.add_argument(
+        "--poll-interval",
+        default=0.5,
+        type=float,
+        help="Seconds between two checks of the file when inotify is not "
+        "available (Defaults to 0.5)",
+    )
 
     # Volume estimation
     volume_parser = add_subparser(
         subparsers,
         "volume",
-        volume_command,
+        "twcompose.commands.volume:volume_command",
         help="Estimation of the monthly volume of streams",
     )
     volume_parser.add_argument(
@@ -99,6 +198,56 @@ def cli() -> None:
         type=int,
         help="Returns only rule with a volume larger that this minimum",
     )
+    volume_parser.add_argument(
+        "--concurrency",
+        default=4,
+        type=int,
+        help="Number of rules estimated concurrently (Defaults to 4)",
+    )
+    volume_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore tweet counts cached by previous runs",
+    )
+    volume_parser.add_argument(
+        "--projection",
+        default="average",
+        choices=("average", "trend"),
+        help="Monthly projection from the average daily count of the last week "
+        "or from the trend of the daily counts collected by previous runs",
+    )
+    volume_parser.add_argument(
+        "--grouped",
+        action="store_true",
+        help="Count rules in OR-combined groups, splitting only the groups "
+        "above --min (requires --min)",
+    )
+    volume_parser.add_argument(
+        "--max-query-length",
+        default=512,
+        type=int,
+        help="Maximum length of the queries combining rules with --grouped "
+        "(Defaults to 512)",
+    )
+    volume_parser.add_argument(
+        "--peak",
+        action="store_true",
+        help="Report the p50, p95 and max tweet rates per rule and stream group "
+        "and the projected output size per hour",
+    )
+    volume_parser.add_argument(
+        "--granularity",
+        default="hour",
+        choices=("hour", "minute"),
+        help="Granularity of the tweet counts used by --peak (Defaults to hour)",
+    )
+    volume_parser.add_argument(
+        "--tweet-size",
+        default=1024,
+        type=int,
+        help="Average size in bytes of a tweet in the output files, "
+        "used by --peak (Defaults to 1024)",
+    )
     volume_parser.add_argument(
         "volume_rules",
         nargs="*",
@@ -106,15 +255,85 @@ def cli() -> None:
         help="Test the given rules instead of the ones from the twitter-compose file",
     )
 
+    # Fleet
+    fleet_parser = subparsers.add_parser(
+        "fleet", help="Run commands on many projects at once"
+    )
+    fleet_subparsers = fleet_parser.add_subparsers(dest="fleet_command", required=True)
+    fleet_update_parser = add_subparser(
+        fleet_subparsers,
+        "up",
+        "twcompose.commands.fleet:fleet_update_command",
+        help="Update the Twitter streams of many projects",
+        parse_compose=False,
+    )
+    fleet_update_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Do not perform changes, prints to console only",
+    )
+    add_drift_check_arguments(fleet_update_parser)
+    fleet_status_parser = add_subparser(
+        fleet_subparsers,
+        "status",
+        "twcompose.commands.fleet:fleet_status_command",
+        help="Status of the streams of many projects",
+        parse_compose=False,
+    )
+    for fleet_command_parser in (fleet_update_parser, fleet_status_parser):
+        fleet_command_parser.add_argument(
+            "--workers",
+            default=4,
+            type=int,
+            help="Number of projects processed concurrently (Defaults to 4)",
+        )
+        fleet_command_parser.add_argument(
+            "fleet_paths",
+            nargs="+",
+            type=pathlib.Path,
+            help="Compose files, project folders or folders of projects. A "
+            "credentials file next to a compose file overrides --credentials-file",
+        )
+
     # Remove
     # add_subparser(subparsers, "rm", rm_command, help="Remove Twitter streams")
 
     # Getting arguments
     arguments: argparse.Namespace = parser.parse_args()
+    if arguments.command == "volume" and arguments.grouped and arguments.min is None:
+        volume_parser.error("--grouped requires --min")
     setup_logging(arguments.log_level)
 
-    # Getting compose file
-    compose = parse_compose_file(arguments.tc_file)
+    if arguments.profile_file is None:
+        return _run_command(parser, arguments)
+
+    profiler = profiling.enable()
+    try:
+        command = " ".join(
+            c for c in (arguments.command, arguments.__dict__.get("fleet_command")) if c
+        )
+        with profiling.span(f"twitter-compose {command}"):
+            _run_command(parser, arguments)
+    finally:
+        profiling.disable()
+        profiler.write(arguments.profile_file, arguments.profile_format)
+
+
+def _run_command(parser: argparse.ArgumentParser, arguments: argparse.Namespace):
+    compose = None
+    if arguments.parse_compose:
+        # Default files are not checked by argparse
+        for file_path in (arguments.tc_file, arguments.credentials):
+            try:
+                valid_file_type(str(file_path))
+            except argparse.ArgumentTypeError as e:
+                parser.error(f"{file_path}: {e}")
+
+        with profiling.span("parse compose file"):
+            # Getting compose file, imported here to keep --help fast
+            from twcompose.compose import parse_compose_file
+
+            compose = parse_compose_file(arguments.tc_file)
 
     # Calling the command function
     command_arguments = arguments.__dict__.copy()
@@ -124,6 +343,16 @@ def cli() -> None:
     del command_arguments["func"]
     del command_arguments["command"]
     del command_arguments["log_level"]
-    arguments.func(
+    del command_arguments["parse_compose"]
+    del command_arguments["profile_file"]
+    del command_arguments["profile_format"]
+    if arguments.command == "watch":
+        command_arguments["compose_file"] = arguments.tc_file
+    if "fleet_command" in command_arguments:
+        del command_arguments["fleet_command"]
+        command_arguments["compose_file_name"] = arguments.tc_file.name
+    with profiling.span("import command"):
+        command_fun = import_command(arguments.func)
+    command_fun(
         arguments.project_name, compose, arguments.credentials, **command_arguments
     )
@@ -0,0 +1,23 @@
+import pathlib
+from typing import Optional
+
+from twcompose.backends import get_collections_backend
+from twcompose.commands.update import apply_plans, load_plans
+from twcompose.compose import TwitterComposeModel
+from twcompose.profiling import span
+
+
+def apply_command(
+    project_name: str,
+    compose_config: Optional[TwitterComposeModel],
+    credentials_file: pathlib.Path,
+    plan_file: pathlib.Path,
+):
+    """Applies the plan written by `up --plan`"""
+    plans = load_plans(plan_file)
+    # The compose file and the credentials are the ones of the plan,
+    # the images are the ones pinned by the plan and are not pulled again
+    with span("backend connection"):
+        backend = get_collections_backend(plans[0].compose_config)
+
+    apply_plans(plans, backend)
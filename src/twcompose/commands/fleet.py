@@ -0,0 +1,361 @@
+"""Commands applied to many twitter-compose projects at once"""
+import dataclasses
+import functools
+import pathlib
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Mapping, Optional, Set, Union
+
+from twcollect.config import parse_credentials_file
+
+from twcompose.applied import DEFAULT_DRIFT_CHECK_INTERVAL
+from twcompose.backends import get_collections_backend
+from twcompose.backends.abstract import AbstractCollectionBackend
+from twcompose.commands.status import get_project_status
+from twcompose.commands.update import update_project
+from twcompose.compose import TwitterComposeModel, parse_compose_file
+from twcompose.profiling import span
+from twcompose.sharding import get_collectors
+
+DEFAULT_FLEET_WORKERS = 4
+
+PrintFunc = Callable[[str], None]
+
+
+@dataclasses.dataclass
+class FleetProject:
+    """A twitter-compose project of the fleet
+
+    Attributes:
+        project_name (str): The name of the folder of the compose file
+        compose_file (pathlib.Path): The twitter-compose file
+        credentials_file (pathlib.Path): The credentials file next to the
+            compose file if it exists, the one given to the CLI otherwise
+    """
+
+    project_name: str
+    compose_file: pathlib.Path
+    credentials_file: pathlib.Path
+
+    @classmethod
+    def from_compose_file(
+        cls, compose_file: pathlib.Path, credentials_file: pathlib.Path
+    ) -> "FleetProject":
+        project_folder = compose_file.absolute().parent
+        project_credentials = project_folder / credentials_file.name
+        return cls(
+            project_name=project_folder.name,
+            compose_file=compose_file,
+            credentials_file=(
+                project_credentials
+                if project_credentials.is_file()
+                else credentials_file
+            ),
+        )
+
+    def parse_compose_file(self) -> TwitterComposeModel:
+        """Parses the compose file with paths relative to its folder"""
+        compose_config = parse_compose_file(self.compose_file)
+        project_folder = self.compose_file.absolute().parent
+        output_path = project_folder / compose_config.output.path
+        return compose_config.copy(
+            update={
+                "output": compose_config.output.copy(update={"path": str(output_path)}),
+                "shards": [
+                    shard.copy(
+                        update={"credentials": str(project_folder / shard.credentials)}
+                    )
+                    for shard in compose_config.shards
+                ],
+            }
+        )
+
+
+FleetCommand = Callable[
+    [FleetProject, TwitterComposeModel, AbstractCollectionBackend, PrintFunc], None
+]
+
+
+@dataclasses.dataclass
+class FleetProjectReport:
+    """Output of a command on a project, `error` is set if it failed"""
+
+    project_name: str
+    messages: List[str] = dataclasses.field(default_factory=list)
+    error: Optional[str] = None
+
+
+def find_compose_files(paths: List[pathlib.Path], file_name: str) -> List[pathlib.Path]:
+    """Compose files given directly or found in the given folders
+
+    A folder can be a project, containing `file_name`, or contain
+    projects in its sub-folders. A compose file found several times is
+    only returned once.
+    """
+    compose_files: Dict[pathlib.Path, pathlib.Path] = {}
+    for path in paths:
+        if path.is_dir():
+            found = sorted(path.glob(file_name)) + sorted(path.glob(f"*/{file_name}"))
+        else:
+            found = [path]
+        for compose_file in found:
+            compose_files.setdefault(compose_file.resolve(), compose_file)
+    return list(compose_files.values())
+
+
+def find_fleet_projects(
+    paths: List[pathlib.Path], file_name: str, credentials_file: pathlib.Path
+) -> List[FleetProject]:
+    """Projects of the compose files found in the given paths
+
+    Raises:
+        ValueError: If two projects have the same name, their collectors
+            would be the same
+    """
+    projects: Dict[str, FleetProject] = {}
+    for compose_file in find_compose_files(paths, file_name):
+        project = FleetProject.from_compose_file(compose_file, credentials_file)
+        other = projects.setdefault(project.project_name, project)
+        if other is not project:
+            raise ValueError(
+                f"The projects of {other.compose_file} and {compose_file} are "
+                f"both named {project.project_name}, rename one of their folders"
+            )
+    return list(projects.values())
+
+
+def _update_project(
+    project: FleetProject,
+    compose_config: TwitterComposeModel,
+    backend: AbstractCollectionBackend,
+    print_func: PrintFunc,
+    check: bool = False,
+    drift_check: bool = False,
+    drift_check_interval: float = DEFAULT_DRIFT_CHECK_INTERVAL,
+) -> None:
+    """Plans and applies the update of a project"""
+    update_project(
+        project.project_name,
+        compose_config,
+        project.credentials_file,
+        backend,
+        check=check,
+        print_func=print_func,
+        drift_check=drift_check,
+        drift_check_interval=drift_check_interval,
+    )
+
+
+def _project_status(
+    project: FleetProject,
+    compose_config: TwitterComposeModel,
+    backend: AbstractCollectionBackend,
+    print_func: PrintFunc,
+) -> None:
+    """Prints the status of the collectors of a project"""
+    for collector_name, credentials_file in get_collectors(
+        project.project_name, compose_config, project.credentials_file
+    ):
+        get_project_status(
+            collector_name, credentials_file, backend, print_func=print_func
+        )
+
+
+def print_fleet_reports(reports: List[FleetProjectReport]) -> None:
+    """Prints the output of every project followed by a summary
+
+    Raises:
+        SystemExit: With status 1, if the command failed for some projects
+    """
+    for report in reports:
+        status = "FAILED" if report.error else "OK"
+        print(f"=== {report.project_name} ({status})")
+        for message in report.messages:
+            print(message)
+        if report.error:
+            print(report.error)
+
+    failed = [r.project_name for r in reports if r.error]
+    print(f"{len(reports) - len(failed)} project(s) succeeded, {len(failed)} failed.")
+    if failed:
+        print(f"Command failed for projects: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+def _run_on_project(
+    command: FleetCommand,
+    project: FleetProject,
+    compose_config: Union[TwitterComposeModel, Exception],
+    backends: Mapping[str, AbstractCollectionBackend],
+) -> FleetProjectReport:
+    """Runs the command on a project, never raises"""
+    report = FleetProjectReport(project.project_name)
+    try:
+        if isinstance(compose_config, Exception):
+            raise compose_config
+        with span("project", project=project.project_name):
+            command(
+                project,
+                compose_config,
+                backends[compose_config.backend],
+                report.messages.append,
+            )
+    except Exception as e:
+        report.error = "".join(traceback.format_exception_only(type(e), e)).strip()
+    return report
+
+
+def _get_twitter_tokens(
+    project: FleetProject, compose_config: TwitterComposeModel
+) -> Set[str]:
+    """Tokens of the Twitter apps of the collectors of the project"""
+    tokens = set()
+    for _, credentials_file in get_collectors(
+        project.project_name, compose_config, project.credentials_file
+    ):
+        try:
+            credentials = parse_credentials_file(credentials_file)
+        except Exception:
+            # Reported when the project runs
+            continue
+        tokens.add(credentials.__root__["twitter_token"])
+    return tokens
+
+
+def refuse_shared_twitter_apps(
+    projects: List[FleetProject],
+    compose_configs: Dict[str, Union[TwitterComposeModel, Exception]],
+) -> None:
+    """Fails the projects using the Twitter app of another project
+
+    The rules of an app are the rules of a single project, each update would
+    delete the rules of the other projects.
+    """
+    projects_by_token: Dict[str, List[str]] = {}
+    for project in projects:
+        compose_config = compose_configs[project.project_name]
+        if isinstance(compose_config, Exception):
+            continue
+        for token in _get_twitter_tokens(project, compose_config):
+            projects_by_token.setdefault(token, []).append(project.project_name)
+
+    for project_names in projects_by_token.values():
+        if len(project_names) < 2:
+            continue
+        for name in project_names:
+            others = ", ".join(n for n in project_names if n != name)
+            compose_configs[name] = ValueError(
+                f"The Twitter app of {name} is used by {others}, "
+                "each project needs its own credentials file"
+            )
+
+
+def _run_on_fleet(
+    command: FleetCommand,
+    credentials_file: pathlib.Path,
+    fleet_paths: List[pathlib.Path],
+    compose_file_name: str,
+    workers: int,
+    prepare: bool = False,
+    exclusive_apps: bool = False,
+    check: bool = False,
+) -> None:
+    """Runs the command on every project with `workers` threads
+
+    The collectors of all the projects are fetched from their backend at once.
+    With `prepare`, the backends prepare all the collectors beforehand,
+    pulling their images concurrently, or only resolving them with `check`.
+    With `exclusive_apps`, the projects sharing a Twitter app fail without
+    running the command.
+    """
+    try:
+        projects = find_fleet_projects(fleet_paths, compose_file_name, credentials_file)
+    except ValueError as e:
+        # Not running the command on any project
+        raise SystemExit(str(e))
+    compose_configs: Dict[str, Union[TwitterComposeModel, Exception]] = {}
+    for project in projects:
+        try:
+            compose_configs[project.project_name] = project.parse_compose_file()
+        except Exception as e:
+            # Reported with the output of the project
+            compose_configs[project.project_name] = e
+    if exclusive_apps:
+        refuse_shared_twitter_apps(projects, compose_configs)
+
+    # Creating each backend used by the projects once
+    backends: Dict[str, AbstractCollectionBackend] = {}
+    for project in projects:
+        compose_config = compose_configs[project.project_name]
+        if isinstance(compose_config, Exception):
+            continue
+        if compose_config.backend not in backends:
+            backends[compose_config.backend] = get_collections_backend(compose_config)
+
+    for backend_name, backend in backends.items():
+        backend_configs = {
+            name: c
+            for name, c in compose_configs.items()
+            if isinstance(c, TwitterComposeModel) and c.backend == backend_name
+        }
+        with span("prefetch", backend=backend_name):
+            backend.prefetch(list(backend_configs))
+        if prepare:
+            with span("prepare", backend=backend_name):
+                messages = backend.prepare(backend_configs.values(), check=check)
+            for message in messages:
+                print(message)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        reports = list(
+            executor.map(
+                lambda p: _run_on_project(
+                    command, p, compose_configs[p.project_name], backends
+                ),
+                projects,
+            )
+        )
+    print_fleet_reports(reports)
+
+
+def fleet_update_command(
+    project_name: str,
+    compose_config: Optional[TwitterComposeModel],
+    credentials_file: pathlib.Path,
+    fleet_paths: List[pathlib.Path],
+    compose_file_name: str = "twitter-compose.yml",
+    check: bool = False,
+    workers: int = DEFAULT_FLEET_WORKERS,
+    drift_check: bool = False,
+    drift_check_interval: float = DEFAULT_DRIFT_CHECK_INTERVAL,
+):
+    """Updates many projects concurrently on a pool of `workers` threads"""
+    _run_on_fleet(
+        functools.partial(
+            _update_project,
+            check=check,
+            drift_check=drift_check,
+            drift_check_interval=drift_check_interval,
+        ),
+        credentials_file,
+        fleet_paths,
+        compose_file_name,
+        workers,
+        prepare=True,
+        exclusive_apps=True,
+        check=check,
+    )
+
+
+def fleet_status_command(
+    project_name: str,
+    compose_config: Optional[TwitterComposeModel],
+    credentials_file: pathlib.Path,
+    fleet_paths: List[pathlib.Path],
+    compose_file_name: str = "twitter-compose.yml",
+    workers: int = DEFAULT_FLEET_WORKERS,
+):
+    """Prints the status of many projects"""
+    _run_on_fleet(
+        _project_status, credentials_file, fleet_paths, compose_file_name, workers
+    )
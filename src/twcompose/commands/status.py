@@ -1,35 +1,62 @@
 import dataclasses
 import pathlib
-
-from twcollect.config import parse_credentials_file
+from typing import Callable
 
 from twcompose.backends import get_collections_backend
+from twcompose.backends.abstract import AbstractCollectionBackend
 from twcompose.compose import TwitterComposeModel
-from twcompose.rules import TwitterRuleAPI
-from twcompose.utils import print_object_as_yaml
+from twcompose.handlers.collector import CollectorStatusHandler
+from twcompose.handlers.graph import CommandHandlerGraph
+from twcompose.handlers.rules import GetTwitterRulesHandler
+from twcompose.handlers.state import CommandHandlerState
+from twcompose.profiling import span
+from twcompose.sharding import get_collectors
+from twcompose.utils import format_object_as_yaml, get_twitter_rule_api
 
 
-def status_command(
+def get_project_status(
     project_name: str,
-    compose_config: TwitterComposeModel,
     credentials_file: pathlib.Path,
-):
-    """Print the current status of the defined streams"""
-    backend = get_collections_backend()
-
-    # Getting installed rules
-    credentials = parse_credentials_file(credentials_file)
-    rules = TwitterRuleAPI(twitter_token=credentials.__root__["twitter_token"])
-    active_rules = rules.get()
-
-    # Getting status of collection
-    is_collection_running = backend.is_running(project_name)
+    backend: AbstractCollectionBackend,
+    print_func: Callable[[str], None] = print,
+) -> None:
+    """Prints the installed rules and whether the collection is running"""
+    state = CommandHandlerState(
+        project_name=project_name,
+        twitter_compose_file=pathlib.Path(),
+        credentials_file=credentials_file,
+        log_level="",
+        command_args={},
+    )
+    # Getting installed rules and status of collection concurrently
+    with span("fetch status", project=project_name):
+        CommandHandlerGraph().add(
+            "twitter rules",
+            GetTwitterRulesHandler(get_twitter_rule_api(credentials_file)),
+        ).add("collector status", CollectorStatusHandler(backend)).handle(state)
+    assert state.twitter_rules is not None
 
     # Printing results
-    print_object_as_yaml(
-        {"Active rules": [dataclasses.asdict(r) for r in active_rules]}
+    print_func(
+        format_object_as_yaml(
+            {"Active rules": [dataclasses.asdict(r) for r in state.twitter_rules]}
+        )
     )
-    if is_collection_running:
-        print(f"Tweets collection is running for {project_name}.")
+    if state.is_collector_running:
+        print_func(f"Tweets collection is running for {project_name}.")
     else:
-        print(f"Tweets collection is stopped for {project_name}.")
+        print_func(f"Tweets collection is stopped for {project_name}.")
+
+
+def status_command(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+):
+    """Print the current status of the defined streams"""
+    with span("backend connection"):
+        backend = get_collections_backend(compose_config)
+    for collector_name, collector_credentials in get_collectors(
+        project_name, compose_config, credentials_file
+    ):
+        get_project_status(collector_name, collector_credentials, backend)
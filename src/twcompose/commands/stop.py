@@ -2,6 +2,8 @@ import pathlib
 
 from twcompose.backends import get_collections_backend
 from twcompose.compose import TwitterComposeModel
+from twcompose.profiling import span
+from twcompose.sharding import get_collectors
 from twcompose.utils import ensure_backend_stopped
 
 
@@ -10,5 +12,8 @@ def stop_command(
     compose_config: TwitterComposeModel,
     credentials: pathlib.Path,
 ):
-    backend = get_collections_backend()
-    ensure_backend_stopped(backend, project_name)
+    with span("backend connection"):
+        backend = get_collections_backend(compose_config)
+    for collector_name, _ in get_collectors(project_name, compose_config, credentials):
+        with span("collector stop", project=collector_name):
+            ensure_backend_stopped(backend, collector_name)
@@ -1,63 +1,231 @@
 import dataclasses
+import json
 import pathlib
-from typing import Optional
-
-from twcollect.config import parse_credentials_file
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
 
+from twcompose.applied import (
+    DEFAULT_DRIFT_CHECK_INTERVAL,
+    AppliedRules,
+    AppliedRulesStore,
+)
 from twcompose.backends import get_collections_backend
-from twcompose.backends.abstract import AbstractCollectionBackend, CollectorDoesNotExist
+from twcompose.backends.abstract import (
+    AbstractCollectionBackend,
+    CollectorDoesNotExist,
+    CollectorValueDifference,
+)
 from twcompose.compose import TwitterComposeModel
+from twcompose.handlers.collector import CollectorStateHandler
+from twcompose.handlers.graph import CommandHandlerGraph
+from twcompose.handlers.rules import GetTwitterRulesHandler
+from twcompose.handlers.state import CommandHandlerState
+from twcompose.profiling import span
 from twcompose.rules import (
+    TwitterRule,
     TwitterRuleAPI,
     TwitterRulesDiff,
     compute_rule_changes,
     dict_remove_none_fields,
+    format_rule_errors,
 )
+from twcompose.sharding import ShardsStore, get_collectors, plan_shards
 from twcompose.utils import (
+    ensure_backend_stopped,
+    format_object_as_yaml,
     get_rules_from_compose_config,
-    print_object_as_yaml,
+    get_twitter_rule_api,
     update_backend,
 )
 
+PrintFunc = Callable[[str], None]
+
+PLAN_FILE_VERSION = 1
+
+
+@dataclasses.dataclass
+class UpdatePlan:
+    """Changes to apply to bring a project up to date
+
+    Attributes:
+        project_name (str): The name of the twitter-compose project
+        compose_config (TwitterComposeModel): The configuration to apply
+        credentials_file (pathlib.Path): The credentials of the project
+        rules_changes (TwitterRulesDiff | None): Changes to the Twitter rules,
+            `None` if the rules are up to date
+        collector_changed (bool): Whether the collector needs to be
+            created, started or updated
+        installed_rules (set[TwitterRule]): The rules installed on Twitter,
+            fetched or from the last applied update
+        collector_differences (dict[str, CollectorValueDifference] | None):
+            Changes of the options of the collector, `None` if it does
+            not exist
+        is_collector_running (bool): Whether the collector is running
+        image (str | None): The exact image of the collector, `None` if
+            the backend does not run images
+    """
+
+    project_name: str
+    compose_config: TwitterComposeModel
+    credentials_file: pathlib.Path
+    rules_changes: Optional[TwitterRulesDiff]
+    collector_changed: bool
+    installed_rules: Set[TwitterRule] = dataclasses.field(default_factory=set)
+    collector_differences: Optional[Dict[str, CollectorValueDifference]] = None
+    is_collector_running: bool = False
+    image: Optional[str] = None
+
+    def is_empty(self) -> bool:
+        return self.rules_changes is None and not self.collector_changed
+
+    def installed_rules_after(self, created: List[TwitterRule]) -> Set[TwitterRule]:
+        """The installed rules once the changes are applied"""
+        if self.rules_changes is None:
+            return self.installed_rules
+        deleted = set(self.rules_changes.delete)
+        return {r for r in self.installed_rules if r not in deleted} | set(created)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "project_name": self.project_name,
+            "compose_config": json.loads(self.compose_config.json()),
+            "credentials_file": str(self.credentials_file.absolute()),
+            "rules_changes": (
+                None
+                if self.rules_changes is None
+                else dataclasses.asdict(self.rules_changes)
+            ),
+            "collector_changed": self.collector_changed,
+            "installed_rules": [
+                dataclasses.asdict(r)
+                for r in sorted(self.installed_rules, key=lambda r: r.id or "")
+            ],
+            "collector_differences": (
+                None
+                if self.collector_differences is None
+                else {
+                    k: dataclasses.asdict(v)
+                    for k, v in self.collector_differences.items()
+                }
+            ),
+            "is_collector_running": self.is_collector_running,
+            "image": self.image,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UpdatePlan":
+        rules_changes = data["rules_changes"]
+        differences = data["collector_differences"]
+        return cls(
+            project_name=data["project_name"],
+            compose_config=TwitterComposeModel.parse_obj(data["compose_config"]),
+            credentials_file=pathlib.Path(data["credentials_file"]),
+            rules_changes=(
+                None
+                if rules_changes is None
+                else TwitterRulesDiff(
+                    **{
+                        k: [TwitterRule(**r) for r in rules]
+                        for k, rules in rules_changes.items()
+                    }
+                )
+            ),
+            collector_changed=data["collector_changed"],
+            installed_rules={TwitterRule(**r) for r in data["installed_rules"]},
+            collector_differences=(
+                None
+                if differences is None
+                else {k: CollectorValueDifference(**v) for k, v in differences.items()}
+            ),
+            is_collector_running=data["is_collector_running"],
+            image=data["image"],
+        )
+
+
+def save_plans(path: pathlib.Path, plans: List[UpdatePlan]) -> None:
+    """Writes the plans of a project or of its shards to a JSON file"""
+    content = {"version": PLAN_FILE_VERSION, "plans": [p.to_dict() for p in plans]}
+    # The options of the collector are not all JSON types
+    path.write_text(json.dumps(content, indent=2, default=str))
 
-def _verify_rule_changes(
-    twitter_api: TwitterRuleAPI, compose_config: TwitterComposeModel
+
+def load_plans(path: pathlib.Path) -> List[UpdatePlan]:
+    """Reads the plans written by `save_plans`
+
+    Raises:
+        ValueError: If the file is not a plan file of this version or has no plans
+    """
+    content = json.loads(path.read_text())
+    if not isinstance(content, dict) or content.get("version") != PLAN_FILE_VERSION:
+        raise ValueError(f"{path} is not a plan file of version {PLAN_FILE_VERSION}")
+    if not content.get("plans"):
+        raise ValueError(f"{path} has no plans")
+    return [UpdatePlan.from_dict(p) for p in content["plans"]]
+
+
+def verify_rule_changes(
+    twitter_rules: Set[TwitterRule],
+    compose_config: TwitterComposeModel,
+    print_func: PrintFunc = print,
+    applied_rules: Optional[AppliedRules] = None,
 ) -> Optional[TwitterRulesDiff]:
-    # Getting twitter and compose rules
-    twitter_rules = twitter_api.get()
-    compose_rules = get_rules_from_compose_config(compose_config)
-    # Computing the changes between twitter and compose rules
-    changes = compute_rule_changes(twitter_rules, compose_rules)
+    """Computes and prints the changes of the rules, `None` if up to date
+
+    With the `applied_rules` of the last update, only the rules of the
+    stream groups changed since are compared.
+    """
+    with span("rules diff"):
+        # Getting compose rules
+        compose_rules = get_rules_from_compose_config(compose_config)
+        if applied_rules is not None:
+            # Comparing only the rules of the groups changed since
+            groups = applied_rules.changed_groups(compose_config)
+            scope = {
+                TwitterRule.from_rule_model(r).identity()
+                for name in groups
+                for r in compose_config.streams.get(name, [])
+            } | {
+                r.identity()
+                for name in groups
+                if name in applied_rules.groups
+                for r in applied_rules.groups[name].rules
+            }
+            twitter_rules = {r for r in twitter_rules if r.identity() in scope}
+            compose_rules = {r for r in compose_rules if r.identity() in scope}
+        # Computing the changes between twitter and compose rules
+        changes = compute_rule_changes(twitter_rules, compose_rules)
 
     # If changes is empty returns None
     if changes.is_empty():
         return None
 
-    # Stream rules update
+    print_rule_changes(changes, print_func)
+    return changes
+
+
+def print_rule_changes(changes: TwitterRulesDiff, print_func: PrintFunc = print):
+    """Prints the rules to add and to delete"""
     rules_update = dict_remove_none_fields(dataclasses.asdict(changes))
-    print_object_as_yaml(
-        {"> Stream rules will be updated as follows": rules_update},
-        end="",
+    del rules_update["unchanged"]
+    print_func(
+        format_object_as_yaml(
+            {"> Stream rules will be updated as follows": rules_update}
+        )
     )
-    return changes
 
 
 def _verify_collector_changes(
-    backend: AbstractCollectionBackend,
-    project_name: str,
-    compose_config: TwitterComposeModel,
-    credentials_file: pathlib.Path,
+    state: CommandHandlerState, print_func: PrintFunc = print
 ) -> bool:
-    try:
-        differences = backend.diff(project_name, compose_config, credentials_file)
-    except CollectorDoesNotExist:
-        print_object_as_yaml(["Stream collector should be created"])
+    differences = state.collector_differences
+    if differences is None:
+        print_func(format_object_as_yaml(["Stream collector should be created"]))
         # There are changes
         return True
 
     # Collecting changes on collector status and options
     diff_object: list = []
-    if not backend.is_running(project_name):
+    if not state.is_collector_running:
         diff_object.append("Stream collection needs to be started")
     if len(differences) > 0:
         diff_object.append(
@@ -71,58 +239,478 @@ def _verify_collector_changes(
     if len(diff_object) == 0:
         return False
 
-    print_object_as_yaml(diff_object)
+    print_func(format_object_as_yaml(diff_object))
     return True
 
 
-def update_command(
+def plan_update(
     project_name: str,
     compose_config: TwitterComposeModel,
     credentials_file: pathlib.Path,
-    check: bool = False,
-):
-    # Getting the connection to backend
-    backend = get_collections_backend()
+    backend: AbstractCollectionBackend,
+    twitter_api: TwitterRuleAPI,
+    print_func: PrintFunc = print,
+    applied_rules: Optional[AppliedRules] = None,
+) -> UpdatePlan:
+    """Computes and prints the changes of the rules and of the collector
 
-    # Getting token and connection to Twitter
-    credentials = parse_credentials_file(credentials_file)
-    twitter_token = credentials.__root__["twitter_token"]
-    twitter_api = TwitterRuleAPI(twitter_token)
+    The rules are compared to the `applied_rules` of the last update if given,
+    otherwise they are fetched from Twitter.
+    """
+    state = CommandHandlerState(
+        project_name=project_name,
+        twitter_compose_file=pathlib.Path(),
+        credentials_file=credentials_file,
+        log_level="",
+        command_args={},
+        twitter_compose_config=compose_config,
+    )
+    # Getting Twitter rules and container state concurrently
+    graph = CommandHandlerGraph()
+    if applied_rules is None:
+        graph.add("twitter rules", GetTwitterRulesHandler(twitter_api))
+    else:
+        state.twitter_rules = applied_rules.rules()
+    graph.add("collector state", CollectorStateHandler(backend))
+    with span("fetch current state", project=project_name):
+        graph.handle(state)
+    assert state.twitter_rules is not None
 
     # Printing and getting changes
-    rules_changes = _verify_rule_changes(twitter_api, compose_config)
-
-    # Getting container and changes
-    collector_changed = _verify_collector_changes(
-        backend,
-        project_name,
-        compose_config,
-        credentials_file,
+    return UpdatePlan(
+        project_name=project_name,
+        compose_config=compose_config,
+        credentials_file=credentials_file,
+        rules_changes=verify_rule_changes(
+            state.twitter_rules, compose_config, print_func, applied_rules
+        ),
+        collector_changed=_verify_collector_changes(state, print_func),
+        installed_rules=state.twitter_rules,
+        collector_differences=state.collector_differences,
+        is_collector_running=bool(state.is_collector_running),
     )
 
-    if rules_changes is None and not collector_changed:
+
+def apply_update(
+    plan: UpdatePlan,
+    backend: AbstractCollectionBackend,
+    twitter_api: TwitterRuleAPI,
+    check: bool = False,
+    print_func: PrintFunc = print,
+) -> List[TwitterRule]:
+    """Pushes the rules changes and updates the collector
+
+    Returns:
+        list[TwitterRule]: The rules created on Twitter, with their ids
+
+    Raises:
+        ValueError: If Twitter did not accept all rules
+    """
+    if plan.is_empty():
         # If there is nothing to do
-        print("Nothing to do.")
-        return
+        print_func("Nothing to do.")
+        return []
 
     if check:
-        if rules_changes is not None:
+        if plan.rules_changes is not None:
             # Make sure rules are valid
-            errors = twitter_api.post(rules_changes, dry_run=True)
+            with span("rules dry run"):
+                errors = twitter_api.post(
+                    plan.rules_changes,
+                    dry_run=True,
+                    installed_count=len(plan.installed_rules),
+                )
             if errors:
-                raise ValueError(f"Couldn't create all rules: {errors}")
+                raise ValueError(
+                    f"Couldn't create all rules:\n{format_rule_errors(errors)}"
+                )
 
         # Do not perform changes and return
-        return
+        return []
 
-    if rules_changes is not None:
+    created: List[TwitterRule] = []
+    if plan.rules_changes is not None:
         # We need to push the changes to Twitter
-        print("Updating Twitter rules...")
-        errors = twitter_api.post(rules_changes)
+        print_func("Updating Twitter rules...")
+        with span("rules update"):
+            created, errors = twitter_api.post_and_get_created(
+                plan.rules_changes, installed_count=len(plan.installed_rules)
+            )
         if errors:
-            raise ValueError(f"Couldn't create all rules: {errors}")
-        print("Updating Twitter rules... Done.")
+            raise ValueError(
+                f"Couldn't create all rules:\n{format_rule_errors(errors)}"
+            )
+        print_func("Updating Twitter rules... Done.")
 
-    if collector_changed:
+    if plan.collector_changed:
         # Make sure the collection is started
-        update_backend(backend, project_name, compose_config, credentials_file)
+        with span("collector update"):
+            update_backend(
+                backend,
+                plan.project_name,
+                plan.compose_config,
+                plan.credentials_file,
+                print_func=print_func,
+            )
+    return created
+
+
+def _save_applied_rules(
+    store: AppliedRulesStore,
+    twitter_api: TwitterRuleAPI,
+    plan: UpdatePlan,
+    created: List[TwitterRule],
+    checked_at: float,
+) -> None:
+    store.save(
+        twitter_api,
+        AppliedRules.from_installed_rules(
+            plan.project_name,
+            plan.compose_config,
+            plan.installed_rules_after(created),
+            checked_at,
+        ),
+    )
+
+
+def update_project(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+    backend: AbstractCollectionBackend,
+    check: bool = False,
+    print_func: PrintFunc = print,
+    drift_check: bool = False,
+    drift_check_interval: float = DEFAULT_DRIFT_CHECK_INTERVAL,
+    plans: Optional[List[UpdatePlan]] = None,
+) -> None:
+    """Updates the rules and the collectors of a project or of its shards
+
+    The rules are compared to the ones applied by the last update. They are
+    fetched from Twitter when unknown, with `drift_check` or when they were
+    last fetched more than `drift_check_interval` seconds ago.
+
+    The plan of the project, or of each shard, is appended to `plans` if given.
+    The collectors of the shards removed since the last update are stopped
+    and the rules of their Twitter apps deleted.
+    """
+    _remove_stale_shards(
+        project_name,
+        compose_config,
+        credentials_file,
+        backend,
+        check=check,
+        print_func=print_func,
+        plans=plans,
+    )
+    if not compose_config.shards:
+        twitter_api = get_twitter_rule_api(credentials_file)
+        store = AppliedRulesStore()
+        last_applied = store.load(twitter_api, project_name)
+        applied_rules = last_applied
+        if applied_rules is not None and (
+            drift_check or applied_rules.needs_drift_check(drift_check_interval)
+        ):
+            applied_rules = None
+        checked_at = time.time() if applied_rules is None else applied_rules.checked_at
+
+        plan = plan_update(
+            project_name,
+            compose_config,
+            credentials_file,
+            backend,
+            twitter_api,
+            print_func=print_func,
+            applied_rules=applied_rules,
+        )
+        if (
+            applied_rules is None
+            and last_applied is not None
+            and plan.installed_rules != last_applied.rules()
+        ):
+            print_func("Twitter rules were changed since the last update.")
+
+        try:
+            created = apply_update(
+                plan, backend, twitter_api, check=check, print_func=print_func
+            )
+        except Exception:
+            if not check:
+                # The installed rules are unknown after a failed update
+                store.clear(twitter_api)
+            raise
+        if plan.rules_changes is None:
+            # Only saving rules that were fetched, to record their check time
+            save = applied_rules is None
+        else:
+            save = not check
+        if save:
+            _save_applied_rules(store, twitter_api, plan, created, checked_at)
+        if plans is not None:
+            # Applying the plan runs the image checked now
+            plan.image = backend.get_pinned_image(compose_config)
+            plans.append(plan)
+        return
+
+    for shard in plan_shards(
+        project_name, compose_config, drift_check, drift_check_interval
+    ):
+        print_func(f"> Shard {shard.project_name}")
+        if not shard.compose_config.streams:
+            # Twitter refuses the connection of a stream without rules
+            print_func("No stream groups assigned to this shard.")
+            plan = remove_collector(
+                shard.project_name,
+                shard.compose_config,
+                shard.credentials_file,
+                backend,
+                check=check,
+                print_func=print_func,
+            )
+            if plans is not None:
+                # Applying the plan stops the collector of the shard
+                plans.append(plan)
+            continue
+        update_project(
+            shard.project_name,
+            shard.compose_config,
+            shard.credentials_file,
+            backend,
+            check=check,
+            print_func=print_func,
+            drift_check=drift_check,
+            drift_check_interval=drift_check_interval,
+            plans=plans,
+        )
+
+
+def remove_collector(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+    backend: AbstractCollectionBackend,
+    check: bool = False,
+    print_func: PrintFunc = print,
+    stop: bool = True,
+) -> UpdatePlan:
+    """Stops a collector and deletes the rules installed on its Twitter app
+
+    Rules left on the app would still count against its cap, and be
+    matched again once the app streams. The collector is kept if not `stop`.
+
+    Returns:
+        UpdatePlan: The deletion of the installed rules
+
+    Raises:
+        ValueError: If Twitter did not delete all rules
+    """
+    if stop and not check:
+        ensure_backend_stopped(backend, project_name, print_func)
+    twitter_api = get_twitter_rule_api(credentials_file)
+    installed_rules = twitter_api.get()
+    plan = UpdatePlan(
+        project_name=project_name,
+        compose_config=compose_config,
+        credentials_file=credentials_file,
+        rules_changes=(
+            verify_rule_changes(installed_rules, compose_config, print_func)
+            if installed_rules
+            else None
+        ),
+        collector_changed=False,
+        installed_rules=installed_rules,
+    )
+    if plan.rules_changes is not None:
+        apply_update(plan, backend, twitter_api, check=check, print_func=print_func)
+        if not check:
+            AppliedRulesStore().clear(twitter_api)
+    return plan
+
+
+def _remove_stale_shards(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+    backend: AbstractCollectionBackend,
+    check: bool = False,
+    print_func: PrintFunc = print,
+    plans: Optional[List[UpdatePlan]] = None,
+) -> None:
+    """Removes the shards of the last update missing from the compose file
+
+    The rules of a shard whose credentials changed are deleted from its
+    previous Twitter app.
+    """
+    store = ShardsStore()
+    recorded = store.load(project_name)
+    collectors = (
+        [
+            (name, path.absolute())
+            for name, path in get_collectors(
+                project_name, compose_config, credentials_file
+            )
+        ]
+        if compose_config.shards
+        else []
+    )
+    names = {name for name, _ in collectors}
+    apps = {path for _, path in collectors} or {credentials_file.absolute()}
+    empty_config = compose_config.copy(update={"streams": {}, "shards": []})
+    for name, shard_credentials in recorded:
+        if (name, shard_credentials) in collectors:
+            continue
+        print_func(f"> Removed shard {name} ({shard_credentials})")
+        if shard_credentials in apps:
+            # The rules of the app are updated with the rest of the project
+            if not check and name not in names:
+                ensure_backend_stopped(backend, name, print_func)
+            continue
+        plan = remove_collector(
+            name,
+            empty_config,
+            shard_credentials,
+            backend,
+            check=check,
+            print_func=print_func,
+            # Otherwise the shard now runs with the credentials of another app
+            stop=name not in names,
+        )
+        if plans is not None:
+            plans.append(plan)
+    if not check and recorded != collectors:
+        store.save(project_name, collectors)
+
+
+def _check_plan_is_current(
+    plan: UpdatePlan,
+    backend: AbstractCollectionBackend,
+    twitter_api: TwitterRuleAPI,
+) -> None:
+    """Compares the installed rule ids and the collector to the ones of the plan
+
+    Only the rules are compared for a collector without stream groups,
+    which is stopped.
+
+    Raises:
+        ValueError: If the rules installed on Twitter or the collector
+            changed since the plan
+    """
+    with span("staleness check", project=plan.project_name):
+        installed_ids = {r.id for r in twitter_api.get()}
+        if not plan.compose_config.streams:
+            differences = plan.collector_differences
+            is_running = plan.is_collector_running
+        else:
+            try:
+                differences = backend.diff(
+                    plan.project_name, plan.compose_config, plan.credentials_file
+                )
+            except CollectorDoesNotExist:
+                differences = None
+            is_running = backend.is_running(plan.project_name)
+    if installed_ids != {r.id for r in plan.installed_rules}:
+        raise ValueError(
+            f"The Twitter rules of {plan.project_name} changed since the plan "
+            "was made, run up --plan again"
+        )
+    if (
+        differences != plan.collector_differences
+        or is_running != plan.is_collector_running
+    ):
+        raise ValueError(
+            f"The collector of {plan.project_name} changed since the plan "
+            "was made, run up --plan again"
+        )
+
+
+def apply_plans(
+    plans: List[UpdatePlan],
+    backend: AbstractCollectionBackend,
+    print_func: PrintFunc = print,
+) -> None:
+    """Applies the plans made by `up --plan` without planning again
+
+    The collectors run the images pinned by the plans, they are not pulled
+    again. All the plans are checked before any is applied.
+
+    Raises:
+        ValueError: If the rules installed on Twitter or the collectors
+            changed since the plans were made or if Twitter did not accept
+            all rules
+    """
+    twitter_apis = [get_twitter_rule_api(p.credentials_file) for p in plans]
+    for plan in plans:
+        if plan.image is not None:
+            backend.pin_image(plan.compose_config, plan.image)
+    checked_at = time.time()
+    for plan, twitter_api in zip(plans, twitter_apis):
+        _check_plan_is_current(plan, backend, twitter_api)
+
+    store = AppliedRulesStore()
+    # Collectors of shards that now run with the credentials of another app
+    kept = {p.project_name for p in plans if p.compose_config.streams}
+    for plan, twitter_api in zip(plans, twitter_apis):
+        if len(plans) > 1:
+            print_func(f"> Shard {plan.project_name}")
+        if not plan.compose_config.streams:
+            print_func("No stream groups assigned to this shard.")
+            if plan.project_name not in kept:
+                ensure_backend_stopped(backend, plan.project_name, print_func)
+        if plan.rules_changes is not None:
+            print_rule_changes(plan.rules_changes, print_func)
+        try:
+            created = apply_update(plan, backend, twitter_api, print_func=print_func)
+        except Exception:
+            # The installed rules are unknown after a failed update
+            store.clear(twitter_api)
+            raise
+        _save_applied_rules(store, twitter_api, plan, created, checked_at)
+
+
+def update_command(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+    check: bool = False,
+    drift_check: bool = False,
+    drift_check_interval: float = DEFAULT_DRIFT_CHECK_INTERVAL,
+    plan_file: Optional[pathlib.Path] = None,
+):
+    # Getting the connection to backend
+    with span("backend connection"):
+        backend = get_collections_backend(compose_config)
+
+    # Pulling the collector image before looking for changes,
+    # only resolving its digest when nothing is changed
+    with span("prepare"):
+        messages = backend.prepare(
+            [compose_config], check=check or plan_file is not None
+        )
+    for message in messages:
+        print(message)
+
+    if plan_file is None:
+        update_project(
+            project_name,
+            compose_config,
+            credentials_file,
+            backend,
+            check,
+            drift_check=drift_check,
+            drift_check_interval=drift_check_interval,
+        )
+        return
+
+    # Planning from the installed rules, checked again when applying the plan
+    plans: List[UpdatePlan] = []
+    update_project(
+        project_name,
+        compose_config,
+        credentials_file,
+        backend,
+        check=True,
+        drift_check=True,
+        plans=plans,
+    )
+    save_plans(plan_file, plans)
+    print(f"Plan written to {plan_file}, run twitter-compose apply {plan_file}")
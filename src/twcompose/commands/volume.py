@@ -1,11 +1,18 @@
 import pathlib
-from typing import Dict, cast
+from typing import cast
+
+import yaml
 
 from twcompose.compose import TwitterComposeModel
+from twcompose.handlers.graph import CommandHandlerGraph
 from twcompose.handlers.messages import PrintMessagesHandler, SaveMessageHandler
+from twcompose.handlers.peak import PeakRateCommandHandler
 from twcompose.handlers.state import CommandHandlerState
 from twcompose.handlers.twitter import SetTwitterClientHandler
-from twcompose.handlers.volume import VolumeEstimatorCommandHandler
+from twcompose.handlers.volume import (
+    GroupedVolumeEstimatorCommandHandler,
+    VolumeEstimatorCommandHandler,
+)
 
 
 def volume_command(
@@ -24,17 +31,41 @@ def volume_command(
         twitter_compose_config=compose_config,
     )
 
-    # Define and run handlers chain
-    handler = SetTwitterClientHandler().chain(
-        # Estimate the volume of rules
-        VolumeEstimatorCommandHandler(),
-        # Saves the volume as message
-        SaveMessageHandler(
-            state_to_message=lambda s: "\n".join(
-                f"{r}: {v}" for r, v in cast(Dict[str, int], s.volume_per_rule).items()
-            )
-        ),
-        # Print the messages
-        PrintMessagesHandler(),
+    if kwargs.get("peak"):
+        # Peak rates report
+        graph = CommandHandlerGraph()
+        graph.add("twitter client", SetTwitterClientHandler())
+        graph.add(
+            "peak rates",
+            PeakRateCommandHandler(tweet_size=kwargs["tweet_size"]),
+            depends_on=["twitter client"],
+        )
+        graph.add(
+            "report",
+            SaveMessageHandler(
+                state_to_message=lambda s: yaml.safe_dump(
+                    cast(dict, s.peak_rates), sort_keys=False
+                )
+            ),
+            depends_on=["peak rates"],
+        )
+        graph.add("print", PrintMessagesHandler(), depends_on=["report"])
+        graph.handle(state)
+        return
+
+    # Rules can be estimated in OR-combined groups when looking for
+    # the rules above a minimum volume
+    volume_handler = (
+        GroupedVolumeEstimatorCommandHandler(
+            print_func=print, max_query_length=kwargs["max_query_length"]
+        )
+        if kwargs.get("grouped")
+        else VolumeEstimatorCommandHandler(print_func=print)
     )
-    handler.handle(state)
+
+    # Define and run handlers graph
+    graph = CommandHandlerGraph()
+    graph.add("twitter client", SetTwitterClientHandler())
+    # Estimate the volume of rules and print them as they come
+    graph.add("volume", volume_handler, depends_on=["twitter client"])
+    graph.handle(state)
@@ -0,0 +1,200 @@
+"""Applies the changes of the compose file as soon as it is saved"""
+import dataclasses
+import pathlib
+import threading
+from typing import Optional, Set
+
+from twcompose.applied import AppliedRules, AppliedRulesStore
+from twcompose.backends import get_collections_backend
+from twcompose.backends.abstract import AbstractCollectionBackend
+from twcompose.commands.update import PrintFunc, update_project, verify_rule_changes
+from twcompose.compose import TwitterComposeModel, parse_compose_file
+from twcompose.filewatch import DEFAULT_POLL_INTERVAL, FileWatcher, get_file_watcher
+from twcompose.profiling import span
+from twcompose.rules import format_rule_errors
+from twcompose.utils import get_twitter_rule_api
+
+DEFAULT_DEBOUNCE = 0.2
+# Time between two checks of the stop event
+_STOP_CHECK_INTERVAL = 0.5
+
+
+def changed_stream_groups(
+    current: TwitterComposeModel, new: TwitterComposeModel
+) -> Set[str]:
+    """Names of the stream groups added, removed or modified"""
+    return {
+        name
+        for name in set(current.streams) | set(new.streams)
+        if current.streams.get(name) != new.streams.get(name)
+    }
+
+
+def only_streams_changed(
+    current: TwitterComposeModel, new: TwitterComposeModel
+) -> bool:
+    """Whether the configurations differ by their stream groups only"""
+    return current.copy(update={"streams": {}}) == new.copy(update={"streams": {}})
+
+
+@dataclasses.dataclass
+class WatchSession:
+    """Keeps a project up to date with its compose file
+
+    The first update is a full update. Then, when only stream groups change,
+    the rules of these groups are compared to the rules applied by the last
+    update and pushed without fetching the installed rules or inspecting
+    the collector. Other changes, of the collector or of the shards, run a
+    full update. The HTTP session and the backend connection are kept
+    between updates.
+
+    Attributes:
+        project_name (str): The name of the twitter-compose project
+        compose_file (pathlib.Path): The watched twitter-compose file
+        credentials_file (pathlib.Path): The credentials of the project
+        backend (AbstractCollectionBackend): The backend of the collector
+        print_func (Callable[[str], None], optional): Defaults to `print`
+    """
+
+    project_name: str
+    compose_file: pathlib.Path
+    credentials_file: pathlib.Path
+    backend: AbstractCollectionBackend
+    print_func: PrintFunc = print
+
+    def __post_init__(self):
+        self.twitter_api = get_twitter_rule_api(self.credentials_file)
+        self.store = AppliedRulesStore()
+        # Configuration applied by the last update
+        self.compose_config: Optional[TwitterComposeModel] = None
+        # Rules applied by the last update, `None` when they need to be fetched
+        self.applied_rules: Optional[AppliedRules] = None
+
+    def full_update(self, compose_config: TwitterComposeModel) -> None:
+        """Updates the rules and the collector as `up` does"""
+        self.applied_rules = None
+        # The collectors may have changed since the last update
+        self.backend.invalidate()
+        for message in self.backend.prepare([compose_config]):
+            self.print_func(message)
+        update_project(
+            self.project_name,
+            compose_config,
+            self.credentials_file,
+            self.backend,
+            print_func=self.print_func,
+        )
+        self.compose_config = compose_config
+        if not compose_config.shards:
+            self.applied_rules = self.store.load(self.twitter_api, self.project_name)
+
+    def update_groups(self, compose_config: TwitterComposeModel) -> None:
+        """Pushes the changes of the rules of the changed stream groups
+
+        Raises:
+            ValueError: If Twitter did not accept all rules
+        """
+        applied_rules = self.applied_rules
+        assert applied_rules is not None
+        installed_rules = applied_rules.rules()
+        changes = verify_rule_changes(
+            installed_rules, compose_config, self.print_func, applied_rules
+        )
+        if changes is None:
+            self.print_func("Nothing to do.")
+            self.compose_config = compose_config
+            return
+
+        self.print_func("Updating Twitter rules...")
+        # The installed rules are unknown if the update fails
+        self.applied_rules = None
+        self.store.clear(self.twitter_api)
+        created, errors = self.twitter_api.post_and_get_created(
+            changes, installed_count=len(installed_rules)
+        )
+        if errors:
+            raise ValueError(
+                f"Couldn't create all rules:\n{format_rule_errors(errors)}"
+            )
+        deleted = set(changes.delete)
+        self.applied_rules = AppliedRules.from_installed_rules(
+            self.project_name,
+            compose_config,
+            {r for r in installed_rules if r not in deleted} | set(created),
+            applied_rules.checked_at,
+        )
+        self.store.save(self.twitter_api, self.applied_rules)
+        self.compose_config = compose_config
+        self.print_func("Updating Twitter rules... Done.")
+
+    def apply(self) -> None:
+        """Applies the current content of the compose file"""
+        compose_config = parse_compose_file(self.compose_file)
+        if (
+            self.compose_config is None
+            or self.applied_rules is None
+            or compose_config.shards
+            or not only_streams_changed(self.compose_config, compose_config)
+        ):
+            self.full_update(compose_config)
+            return
+
+        groups = changed_stream_groups(self.compose_config, compose_config)
+        if not groups:
+            self.print_func("Nothing to do.")
+            return
+        self.print_func(f"> Stream groups changed: {', '.join(sorted(groups))}")
+        self.update_groups(compose_config)
+
+
+def watch(
+    session: WatchSession,
+    watcher: FileWatcher,
+    debounce: float = DEFAULT_DEBOUNCE,
+    stop_event: Optional[threading.Event] = None,
+) -> None:
+    """Applies the compose file after each change until `stop_event` is set
+
+    Changes less than `debounce` seconds apart are applied at once.
+    A failed update is printed and the next change is applied with a full
+    update.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        if not watcher.wait(timeout=_STOP_CHECK_INTERVAL):
+            continue
+        # Waiting for the end of a burst of edits
+        while watcher.wait(timeout=debounce):
+            pass
+
+        session.print_func(f"{session.compose_file} changed.")
+        try:
+            with span("watch update", project=session.project_name):
+                session.apply()
+        except Exception as e:
+            session.print_func(f"Update failed: {e}")
+
+
+def watch_command(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+    compose_file: pathlib.Path,
+    debounce: float = DEFAULT_DEBOUNCE,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+):
+    """Updates the project, then applies each change of the compose file"""
+    session = WatchSession(
+        project_name,
+        compose_file,
+        credentials_file,
+        get_collections_backend(compose_config),
+    )
+    # Watching before the first update to not miss the edits made meanwhile
+    with get_file_watcher(compose_file, poll_interval) as watcher:
+        session.full_update(compose_config)
+        print(f"Watching {compose_file} for changes...")
+        try:
+            watch(session, watcher, debounce)
+        except KeyboardInterrupt:
+            pass
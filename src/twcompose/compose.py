@@ -1,15 +1,31 @@
 """Parse the twitter-compose.yml file"""
+import hashlib
+import json
+import os
 import pathlib
+import tempfile
 import warnings
-from typing import Any, Dict, Iterable, List, Set, Tuple, Type, TypeVar, Union, cast
+from typing import IO, Any, Dict, List, Optional, Set, Type, TypeVar, Union, cast
 from urllib.parse import urlencode
 
 import yaml
 from pydantic import BaseModel, Field, StrictInt, StrictStr, root_validator
 from typing_extensions import Literal
 
+from twcompose import __version__
+from twcompose.cache import get_cache_dir
+
+try:
+    # Using the C implementation of the YAML loader when available
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader  # type: ignore
+
 _T = TypeVar("_T", bound=BaseModel)
 
+# Number of parsed compose files kept in cache
+COMPOSE_CACHE_SIZE = 64
+
 
 class TwitterOutputDriver(BaseModel):
     driver: str
@@ -118,6 +134,41 @@ class TwitterStreamParametersModel(BaseModel):
         return urlencode(qs_dict)
 
 
+class TwitterShardModel(BaseModel):
+    # Credentials file of the Twitter app collecting the shard
+    credentials: str
+
+
+def get_shared_tag_warnings(
+    streams: Dict[str, List[TwitterStreamRuleModel]]
+) -> List[str]:
+    """Warnings about the tags found in several stream groups"""
+    # Structure to hold the set of groups that mentions a tag
+    # Warnings will be raised if tags are found in multiple groups
+    tags_to_stream_names: Dict[str, Set[str]] = {}
+    messages: List[str] = []
+    for stream_group, rules in streams.items():
+        for r in rules:
+            tags_to_stream_names.setdefault(r.tag, set())
+
+            # If there are already 2 matching groups,
+            # we skip as we already have a warning
+            if len(tags_to_stream_names[r.tag]) == 2:
+                continue
+
+            tags_to_stream_names[r.tag].add(stream_group)
+            if len(tags_to_stream_names[r.tag]) == 2:
+                # More that 2 stream groups, warning
+                stream_groups_str = ",".join(tags_to_stream_names[r.tag])
+                messages.append(
+                    f"Found tag '{r.tag}' in two stream "
+                    f"groups {stream_groups_str}, "
+                    "this can lead to inconsistent behaviour "
+                    "when retrieving tweets for a stream group"
+                )
+    return messages
+
+
 class TwitterComposeModel(BaseModel):
     """twitter-compose file model"""
 
@@ -126,43 +177,137 @@ class TwitterComposeModel(BaseModel):
     parameters: TwitterStreamParametersModel
     streams: Dict[str, List[TwitterStreamRuleModel]]
     image_name: str = "ghcr.io/smassonnet/twcollect"
+    # Runs the collectors in Docker containers or in local processes
+    backend: Literal["docker", "subprocess"] = "docker"
+    # How a running collector is replaced when its configuration changes
+    update_strategy: Literal["recreate", "handoff"] = "recreate"
+    # Seconds a new collector must stream without errors during a handoff
+    handoff_warmup: int = 15
+    # Seconds to wait for a new collector before cancelling a handoff
+    handoff_timeout: int = 120
+    # Collectors the stream groups are split across, a single one if empty
+    shards: List[TwitterShardModel] = Field(default_factory=list)
 
     @root_validator
     def check_tag_unique_to_a_stream(cls, values: Dict[str, Any]):
-        # Structure to hold the set of groups that mentions a tag
-        # Warnings will be raised if tags are found in multiple groups
-        tags_to_stream_names: Dict[str, Set[str]] = {}
         streams_definitions = cast(
-            Iterable[Tuple[str, List[TwitterStreamRuleModel]]],
-            values["streams"].items(),
+            Dict[str, List[TwitterStreamRuleModel]], values["streams"]
         )
-        for stream_group, rules in streams_definitions:
-            for r in rules:
-                tags_to_stream_names.setdefault(r.tag, set())
-
-                # If there are already 2 matching groups,
-                # we skip as we already printed a warning
-                if len(tags_to_stream_names[r.tag]) == 2:
-                    continue
-
-                tags_to_stream_names[r.tag].add(stream_group)
-                if len(tags_to_stream_names[r.tag]) == 2:
-                    # More that 2 stream groups, warning
-                    stream_groups_str = ",".join(tags_to_stream_names[r.tag])
-                    warnings.warn(
-                        f"Found tag '{r.tag}' in two stream "
-                        f"groups {stream_groups_str}, "
-                        "this can lead to inconsistent behaviour "
-                        "when retrieving tweets for a stream group"
-                    )
+        for message in get_shared_tag_warnings(streams_definitions):
+            warnings.warn(message)
+        return values
 
+    @root_validator(skip_on_failure=True)
+    def check_update_strategy_of_backend(cls, values: Dict[str, Any]):
+        # Only the docker backend replaces running collectors with a handoff
+        if values["backend"] != "docker" and values["update_strategy"] == "handoff":
+            raise ValueError(
+                "The handoff update strategy is only supported by the docker backend"
+            )
         return values
 
 
+def load_yaml(stream: Union[str, bytes, IO]) -> Any:
+    return yaml.load(stream, Loader=SafeLoader)
+
+
 def parse_file_from_pydantic_model(path: pathlib.Path, model: Type[_T]) -> _T:
     with path.open() as cf:
-        return model.parse_obj(yaml.safe_load(cf))
+        return model.parse_obj(load_yaml(cf))
+
+
+def _compose_cache_key(content: bytes) -> str:
+    """Hash of the file content and of the version of the model"""
+    model_version = f"{__version__}:{pathlib.Path(__file__).stat().st_mtime_ns}"
+    return hashlib.sha256(model_version.encode() + b"\0" + content).hexdigest()
+
+
+def _prune_compose_cache(cache_dir: pathlib.Path) -> None:
+    """Keeps the most recently used parsed files"""
+    cached_files = sorted(
+        cache_dir.glob("*.json"), key=lambda f: f.stat().st_mtime, reverse=True
+    )
+    for cached_file in cached_files[COMPOSE_CACHE_SIZE:]:
+        cached_file.unlink(missing_ok=True)
+
+
+def _construct_compose_config(data: Dict[str, Any]) -> TwitterComposeModel:
+    """Builds the model of validated data without validating it again"""
+    return TwitterComposeModel.construct(
+        **dict(
+            data,
+            output=TwitterOutputDriver.construct(**data["output"]),
+            parameters=TwitterStreamParametersModel.construct(**data["parameters"]),
+            streams={
+                name: [TwitterStreamRuleModel.construct(**r) for r in rules]
+                for name, rules in data["streams"].items()
+            },
+            shards=[TwitterShardModel.construct(**s) for s in data["shards"]],
+        )
+    )
+
+
+def _read_compose_cache(cache_file: pathlib.Path) -> Optional[TwitterComposeModel]:
+    try:
+        content = json.loads(cache_file.read_bytes())
+        config = content["config"]
+        # Only the validated data written by twcompose is trusted
+        checksum = hashlib.sha256(config.encode()).hexdigest()
+        if checksum != content["checksum"]:
+            return None
+        compose_config = _construct_compose_config(json.loads(config))
+        warning_messages = content["warnings"]
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        # Corrupted cache file, parsing again
+        return None
+
+    # Warnings raised by validators are raised again
+    for message in warning_messages:
+        warnings.warn(message)
+    cache_file.touch()
+    return compose_config
+
+
+def parse_compose_file(
+    twitter_compose_path: pathlib.Path, use_cache: bool = True
+) -> TwitterComposeModel:
+    """Parses and validates the twitter-compose file
+
+    Validated files are cached as JSON by content hash in the twcompose cache
+    directory, with the warnings of the validators. Cached files are checked
+    against their checksum and loaded without validating them again.
+
+    Args:
+        twitter_compose_path (pathlib.Path): The twitter-compose file
+        use_cache (bool): Whether to use the cache. Defaults to `True`.
+    """
+    content = twitter_compose_path.read_bytes()
+    if not use_cache:
+        return TwitterComposeModel.parse_obj(load_yaml(content))
 
+    cache_dir = get_cache_dir() / "compose"
+    cache_file = cache_dir / f"{_compose_cache_key(content)}.json"
+    compose_config = _read_compose_cache(cache_file)
+    if compose_config is not None:
+        return compose_config
 
-def parse_compose_file(twitter_compose_path: pathlib.Path) -> TwitterComposeModel:
-    return parse_file_from_pydantic_model(twitter_compose_path, TwitterComposeModel)
+    compose_config = TwitterComposeModel.parse_obj(load_yaml(content))
+    config = compose_config.json()
+    cache_content = {
+        "config": config,
+        "checksum": hashlib.sha256(config.encode()).hexdigest(),
+        # Collected from the model, the validators already raised them
+        "warnings": get_shared_tag_warnings(compose_config.streams),
+    }
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=cache_dir, delete=False) as f:
+            json.dump(cache_content, f)
+        os.replace(f.name, cache_file)
+        _prune_compose_cache(cache_dir)
+    except OSError:
+        # The cache is optional
+        pass
+    return compose_config
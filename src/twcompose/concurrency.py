@@ -0,0 +1,41 @@
+"""Helpers to overlap blocking calls with asyncio"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Coroutine, Optional, TypeVar
+
+_T = TypeVar("_T")
+
+
+def run_in_thread(func: Callable[..., _T], *args, **kwargs) -> Awaitable[_T]:
+    """Runs a blocking function in the executor of the running event loop
+
+    The function runs in a copy of the current context, as with
+    `asyncio.to_thread`, so that profiling spans are nested in the caller.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(
+        None, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+def run_sync(
+    coroutine: Coroutine[Any, Any, _T], max_workers: Optional[int] = None
+) -> _T:
+    """Runs a coroutine to completion from synchronous code
+
+    Args:
+        coroutine (Coroutine): The coroutine to run
+        max_workers (int | None, optional): Number of threads used by
+            `run_in_thread`. Defaults to the asyncio default.
+    """
+
+    async def _main() -> _T:
+        if max_workers is not None:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
+            asyncio.get_running_loop().set_default_executor(executor)
+        return await coroutine
+
+    return asyncio.run(_main())
@@ -0,0 +1,154 @@
+"""Notifications of the changes of a file, with inotify on Linux"""
+import abc
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import select
+import struct
+import sys
+import time
+from typing import Any, Optional, Tuple
+
+_logger = logging.getLogger(__name__)
+
+# inotify events of a file written in place or replaced by a rename,
+# as most editors do
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_EVENT = struct.Struct("iIII")
+
+DEFAULT_POLL_INTERVAL = 0.5
+
+
+class FileWatcher(abc.ABC):
+    """Waits for changes of a file"""
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+
+    @abc.abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the file changes
+
+        Args:
+            timeout (float | None, optional): Maximum time to wait in
+                seconds. Defaults to waiting forever.
+
+        Returns:
+            bool: Whether the file changed
+        """
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "FileWatcher":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class InotifyWatcher(FileWatcher):
+    """Watches the folder of the file with Linux inotify
+
+    Raises:
+        OSError: If inotify is not available
+    """
+
+    def __init__(self, path: pathlib.Path):
+        super().__init__(path)
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("The C library is not available")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        # Watching the folder, replacing the file would remove a watch on it
+        folder = os.fsencode(path.absolute().parent)
+        if libc.inotify_add_watch(self._fd, folder, _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, os.strerror(errno))
+
+    def _read_names(self) -> Tuple[str, ...]:
+        """Names of the files of the pending events"""
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return ()
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, _, _, name_length = _IN_EVENT.unpack_from(data, offset)
+            offset += _IN_EVENT.size
+            names.append(os.fsdecode(data[offset : offset + name_length].rstrip(b"\0")))
+            offset += name_length
+        return tuple(names)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if readable and self.path.name in self._read_names():
+                return True
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher(FileWatcher):
+    """Compares the modification time, size and inode of the file
+
+    Attributes:
+        poll_interval (float): Time in seconds between two checks
+    """
+
+    def __init__(
+        self, path: pathlib.Path, poll_interval: float = DEFAULT_POLL_INTERVAL
+    ):
+        super().__init__(path)
+        self.poll_interval = poll_interval
+        self._signature = self._get_signature()
+
+    def _get_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            signature = self._get_signature()
+            if signature != self._signature:
+                self._signature = signature
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            time.sleep(
+                self.poll_interval
+                if remaining is None
+                else min(self.poll_interval, remaining)
+            )
+
+
+def get_file_watcher(
+    path: pathlib.Path, poll_interval: float = DEFAULT_POLL_INTERVAL
+) -> FileWatcher:
+    """Watcher using inotify on Linux, polling the file otherwise"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError) as e:
+            # AttributeError: the C library has no inotify functions
+            _logger.info(f"inotify is not available ({e}), polling {path}")
+    return PollingWatcher(path, poll_interval)
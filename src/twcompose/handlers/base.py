@@ -1,13 +1,37 @@
 import dataclasses
-from typing import Optional
+import functools
+from typing import Callable, Optional
 
 from typing_extensions import Self
 
 from twcompose.handlers.state import CommandHandlerState
+from twcompose.profiling import span
+
+_Handle = Callable[["CommandHandler", CommandHandlerState], None]
+
+
+def _handle_in_span(handle: _Handle) -> _Handle:
+    """Times the handle method of a handler class in a span named after it"""
+
+    @functools.wraps(handle)
+    def wrapper(self: "CommandHandler", state: CommandHandlerState) -> None:
+        if type(self).handle is not wrapper:
+            # Called by the handle method of a subclass, already timed
+            return handle(self, state)
+        with span(type(self).__name__):
+            return handle(self, state)
+
+    return wrapper
 
 
 @dataclasses.dataclass
 class CommandHandler:
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Each handler of a chain is timed, including its next handlers
+        if "handle" in cls.__dict__:
+            cls.handle = _handle_in_span(cls.__dict__["handle"])  # type: ignore
+
     def __post_init__(self):
         self.next_handler: Optional["CommandHandler"] = None
 
@@ -0,0 +1,51 @@
+import dataclasses
+
+from twcompose.backends.abstract import AbstractCollectionBackend, CollectorDoesNotExist
+from twcompose.handlers.base import CommandHandler
+from twcompose.handlers.state import CommandHandlerState
+
+
+@dataclasses.dataclass
+class CollectorStateHandler(CommandHandler):
+    """Compares the collector of the project with the compose file
+
+    Sets the `collector_differences` and `is_collector_running` attributes
+    of state, differences are `None` if the collector does not exist.
+
+    Attributes:
+        backend (AbstractCollectionBackend): The backend of the collector
+    """
+
+    backend: AbstractCollectionBackend
+
+    def handle(self, state: CommandHandlerState):
+        assert state.twitter_compose_config is not None
+        try:
+            state.collector_differences = self.backend.diff(
+                state.project_name,
+                state.twitter_compose_config,
+                state.credentials_file,
+            )
+        except CollectorDoesNotExist:
+            state.collector_differences = None
+            state.is_collector_running = False
+        else:
+            state.is_collector_running = self.backend.is_running(state.project_name)
+        super().handle(state)
+
+
+@dataclasses.dataclass
+class CollectorStatusHandler(CommandHandler):
+    """Whether the collector of the project is running
+
+    Sets the `is_collector_running` attribute of state
+
+    Attributes:
+        backend (AbstractCollectionBackend): The backend of the collector
+    """
+
+    backend: AbstractCollectionBackend
+
+    def handle(self, state: CommandHandlerState):
+        state.is_collector_running = self.backend.is_running(state.project_name)
+        super().handle(state)
@@ -0,0 +1,190 @@
+import contextvars
+import copy
+import dataclasses
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence
+
+from typing_extensions import Self
+
+from twcompose.handlers.base import CommandHandler
+from twcompose.handlers.state import CommandHandlerState
+from twcompose.profiling import span
+
+
+@dataclasses.dataclass
+class HandlerNode:
+    """A handler of a graph and the handlers it depends on
+
+    Attributes:
+        name (str): Name of the node in the graph
+        handler (CommandHandler): The handler run by the node
+        depends_on (Sequence[str]): Names of the nodes that must be
+            handled before this one
+    """
+
+    name: str
+    handler: CommandHandler
+    depends_on: Sequence[str] = ()
+
+
+def _copy_containers(state: CommandHandlerState) -> Dict[str, Any]:
+    """Fields of the state, with deep copies of its dicts, lists and sets
+
+    Other values, like the Twitter client, are shared between the nodes.
+    """
+    return {
+        f.name: (
+            copy.deepcopy(value) if isinstance(value, (dict, list, set)) else value
+        )
+        for f in dataclasses.fields(state)
+        for value in [getattr(state, f.name)]
+    }
+
+
+def _run_node(
+    node: HandlerNode, node_state: CommandHandlerState
+) -> CommandHandlerState:
+    with span(node.name):
+        node.handler.handle(node_state)
+    return node_state
+
+
+def _merge_state(
+    state: CommandHandlerState,
+    node_state: CommandHandlerState,
+    submitted: Dict[str, Any],
+) -> List[str]:
+    """Sets the fields changed by a node on the state
+
+    Fields are compared by value, to find the containers changed in place.
+    The messages added by the node are appended to the ones of the state.
+
+    Returns:
+        list[str]: Names of the changed fields
+    """
+    changed = []
+    for field in dataclasses.fields(state):
+        if field.name == "messages":
+            new_messages = node_state.messages[len(submitted["messages"]) :]
+            state.messages.extend(new_messages)
+            continue
+        value = getattr(node_state, field.name)
+        if value != submitted[field.name]:
+            setattr(state, field.name, value)
+            changed.append(field.name)
+    return changed
+
+
+@dataclasses.dataclass
+class CommandHandlerGraph(CommandHandler):
+    """Handlers with dependencies, independent handlers run concurrently
+
+    Each handler runs on a thread pool as soon as the handlers it depends on
+    are done. It handles a copy of the state, with its own copies of the
+    dicts, lists and sets, that is merged back into the state once it is done:
+    the fields it changed replace the ones of the state and its messages are
+    appended to the messages of the state. The next handler
+    of the graph is called once all nodes are done.
+
+    The handlers of the nodes must not be chained, their next handler would
+    run on the copy of the state.
+
+    Attributes:
+        max_workers (int | None, optional): Number of handlers running
+            concurrently. Defaults to the `ThreadPoolExecutor` default.
+    """
+
+    max_workers: Optional[int] = None
+
+    def __post_init__(self):
+        super().__post_init__()
+        self.nodes: List[HandlerNode] = []
+
+    def add(
+        self, name: str, handler: CommandHandler, depends_on: Sequence[str] = ()
+    ) -> Self:
+        """Adds a handler run after the handlers of `depends_on`
+
+        Raises:
+            ValueError: If the name is already used or if a dependency
+                is not defined yet
+        """
+        names = {n.name for n in self.nodes}
+        if name in names:
+            raise ValueError(f"Handler {name} is already defined")
+        unknown = [d for d in depends_on if d not in names]
+        if unknown:
+            raise ValueError(
+                f"Handler {name} depends on undefined handlers: {', '.join(unknown)}"
+            )
+        self.nodes.append(HandlerNode(name, handler, tuple(depends_on)))
+        return self
+
+    def handle(self, state: CommandHandlerState):
+        """Handles the nodes in dependency order, concurrently when possible
+
+        Raises:
+            ValueError: If concurrent handlers set the same field of the state
+        """
+        done: Dict[str, CommandHandlerState] = {}
+        running: Dict["Future[CommandHandlerState]", HandlerNode] = {}
+        # Fields changed by each node, to detect conflicting changes
+        changed_by: Dict[str, str] = {}
+        submitted: Dict[str, Dict[str, Any]] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            try:
+                while len(done) < len(self.nodes):
+                    for node in self.nodes:
+                        if (
+                            node.name in done
+                            or node.name in submitted
+                            or any(d not in done for d in node.depends_on)
+                        ):
+                            continue
+                        # The node handles a copy of the state as it is now
+                        node_state = CommandHandlerState(**_copy_containers(state))
+                        submitted[node.name] = _copy_containers(state)
+                        # Nesting the spans of the node in the current span
+                        context = contextvars.copy_context()
+                        future = executor.submit(
+                            context.run, _run_node, node, node_state
+                        )
+                        running[future] = node
+
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    # Merging nodes done together in the order of the nodes
+                    for future in sorted(
+                        finished, key=lambda f: self.nodes.index(running[f])
+                    ):
+                        node = running.pop(future)
+                        node_state = future.result()
+                        for field_name in _merge_state(
+                            state, node_state, submitted[node.name]
+                        ):
+                            if field_name in changed_by and not self._depends_on(
+                                node, changed_by[field_name]
+                            ):
+                                raise ValueError(
+                                    f"Handlers {changed_by[field_name]} and "
+                                    f"{node.name} both set {field_name}"
+                                )
+                            changed_by[field_name] = node.name
+                        done[node.name] = node_state
+            finally:
+                # Not starting the handlers waiting for a failed one
+                for future in running:
+                    future.cancel()
+
+        super().handle(state)
+
+    def _depends_on(self, node: HandlerNode, other: str) -> bool:
+        """Whether the node runs after the node named `other`"""
+        nodes = {n.name: n for n in self.nodes}
+        to_visit = list(node.depends_on)
+        while to_visit:
+            name = to_visit.pop()
+            if name == other:
+                return True
+            to_visit.extend(nodes[name].depends_on)
+        return False
@@ -0,0 +1,118 @@
+import asyncio
+import dataclasses
+from typing import Any, Dict, List, Mapping
+
+from twcompose.concurrency import run_in_thread, run_sync
+from twcompose.handlers import CommandHandler
+from twcompose.handlers.state import CommandHandlerState
+from twcompose.handlers.volume import (
+    count_estimator_from_state,
+    get_concurrency,
+    rules_to_estimate,
+)
+from twcompose.twitter.cache import CountsCache
+from twcompose.twitter.counts import MonthlyTwitterCountEstimator
+from twcompose.twitter.peak import RateStats, bucket_rates, sum_rates
+
+# Default maximum file size of twcollect
+DEFAULT_MAX_FILE_SIZE = 2**30
+
+
+@dataclasses.dataclass
+class PeakRateCommandHandler(CommandHandler):
+    """Peak tweet rates of the rules, stream groups and collector output
+
+    Counts are requested per `state.command_args["granularity"]` (`hour` or
+    `minute`) and the report is saved in `state.peak_rates`.
+    The rate of a stream group is the sum of the rates of its rules,
+    an upper bound when tweets match several rules.
+
+    Attributes:
+        tweet_size (int): Average number of bytes written per tweet in the
+            output files. Defaults to 1024.
+    """
+
+    tweet_size: int = 1024
+
+    async def _get_rates(
+        self,
+        estimator: MonthlyTwitterCountEstimator,
+        rules: List[str],
+        granularity: str,
+        concurrency: int,
+    ) -> Dict[str, Dict[str, float]]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _rule_rates(rule: str) -> Dict[str, float]:
+            async with semaphore:
+                counts = await run_in_thread(estimator.get_counts, rule, granularity)
+            return bucket_rates(counts)
+
+        all_rates = await asyncio.gather(*(_rule_rates(r) for r in rules))
+        return dict(zip(rules, all_rates))
+
+    def _stream_groups(self, state: CommandHandlerState) -> Dict[str, List[str]]:
+        assert state.twitter_compose_config is not None
+        if state.command_args.get("volume_rules"):
+            # Rules from the command line are not part of a stream group
+            return {}
+        return {
+            name: [r.value for r in rules]
+            for name, rules in state.twitter_compose_config.streams.items()
+        }
+
+    def _output_report(
+        self, total_rates: Mapping[str, float], max_file_size: int
+    ) -> Dict[str, Any]:
+        tweets_per_hour = RateStats.from_rates(total_rates.values()).scale(3600)
+        bytes_per_hour = tweets_per_hour.scale(self.tweet_size)
+        return {
+            "tweets_per_hour": tweets_per_hour.to_dict(0),
+            "bytes_per_hour": bytes_per_hour.to_dict(0),
+            "max_file_size": max_file_size,
+            "files_per_hour": bytes_per_hour.scale(1 / max_file_size).to_dict(),
+        }
+
+    def handle(self, state: CommandHandlerState) -> None:
+        assert state.twitter_compose_config is not None
+        granularity = state.command_args.get("granularity") or "hour"
+        concurrency = get_concurrency(state)
+
+        rules = rules_to_estimate(state)
+        with CountsCache() as cache:
+            rates_per_rule = run_sync(
+                self._get_rates(
+                    count_estimator_from_state(state, cache),
+                    rules,
+                    granularity,
+                    concurrency,
+                ),
+                max_workers=concurrency,
+            )
+        rates_per_group = {
+            name: sum_rates(rates_per_rule[r] for r in group_rules)
+            for name, group_rules in self._stream_groups(state).items()
+        }
+
+        max_file_size = int(
+            state.twitter_compose_config.output.options.get(
+                "max_file_size", DEFAULT_MAX_FILE_SIZE
+            )
+        )
+        state.peak_rates = {
+            "granularity": granularity,
+            "rules": {
+                rule: RateStats.from_rates(rates.values()).to_dict()
+                for rule, rates in rates_per_rule.items()
+            },
+            "streams": {
+                name: RateStats.from_rates(rates.values()).to_dict()
+                for name, rates in rates_per_group.items()
+            },
+            "output": self._output_report(
+                sum_rates(rates_per_rule.values()), max_file_size
+            ),
+        }
+
+        # Passing to the next handler
+        super().handle(state)
@@ -0,0 +1,22 @@
+import dataclasses
+
+from twcompose.handlers.base import CommandHandler
+from twcompose.handlers.state import CommandHandlerState
+from twcompose.rules import TwitterRuleAPI
+
+
+@dataclasses.dataclass
+class GetTwitterRulesHandler(CommandHandler):
+    """Gets the rules installed on Twitter
+
+    Sets the `twitter_rules` attribute of state
+
+    Attributes:
+        twitter_api (TwitterRuleAPI): The rules endpoint of the project
+    """
+
+    twitter_api: TwitterRuleAPI
+
+    def handle(self, state: CommandHandlerState):
+        state.twitter_rules = self.twitter_api.get()
+        super().handle(state)
@@ -1,11 +1,15 @@
 import argparse
 import dataclasses
 import pathlib
-from typing import Any, Dict, List, Optional
-
-import tweepy
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
 
 from twcompose.compose import TwitterComposeModel
+from twcompose.rules import TwitterRule
+from twcompose.twitter.http import TwitterHTTPClient
+
+if TYPE_CHECKING:
+    # Importing the backends imports docker, only the update command needs it
+    from twcompose.backends.abstract import CollectorValueDifference
 
 
 @dataclasses.dataclass
@@ -19,7 +23,13 @@ class CommandHandlerState:
         credentials_file (pathlib.Path): The path to the credentials
             file.
         command_args (dict[str, Any]): Additional command line arguments
-        twitter_client (tweepy.Client | None, optional): The tweepy client
+        twitter_client (TwitterHTTPClient | None, optional): The Twitter client
+        twitter_rules (set[TwitterRule] | None, optional): The installed rules
+        collector_differences (dict[str, CollectorValueDifference] | None,
+            optional): Differences between the collector and the compose file,
+            `None` if the collector does not exist
+        is_collector_running (bool | None, optional): Whether the collector
+            of the project is running
     """
 
     # Base config
@@ -32,9 +42,15 @@ class CommandHandlerState:
     # Config parsing
     twitter_compose_config: Optional[TwitterComposeModel] = None
     # Twitter client command handler
-    twitter_client: Optional[tweepy.Client] = None
+    twitter_client: Optional[TwitterHTTPClient] = None
     # Tweet volume estimation
     volume_per_rule: Optional[Dict[str, int]] = None
+    # Peak rates report
+    peak_rates: Optional[Dict[str, Any]] = None
+    # Installed rules and collector state
+    twitter_rules: Optional[Set[TwitterRule]] = None
+    collector_differences: Optional[Dict[str, "CollectorValueDifference[str]"]] = None
+    is_collector_running: Optional[bool] = None
     # Stdout messages
     messages: List[str] = dataclasses.field(default_factory=list)
 
@@ -47,6 +63,9 @@ class CommandHandlerState:
         del command_arguments["func"]
         del command_arguments["command"]
         del command_arguments["log_level"]
+        command_arguments.pop("parse_compose", None)
+        command_arguments.pop("profile_file", None)
+        command_arguments.pop("profile_format", None)
         return cls(
             project_name=arguments.project_name,
             twitter_compose_file=arguments.tc_file,
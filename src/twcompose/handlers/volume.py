@@ -1,54 +1,142 @@
+import asyncio
+import dataclasses
 from collections import OrderedDict
-from typing import List, Optional, cast
+from typing import Callable, List, Optional, Sequence, Tuple, cast
 
+from twcompose.concurrency import run_sync
 from twcompose.handlers import CommandHandler
 from twcompose.handlers.state import CommandHandlerState
+from twcompose.twitter.aio import AsyncMonthlyTwitterCountEstimator
+from twcompose.twitter.cache import CountsCache
 from twcompose.twitter.counts import MonthlyTwitterCountEstimator
+from twcompose.twitter.ratelimit import TokenBucket
+from twcompose.twitter.timeseries import DailyCountsStore
 
+DEFAULT_CONCURRENCY = 4
 
+
+def or_query(rules: Sequence[str]) -> str:
+    """Combines rules with OR, matching tweets matched by any of the rules"""
+    if len(rules) == 1:
+        return rules[0]
+    return " OR ".join(f"({r})" for r in rules)
+
+
+def group_rules(rules: Sequence[str], max_query_length: int) -> List[List[str]]:
+    """Splits rules in groups that fit in a query when combined with OR
+
+    A rule longer than `max_query_length` is left alone in its group.
+    """
+    groups: List[List[str]] = []
+    current: List[str] = []
+    for rule in rules:
+        if current and len(or_query(current + [rule])) > max_query_length:
+            groups.append(current)
+            current = []
+        current.append(rule)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def rules_to_estimate(state: CommandHandlerState) -> List[str]:
+    """Rules from `state.command_args["volume_rules"]` or from the compose file"""
+    assert state.twitter_compose_config is not None
+    command_line_rules = state.command_args.get("volume_rules")
+    if command_line_rules:
+        return command_line_rules
+
+    # Otherwise, looping through rules in the config
+    return [
+        item.value
+        for queries in state.twitter_compose_config.streams.values()
+        for item in queries
+    ]
+
+
+def get_concurrency(state: CommandHandlerState) -> int:
+    return cast(int, state.command_args.get("concurrency") or DEFAULT_CONCURRENCY)
+
+
+def count_estimator_from_state(
+    state: CommandHandlerState, cache: CountsCache
+) -> MonthlyTwitterCountEstimator:
+    """Count estimator with rate limiting, cache and store of daily counts"""
+    assert state.twitter_client is not None
+    return MonthlyTwitterCountEstimator(
+        state.twitter_client,
+        rate_limiter=TokenBucket(),
+        cache=cache,
+        refresh=bool(state.command_args.get("refresh")),
+        store=DailyCountsStore(),
+        projection=state.command_args.get("projection") or "average",
+    )
+
+
+@dataclasses.dataclass
 class VolumeEstimatorCommandHandler(CommandHandler):
     """Collect volume information for all rules in the streams
 
-    Saves the results in state.
+    Rules are estimated concurrently on `state.command_args["concurrency"]`
+    workers sharing a token bucket sized from the rate limit of the counts
+    endpoint. Daily counts are kept in a local store so that only the days
+    since the last run are fetched, unless `state.command_args["refresh"]`
+    is set. Saves the results in state.
+
+    Attributes:
+        print_func (Callable[[str], None] | None, optional): Prints the volume
+            of each rule as soon as it is estimated. Defaults to `None`.
     """
 
+    print_func: Optional[Callable[[str], None]] = None
+
     def rules_to_estimate(self, state: CommandHandlerState) -> List[str]:
         """Resolve the rules to estimate
 
         If `state.command_args` contains `volume_rules`, then they are returned.
         Otherwise, all the rules in the `twitter-compose.yml` files are used.
         """
-        assert state.twitter_compose_config is not None
-        command_line_rules = state.command_args.get("volume_rules")
-        if command_line_rules:
-            return command_line_rules
-
-        # Otherwise, looping through rules in the config
-        return [
-            item.value
-            for queries in state.twitter_compose_config.streams.values()
-            for item in queries
-        ]
+        return rules_to_estimate(state)
+
+    async def _estimate_rules(
+        self,
+        volume_estimator: AsyncMonthlyTwitterCountEstimator,
+        rules: List[str],
+        concurrency: int,
+        min_volume: Optional[int],
+    ) -> List[Tuple[str, int]]:
+        vol_map: List[Tuple[str, int]] = []
+        async for rule, volume in volume_estimator.estimate_as_completed(
+            rules, concurrency
+        ):
+            # Optionally filtering
+            if min_volume is not None and volume <= min_volume:
+                continue
+
+            vol_map.append((rule, volume))
+            if self.print_func is not None:
+                self.print_func(f"{rule}: {volume}")
+        return vol_map
 
     def handle(self, state: CommandHandlerState) -> None:
         # State requirements
         assert state.twitter_client is not None
 
-        # Getting the volume estimator
-        volume_estimator = MonthlyTwitterCountEstimator(state.twitter_client)
-
         # Getting the rules to estimate
         rules = self.rules_to_estimate(state)
 
         # Saving volume for each rule
-        vol_map = [(rule, volume_estimator.estimate(rule)) for rule in rules]
-
-        # Optionally filtering
+        concurrency = get_concurrency(state)
         min_volume = cast(Optional[int], state.command_args.get("min"))
-        if min_volume:
-            vol_map = [
-                (rule, volume) for rule, volume in vol_map if volume > min_volume
-            ]
+        with CountsCache() as cache:
+            # Getting the volume estimator
+            volume_estimator = AsyncMonthlyTwitterCountEstimator(
+                count_estimator_from_state(state, cache)
+            )
+            vol_map = run_sync(
+                self._estimate_rules(volume_estimator, rules, concurrency, min_volume),
+                max_workers=concurrency,
+            )
 
         # Sorting and saving in OrderedDict
         state.volume_per_rule = OrderedDict(
@@ -61,3 +149,69 @@ class VolumeEstimatorCommandHandler(CommandHandler):
 
         # Passing to the next handler
         super().handle(state)
+
+
+@dataclasses.dataclass
+class GroupedVolumeEstimatorCommandHandler(VolumeEstimatorCommandHandler):
+    """Finds the rules above `state.command_args["min"]` with few counts requests
+
+    Rules are combined with OR in groups that fit in a query. Since a group
+    matches at least as many tweets as any of its rules, a group is split
+    in halves only when its volume is above the minimum. Only the volume
+    of the rules above the minimum is known at the end.
+
+    With the `trend` projection, the volume of a group is not always larger
+    than the volume of its rules and some rules could be missed.
+
+    Attributes:
+        max_query_length (int): Maximum length of a query combining rules.
+            Defaults to 512, the limit of the recent counts endpoint.
+    """
+
+    max_query_length: int = 512
+
+    async def _rules_above(
+        self,
+        volume_estimator: AsyncMonthlyTwitterCountEstimator,
+        rules: List[str],
+        min_volume: int,
+        semaphore: asyncio.Semaphore,
+    ) -> List[Tuple[str, int]]:
+        async with semaphore:
+            volume = await volume_estimator.estimate(or_query(rules))
+
+        if volume <= min_volume:
+            # None of the rules can be above the minimum
+            return []
+
+        if len(rules) == 1:
+            if self.print_func is not None:
+                self.print_func(f"{rules[0]}: {volume}")
+            return [(rules[0], volume)]
+
+        middle = len(rules) // 2
+        first_half, second_half = await asyncio.gather(
+            self._rules_above(volume_estimator, rules[:middle], min_volume, semaphore),
+            self._rules_above(volume_estimator, rules[middle:], min_volume, semaphore),
+        )
+        return first_half + second_half
+
+    async def _estimate_rules(
+        self,
+        volume_estimator: AsyncMonthlyTwitterCountEstimator,
+        rules: List[str],
+        concurrency: int,
+        min_volume: Optional[int],
+    ) -> List[Tuple[str, int]]:
+        if min_volume is None:
+            raise ValueError("Grouped volume estimation requires a minimum volume")
+
+        semaphore = asyncio.Semaphore(concurrency)
+        groups = group_rules(rules, self.max_query_length)
+        results = await asyncio.gather(
+            *(
+                self._rules_above(volume_estimator, group, min_volume, semaphore)
+                for group in groups
+            )
+        )
+        return [rule_volume for group in results for rule_volume in group]
@@ -0,0 +1,114 @@
+"""Tweets files written by the collectors in the output folder"""
+import gzip
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import zlib
+from typing import Iterator, List, Optional, Set
+
+_logger = logging.getLogger(__name__)
+
+TWEETS_FILE_PATTERN = "tweets-*.jsonl.gz"
+
+
+def get_tweet_id(line: bytes) -> Optional[str]:
+    """Id of the tweet of a line written by the collector"""
+    try:
+        return json.loads(line)["data"]["id"]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def read_lines(file_path: pathlib.Path) -> Iterator[bytes]:
+    """Lines of a tweets file, stops at the end of the data already flushed
+
+    The file can be written by a running collector, so its last
+    gzip member can be incomplete.
+    """
+    try:
+        with gzip.open(file_path, "rb") as f:
+            yield from f
+    except (EOFError, zlib.error, gzip.BadGzipFile):
+        _logger.debug(f"Stopped reading the incomplete file {file_path}")
+
+
+def tweets_files_modified_since(
+    folder: pathlib.Path, timestamp: float
+) -> List[pathlib.Path]:
+    """Tweets files of the folder written after the given time"""
+    return sorted(
+        f for f in folder.glob(TWEETS_FILE_PATTERN) if f.stat().st_mtime >= timestamp
+    )
+
+
+def remove_tweets(file_path: pathlib.Path, tweet_ids: Set[str]) -> int:
+    """Rewrites a closed tweets file without the given tweets
+
+    The rewritten file keeps the mode of the original one.
+
+    Returns:
+        int: The number of removed tweets
+
+    Raises:
+        ValueError: If the file is corrupted, it is left unchanged
+    """
+    removed = 0
+    with tempfile.NamedTemporaryFile(
+        dir=file_path.parent, suffix=".tmp", delete=False
+    ) as tmp_file:
+        try:
+            with gzip.open(file_path, "rb") as source, gzip.open(tmp_file, "wb") as f:
+                for line in source:
+                    if get_tweet_id(line) in tweet_ids:
+                        removed += 1
+                    else:
+                        f.write(line)
+        except (EOFError, zlib.error, gzip.BadGzipFile) as e:
+            os.unlink(tmp_file.name)
+            raise ValueError(f"The tweets file {file_path} is corrupted: {e}") from e
+
+    if removed:
+        shutil.copymode(file_path, tmp_file.name)
+        os.replace(tmp_file.name, file_path)
+    else:
+        os.unlink(tmp_file.name)
+    return removed
+
+
+def deduplicate_handoff(
+    old_folder: pathlib.Path, new_folder: pathlib.Path, since: float
+) -> int:
+    """Removes tweets collected by both collectors during a handoff
+
+    Duplicates are removed from the files of the stopped collector,
+    written in `old_folder`, that were modified since the new collector
+    started writing to `new_folder`.
+
+    Args:
+        old_folder (pathlib.Path): The output of the stopped collector
+        new_folder (pathlib.Path): The output of the running collector
+        since (float): The timestamp when the new collector was started
+
+    Returns:
+        int: The number of removed tweets
+
+    Raises:
+        ValueError: If a file of the stopped collector is corrupted
+    """
+    new_tweet_ids: Set[str] = set()
+    for file_path in tweets_files_modified_since(new_folder, since):
+        for line in read_lines(file_path):
+            tweet_id = get_tweet_id(line)
+            if tweet_id is not None:
+                new_tweet_ids.add(tweet_id)
+
+    if not new_tweet_ids:
+        return 0
+
+    return sum(
+        remove_tweets(file_path, new_tweet_ids)
+        for file_path in tweets_files_modified_since(old_folder, since)
+    )
@@ -0,0 +1,176 @@
+"""Nested timing spans of the phases of a command, written as a trace file
+
+Profiling is disabled by default and `span` only costs a function call.
+Once `enable` is called, every span is recorded with its parent span, its
+thread and its attributes (HTTP retries, rate limit waits...). The current
+span is held in a context variable, so spans opened by `run_in_thread`
+callables and asyncio tasks are nested in the span that started them.
+"""
+import contextlib
+import contextvars
+import dataclasses
+import itertools
+import json
+import os
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+TRACE_FORMATS = ("json", "chrome")
+
+
+@dataclasses.dataclass
+class Span:
+    """A timed phase of a command
+
+    Attributes:
+        id (int): Identifier of the span in the trace
+        name (str): Name of the phase
+        parent_id (int | None): Identifier of the enclosing span
+        thread_id (int): Identifier of the thread running the phase
+        start (float): Start time in seconds since the profiler start
+        duration (float | None): Duration in seconds, `None` while running
+        args (dict[str, Any]): Attributes of the phase
+    """
+
+    id: int
+    name: str
+    parent_id: Optional[int]
+    thread_id: int
+    start: float
+    duration: Optional[float] = None
+    args: Dict[str, Any] = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class Profiler:
+    """Records the spans of the current process"""
+
+    spans: List[Span] = dataclasses.field(default_factory=list)
+
+    def __post_init__(self):
+        self._origin = time.perf_counter()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent: Optional[Span], **args: Any) -> Span:
+        span = Span(
+            id=next(self._ids),
+            name=name,
+            parent_id=parent.id if parent is not None else None,
+            thread_id=threading.get_ident(),
+            start=time.perf_counter() - self._origin,
+            args=args,
+        )
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span: Span) -> None:
+        span.duration = time.perf_counter() - self._origin - span.start
+
+    def to_json(self) -> Dict[str, Any]:
+        """Spans as a tree, children are in the `spans` field of their parent"""
+        nodes: Dict[int, Dict[str, Any]] = {}
+        roots: List[Dict[str, Any]] = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            node = {
+                "name": span.name,
+                "start": round(span.start, 6),
+                "duration": round(span.duration, 6)
+                if span.duration is not None
+                else None,
+                "thread": span.thread_id,
+                "args": span.args,
+                "spans": [],
+            }
+            nodes[span.id] = node
+            parent = nodes.get(span.parent_id) if span.parent_id is not None else None
+            (parent["spans"] if parent is not None else roots).append(node)
+        return {"spans": roots}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Complete events of the Chrome trace event format
+
+        The trace can be opened with `chrome://tracing` or https://ui.perfetto.dev
+        """
+        events = [
+            {
+                "name": span.name,
+                "ph": "X",
+                "ts": round(span.start * 1e6, 3),
+                "dur": round((span.duration or 0.0) * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": span.thread_id,
+                "args": span.args,
+            }
+            for span in self.spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: pathlib.Path, trace_format: str = "json") -> None:
+        """Writes the trace file
+
+        Raises:
+            ValueError: If the format is not one of `TRACE_FORMATS`
+        """
+        if trace_format == "json":
+            trace = self.to_json()
+        elif trace_format == "chrome":
+            trace = self.to_chrome_trace()
+        else:
+            raise ValueError(f"Unknown trace format {trace_format}")
+        path.write_text(json.dumps(trace, indent=2, default=str))
+
+
+_profiler: Optional[Profiler] = None
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "twcompose_current_span", default=None
+)
+
+
+def enable() -> Profiler:
+    """Starts recording spans, returns the profiler holding them"""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable() -> Optional[Profiler]:
+    """Stops recording spans, returns the profiler that was recording"""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+@contextlib.contextmanager
+def span(name: str, **args: Any) -> Iterator[None]:
+    """Records the enclosed block as a span if profiling is enabled
+
+    Args:
+        name (str): The name of the phase
+        **args: Attributes of the span, more can be added with `annotate`
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+
+    current = profiler.start_span(name, _current_span.get(), **args)
+    token = _current_span.set(current)
+    try:
+        yield
+    except BaseException as e:
+        current.args["error"] = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        profiler.end_span(current)
+
+
+def annotate(**args: Any) -> None:
+    """Sets attributes of the current span, does nothing outside of a span"""
+    current = _current_span.get()
+    if _profiler is not None and current is not None:
+        current.args.update(args)
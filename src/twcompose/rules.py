@@ -1,18 +1,20 @@
 import dataclasses
 import functools
-import logging
-import time
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import requests
 from typing_extensions import Final, TypeAlias
 
 from twcompose.compose import TwitterStreamRuleModel
-
-_logger = logging.getLogger(__name__)
-
+from twcompose.twitter.http import RetryPolicy, TwitterHTTPClient, get_twitter_api_url
 
 _Error: TypeAlias = "dict[str, Any]"
+RuleIdentity: TypeAlias = "tuple[str, Optional[str]]"
+
+# Active rules of a Twitter app with the Academic Research access
+DEFAULT_MAX_RULES = 1000
+# Title of the errors of the rules refused because of the cap of active rules
+_RULES_CAP_EXCEEDED = "RulesCapExceeded"
 
 
 @dataclasses.dataclass(frozen=True)
@@ -25,12 +27,16 @@ class TwitterRule:
     def from_rule_model(cls, compose_rule: TwitterStreamRuleModel) -> "TwitterRule":
         return cls(tag=compose_rule.tag, value=compose_rule.value)
 
+    def identity(self) -> RuleIdentity:
+        """The definition of the rule regardless of its id (value and tag)"""
+        return (self.value, self.tag)
+
     def is_equivalent(self, other: "TwitterRule") -> bool:
         """True is two rule have the same definition.
 
         This means same value and tag
         """
-        return self.value == other.value and self.tag == other.tag
+        return self.identity() == other.identity()
 
 
 @dataclasses.dataclass
@@ -39,18 +45,43 @@ class TwitterRulesDiff:
 
     add: List[TwitterRule] = dataclasses.field(default_factory=list)
     delete: List[TwitterRule] = dataclasses.field(default_factory=list)
+    # Rules already on Twitter that are kept as is (informative only)
+    unchanged: List[TwitterRule] = dataclasses.field(
+        default_factory=list, compare=False
+    )
 
     def is_empty(self) -> bool:
         """True if the object does not contain changes that need to be pushed"""
         return len(self.add) == 0 and len(self.delete) == 0
 
-    def to_twitter_payload(self) -> List[dict]:
-        """Transforms the diff into a payload that can be posted on Twitter"""
+    def replaced_values(self) -> List[TwitterRule]:
+        """Rules to delete with the value of a rule to add
+
+        Twitter refuses two rules with the same value, these rules must be
+        deleted before their replacement is added.
+        """
+        added_values = {r.value for r in self.add}
+        return [r for r in self.delete if r.value in added_values]
+
+    def to_twitter_payload(self, add_first: bool = False) -> List[dict]:
+        """Transforms the diff into a payload that can be posted on Twitter
+
+        Args:
+            add_first (bool, optional): Adds the new rules before deleting the
+                old ones, so that no tweet is missed while the rules change.
+                Only the rules whose value is added again are deleted first.
+                Defaults to deleting all rules first.
+        """
         ret: List[dict] = []
-        if self.delete:
-            ret.append({"delete": {"ids": [r.id for r in self.delete]}})
+        delete_first = self.replaced_values() if add_first else self.delete
+        if delete_first:
+            ret.append({"delete": {"ids": [r.id for r in delete_first]}})
         if self.add:
             ret.append({"add": [dataclasses.asdict(r) for r in self.add]})
+        if add_first:
+            delete_last = [r for r in self.delete if r not in delete_first]
+            if delete_last:
+                ret.append({"delete": {"ids": [r.id for r in delete_last]}})
         return dict_remove_none_fields(ret)
 
 
@@ -77,73 +108,108 @@ def _list_dispatch(d: list) -> list:
     return [dict_remove_none_fields(element) for element in d]
 
 
+def index_rules(rules: Iterable[TwitterRule]) -> Dict[RuleIdentity, List[TwitterRule]]:
+    """Groups rules by their identity (value and tag)
+
+    Several rules can share the same identity when Twitter holds duplicates
+    of a rule under different ids.
+    """
+    index: Dict[RuleIdentity, List[TwitterRule]] = {}
+    for rule in rules:
+        index.setdefault(rule.identity(), []).append(rule)
+    return index
+
+
+def _rule_id_sort_key(rule: TwitterRule) -> Tuple[bool, int, str]:
+    # Rules ids are numeric strings, sorting them by length first
+    # gives the numeric order without parsing them
+    rule_id = rule.id or ""
+    return (rule.id is None, len(rule_id), rule_id)
+
+
 def compute_rule_changes(
     current_rules: Set[TwitterRule], new_rules: Set[TwitterRule]
 ) -> TwitterRulesDiff:
     """Computes the updates to perform to get to the new rules from the current rules
 
+    Rules are matched on their identity (value and tag) in linear time.
+    When Twitter holds the same rule under several ids, the oldest one is kept
+    and the duplicates are deleted.
+
     Args:
-        current_rules (list[TwitterRule]): The rules currently saved on Twitter
-        new_rules (list[TwitterRule]): The desired rules after the update
+        current_rules (set[TwitterRule]): The rules currently saved on Twitter
+        new_rules (set[TwitterRule]): The desired rules after the update
 
     Returns:
-        TwitterPostRules: The changes to send to the Twitter's rule endpoint.
-    """
-    # Making a copy of rules set
-    new_rules = new_rules.copy()
+        TwitterRulesDiff: The changes to send to the Twitter's rule endpoint.
 
-    to_delete: Set[TwitterRule] = set()
-    for current in current_rules:
-        matching_new_rule = next(
-            (r for r in new_rules if current.is_equivalent(r)), None
-        )
-
-        if matching_new_rule is None:
+    Raises:
+        ValueError: If a rule to delete does not have an id
+    """
+    current_index = index_rules(current_rules)
+    new_index = {r.identity(): r for r in new_rules}
+
+    to_delete: List[TwitterRule] = []
+    unchanged: List[TwitterRule] = []
+    for identity, rules in current_index.items():
+        if identity in new_index:
+            # The rule is in the new rules, we keep one and delete duplicates
+            kept, *duplicates = sorted(rules, key=_rule_id_sort_key)
+            unchanged.append(kept)
+        else:
             # No match, the rule has to be deleted
-            if current.id is None:
+            duplicates = rules
+
+        for rule in duplicates:
+            if rule.id is None:
                 raise ValueError(
                     "Cannot handle TwitterRule with id=None when planning its deletion"
                 )
-            to_delete.add(current)
-        else:
-            # The rule is in the new rules, we do not delete it
-            # And we remove it from the new rules to not add it again
-            new_rules.discard(matching_new_rule)
-    return TwitterRulesDiff(add=list(new_rules), delete=list(to_delete))
+            to_delete.append(rule)
+
+    to_add = [
+        rule for identity, rule in new_index.items() if identity not in current_index
+    ]
+    return TwitterRulesDiff(add=to_add, delete=to_delete, unchanged=unchanged)
+
+
+def format_rule_errors(errors: List[_Error]) -> str:
+    """One line per rule refused by Twitter, with the reason"""
+    lines = []
+    for error in errors:
+        line = f"- {error.get('value', '')}: {error.get('title', 'Error')}"
+        if error.get("detail"):
+            line += f" ({error['detail']})"
+        lines.append(line)
+    return "\n".join(lines)
 
 
 @dataclasses.dataclass
 class TwitterRuleAPI:
+    """Client of the Twitter rules endpoint
+
+    Attributes:
+        twitter_token (str): Bearer token of the Twitter app
+        retry_policy (RetryPolicy, optional): Retries of the failed requests
+        max_rules (int, optional): Maximum number of active rules of the app.
+            Defaults to `DEFAULT_MAX_RULES`.
+    """
+
     twitter_token: str
+    retry_policy: RetryPolicy = dataclasses.field(default_factory=RetryPolicy)
+    max_rules: int = DEFAULT_MAX_RULES
     url_rules: Final[str] = dataclasses.field(
-        init=False, default="https://api.twitter.com/2/tweets/search/stream/rules"
+        init=False,
+        default_factory=lambda: f"{get_twitter_api_url()}/2/tweets/search/stream/rules",
     )
 
-    def _twitter_request(self, method: str, url: str, **kwargs) -> requests.Response:
-        kwargs.setdefault("headers", {})
-        kwargs["headers"].setdefault("Authorization", f"Bearer {self.twitter_token}")
-        while True:
-            response: requests.Response = getattr(requests, method)(url, **kwargs)
-
-            # If we hit a rate limit, we wait and continue to the next loop
-            if response.status_code == 429:
-                time_to_sleep: float = (
-                    int(response.headers["x-rate-limit-reset"]) - time.time()
-                )
-                _logger.info(
-                    "Too many requests to Twitter, waiting for rate limit: "
-                    f"{time_to_sleep} seconds"
-                )
-                time.sleep(time_to_sleep)
-                continue
+    def __post_init__(self):
+        self.http_client = TwitterHTTPClient(
+            self.twitter_token, retry_policy=self.retry_policy
+        )
 
-            # Otherwise proceed normally and raise for abnormal status
-            if not response.ok:
-                _logger.info(
-                    f"Received error from Twitter with payload: {response.text}"
-                )
-                response.raise_for_status()
-            return response
+    def _twitter_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.http_client.request(method, url, **kwargs)
 
     def get(self) -> Set[TwitterRule]:
         """Gets twitter rules"""
@@ -152,13 +218,146 @@ class TwitterRuleAPI:
         payload: Dict[str, Any] = response.json()
         return {TwitterRule(**r) for r in payload.get("data", [])}
 
-    def post(self, changes: TwitterRulesDiff, dry_run: bool = False) -> List[_Error]:
+    def post(
+        self,
+        changes: TwitterRulesDiff,
+        dry_run: bool = False,
+        installed_count: Optional[int] = None,
+    ) -> List[_Error]:
         """Update twitter rules from the given changes"""
-        errors: List[_Error] = []
-        for payload in changes.to_twitter_payload():
-            response = self._twitter_request(
-                "post", self.url_rules, params={"dry_run": dry_run}, json=payload
-            )
-            errors += response.json().get("errors", [])
-
+        _, errors = self.post_and_get_created(
+            changes, dry_run=dry_run, installed_count=installed_count
+        )
         return errors
+
+    def can_add_first(
+        self, changes: TwitterRulesDiff, installed_count: Optional[int] = None
+    ) -> bool:
+        """Whether adding the new rules first stays below the rules cap
+
+        Args:
+            changes (TwitterRulesDiff): The changes to post
+            installed_count (int | None, optional): Number of rules installed
+                on Twitter. Defaults to the rules deleted and kept by `changes`.
+        """
+        if installed_count is None:
+            installed_count = len(changes.delete) + len(changes.unchanged)
+        peak_count = installed_count - len(changes.replaced_values()) + len(changes.add)
+        return peak_count <= self.max_rules
+
+    def _post_payload(
+        self, payload: dict, dry_run: bool
+    ) -> Tuple[List[TwitterRule], List[_Error]]:
+        response = self._twitter_request(
+            "post", self.url_rules, params={"dry_run": dry_run}, json=payload
+        )
+        response_payload: Dict[str, Any] = response.json()
+        created = [TwitterRule(**r) for r in response_payload.get("data", [])]
+        return created, response_payload.get("errors", [])
+
+    def post_and_get_created(
+        self,
+        changes: TwitterRulesDiff,
+        dry_run: bool = False,
+        installed_count: Optional[int] = None,
+    ) -> Tuple[List[TwitterRule], List[_Error]]:
+        """Update twitter rules from the given changes
+
+        The new rules are added before the old ones are deleted, unless the
+        active rules would exceed `max_rules`. An old rule is deleted only if
+        the new rules of its tag were created, the rules kept are reported as
+        errors. The rules refused by Twitter because of the rules cap are
+        added again once the old rules are deleted. When Twitter refuses the
+        whole batch of new rules, the old rules of their tags are kept until
+        the batch is added again.
+
+        Returns:
+            tuple[list[TwitterRule], list[dict]]: The created rules with
+                their ids and the errors returned by Twitter, one per rule
+        """
+        add_first = self.can_add_first(changes, installed_count)
+        to_delete = {r.id: r for r in changes.delete}
+        created: List[TwitterRule] = []
+        errors: List[_Error] = []
+        # Tags whose new rules were refused, their old rules are kept
+        failed_tags: Set[Optional[str]] = set()
+        # Tags of a refused batch, their old rules are kept until it is added
+        waiting_tags: Set[Optional[str]] = set()
+        kept: List[TwitterRule] = []
+        # Rules refused because of the rules cap, added after the deletions
+        capped: List[TwitterRule] = []
+        for payload in changes.to_twitter_payload(add_first=add_first):
+            if "delete" in payload and (failed_tags or waiting_tags):
+                # Keeping the old rules until their replacement is created
+                payload_kept = [
+                    to_delete[i]
+                    for i in payload["delete"]["ids"]
+                    if to_delete[i].tag in failed_tags | waiting_tags
+                ]
+                kept += payload_kept
+                kept_ids = {r.id for r in payload_kept}
+                ids = [i for i in payload["delete"]["ids"] if i not in kept_ids]
+                if not ids:
+                    continue
+                payload = {"delete": {"ids": ids}}
+
+            payload_created, payload_errors = self._post_payload(payload, dry_run)
+            created += payload_created
+            if "add" in payload:
+                cap_errors = [
+                    e for e in payload_errors if e.get("title") == _RULES_CAP_EXCEEDED
+                ]
+                if add_first and cap_errors:
+                    payload_errors = [e for e in payload_errors if e not in cap_errors]
+                    if any("value" not in e for e in cap_errors):
+                        # Twitter refused the whole batch
+                        capped = list(changes.add)
+                        waiting_tags = {r.tag for r in capped}
+                    else:
+                        capped_values = {e["value"] for e in cap_errors}
+                        capped = [r for r in changes.add if r.value in capped_values]
+                failed_tags = _get_failed_tags(changes.add, payload_errors)
+            errors += payload_errors
+
+        if capped:
+            (payload,) = TwitterRulesDiff(add=capped).to_twitter_payload()
+            payload_created, payload_errors = self._post_payload(payload, dry_run)
+            created += payload_created
+            errors += payload_errors
+            # Deleting the old rules of the batch now added
+            retry_failed_tags = _get_failed_tags(capped, payload_errors)
+            replaced = [
+                r
+                for r in kept
+                if r.tag in waiting_tags
+                and r.tag not in failed_tags | retry_failed_tags
+            ]
+            if replaced:
+                (payload,) = TwitterRulesDiff(delete=replaced).to_twitter_payload()
+                _, payload_errors = self._post_payload(payload, dry_run)
+                errors += payload_errors
+                kept = [r for r in kept if r not in replaced]
+
+        errors += [
+            {
+                "id": r.id,
+                "value": r.value,
+                "title": "Not deleted",
+                "detail": "the new rules of its tag were not created",
+            }
+            for r in kept
+        ]
+        return created, errors
+
+
+def _get_failed_tags(
+    rules: List[TwitterRule], errors: List[_Error]
+) -> Set[Optional[str]]:
+    """Tags of the rules refused by Twitter
+
+    An error without value refuses all the rules of the request.
+    """
+    if any("value" not in e for e in errors):
+        return {r.tag for r in rules}
+    failed_values = {e["value"] for e in errors}
+    return {r.tag for r in rules if r.value in failed_values}
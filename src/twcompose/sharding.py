@@ -0,0 +1,282 @@
+"""Split the stream groups of a project across several collectors
+
+The filtered stream of a Twitter app delivers the tweets of all its rules,
+so each shard is collected with the credentials of its own Twitter app.
+"""
+import asyncio
+import dataclasses
+import hashlib
+import heapq
+import json
+import os
+import pathlib
+import tempfile
+from typing import Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+from twcompose.applied import DEFAULT_DRIFT_CHECK_INTERVAL, AppliedRulesStore
+from twcompose.cache import get_cache_dir
+from twcompose.compose import TwitterComposeModel
+from twcompose.concurrency import run_sync
+from twcompose.rules import TwitterRule
+from twcompose.twitter.aio import AsyncTwitterRuleAPI
+from twcompose.twitter.timeseries import DailyCountsStore, project_average
+from twcompose.utils import get_twitter_rule_api
+
+# Number of days of the stored daily counts used to estimate the volume
+VOLUME_DAYS = 7
+
+
+@dataclasses.dataclass
+class Shard:
+    """A collector of part of the stream groups of a project
+
+    Attributes:
+        project_name (str): The name of the collector of the shard
+        compose_config (TwitterComposeModel): The configuration with the
+            stream groups of the shard and its output sub-folder
+        credentials_file (pathlib.Path): The credentials of the Twitter app
+            of the shard
+    """
+
+    project_name: str
+    compose_config: TwitterComposeModel
+    credentials_file: pathlib.Path
+
+
+def get_shard_project_name(project_name: str, index: int) -> str:
+    return f"{project_name}-shard{index}"
+
+
+def get_collectors(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    credentials_file: pathlib.Path,
+) -> List[Tuple[str, pathlib.Path]]:
+    """Name and credentials of the collectors of the project"""
+    if not compose_config.shards:
+        return [(project_name, credentials_file)]
+    return [
+        (get_shard_project_name(project_name, i), pathlib.Path(shard.credentials))
+        for i, shard in enumerate(compose_config.shards)
+    ]
+
+
+def _default_store_path() -> pathlib.Path:
+    return get_cache_dir() / "shards"
+
+
+@dataclasses.dataclass
+class ShardsStore:
+    """JSON files of the shard collectors of each project at its last update
+
+    They give the Twitter apps of the shards removed from the compose file,
+    whose rules must be deleted.
+
+    Attributes:
+        path (pathlib.Path): The folder of the files.
+            Defaults to `shards` in the twcompose cache directory.
+    """
+
+    path: pathlib.Path = dataclasses.field(default_factory=_default_store_path)
+
+    def _get_file(self, project_name: str) -> pathlib.Path:
+        key = hashlib.sha256(project_name.encode()).hexdigest()
+        return self.path / f"{key}.json"
+
+    def load(self, project_name: str) -> List[Tuple[str, pathlib.Path]]:
+        """Name and credentials of the shard collectors, empty if unknown"""
+        try:
+            data = json.loads(self._get_file(project_name).read_text())
+            return [(name, pathlib.Path(path)) for name, path in data]
+        except (OSError, ValueError, TypeError):
+            return []
+
+    def save(
+        self, project_name: str, collectors: Sequence[Tuple[str, pathlib.Path]]
+    ) -> None:
+        if not collectors:
+            try:
+                self._get_file(project_name).unlink()
+            except FileNotFoundError:
+                pass
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path, suffix=".tmp", delete=False
+        ) as f:
+            json.dump([[name, str(path.absolute())] for name, path in collectors], f)
+        os.replace(f.name, self._get_file(project_name))
+
+
+def estimate_group_volumes(
+    compose_config: TwitterComposeModel, store: Optional[DailyCountsStore] = None
+) -> Dict[str, int]:
+    """Monthly volume of each stream group from the stored daily counts
+
+    Daily counts are stored by the `volume` command. Rules without counts
+    are estimated at the average volume of the other rules, or 1.
+    """
+    store = store or DailyCountsStore()
+    rule_volumes: Dict[str, Optional[int]] = {}
+    for rules in compose_config.streams.values():
+        for rule in rules:
+            daily_counts = store.load(rule.value)
+            last_days = sorted(daily_counts)[-VOLUME_DAYS:]
+            rule_volumes[rule.value] = (
+                project_average([daily_counts[d] for d in last_days])
+                if last_days
+                else None
+            )
+
+    known = [v for v in rule_volumes.values() if v is not None]
+    default_volume = max(1, sum(known) // len(known)) if known else 1
+    volumes = {
+        rule: default_volume if volume is None else volume
+        for rule, volume in rule_volumes.items()
+    }
+    return {
+        group: sum(volumes[r.value] for r in rules)
+        for group, rules in compose_config.streams.items()
+    }
+
+
+def assign_groups(
+    group_volumes: Mapping[str, int],
+    n_shards: int,
+    current: Optional[Mapping[str, int]] = None,
+) -> Dict[str, int]:
+    """Assigns stream groups to shards balancing their volume
+
+    Groups already on a shard stay there so their collection is not
+    interrupted. The other groups are placed from the largest to the
+    smallest on the least loaded shard (longest processing time first).
+
+    Returns:
+        dict[str, int]: The shard index of each stream group
+    """
+    assignment = {
+        group: shard
+        for group, shard in (current or {}).items()
+        if group in group_volumes and 0 <= shard < n_shards
+    }
+    loads = [0] * n_shards
+    for group, shard in assignment.items():
+        loads[shard] += group_volumes[group]
+
+    heap: List[Tuple[int, int]] = [(load, shard) for shard, load in enumerate(loads)]
+    heapq.heapify(heap)
+    new_groups = sorted(
+        (g for g in group_volumes if g not in assignment),
+        key=lambda g: (-group_volumes[g], g),
+    )
+    for group in new_groups:
+        load, shard = heapq.heappop(heap)
+        assignment[group] = shard
+        heapq.heappush(heap, (load + group_volumes[group], shard))
+    return assignment
+
+
+def current_assignment(
+    compose_config: TwitterComposeModel, shard_rules: Sequence[Set[TwitterRule]]
+) -> Dict[str, int]:
+    """The shard of each stream group from the rules installed on each shard"""
+    installed = [{r.identity() for r in rules} for rules in shard_rules]
+    assignment: Dict[str, int] = {}
+    for group, rules in compose_config.streams.items():
+        for shard, identities in enumerate(installed):
+            if any(
+                TwitterRule.from_rule_model(r).identity() in identities for r in rules
+            ):
+                assignment[group] = shard
+                break
+    return assignment
+
+
+def get_shards(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    assignment: Mapping[str, int],
+) -> List[Shard]:
+    """The configuration of the collector of each shard"""
+    output_folder = pathlib.Path(compose_config.output.path)
+    shards: List[Shard] = []
+    for index, shard in enumerate(compose_config.shards):
+        shard_config = compose_config.copy(
+            update={
+                "shards": [],
+                "streams": {
+                    group: rules
+                    for group, rules in compose_config.streams.items()
+                    if assignment.get(group) == index
+                },
+                "output": compose_config.output.copy(
+                    update={"path": str(output_folder / f"shard{index}")}
+                ),
+            }
+        )
+        shards.append(
+            Shard(
+                project_name=get_shard_project_name(project_name, index),
+                compose_config=shard_config,
+                credentials_file=pathlib.Path(shard.credentials),
+            )
+        )
+    return shards
+
+
+async def _get_shard_rules(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    drift_check: bool,
+    drift_check_interval: float,
+) -> List[Set[TwitterRule]]:
+    """The rules installed on each shard
+
+    The rules applied by the last update of a shard are used, they are
+    fetched from Twitter when unknown or when a drift check is needed.
+    """
+    store = AppliedRulesStore()
+
+    async def get_rules(index: int, credentials_file: pathlib.Path):
+        twitter_api = get_twitter_rule_api(credentials_file)
+        applied_rules = store.load(
+            twitter_api, get_shard_project_name(project_name, index)
+        )
+        if applied_rules is not None and not (
+            drift_check or applied_rules.needs_drift_check(drift_check_interval)
+        ):
+            return applied_rules.rules()
+        return await AsyncTwitterRuleAPI(twitter_api).get()
+
+    return await asyncio.gather(
+        *(
+            get_rules(index, pathlib.Path(shard.credentials))
+            for index, shard in enumerate(compose_config.shards)
+        )
+    )
+
+
+def plan_shards(
+    project_name: str,
+    compose_config: TwitterComposeModel,
+    drift_check: bool = False,
+    drift_check_interval: float = DEFAULT_DRIFT_CHECK_INTERVAL,
+) -> List[Shard]:
+    """Assigns the stream groups to the shards of a sharded project
+
+    Stream groups stay on the shard where their rules are installed,
+    new groups are assigned based on their estimated volume. The installed
+    rules are the ones applied by the last update of each shard, unless
+    they are unknown or need a drift check.
+    """
+    shard_rules = run_sync(
+        _get_shard_rules(
+            project_name, compose_config, drift_check, drift_check_interval
+        )
+    )
+    assignment = assign_groups(
+        estimate_group_volumes(compose_config),
+        len(compose_config.shards),
+        current_assignment(compose_config, shard_rules),
+    )
+    return get_shards(project_name, compose_config, assignment)
@@ -0,0 +1,65 @@
+"""Asyncio interface to the Twitter rules and counts endpoints
+
+Requests run in the executor of the event loop and share the pooled HTTP
+session, so the network calls of a command can be awaited concurrently.
+"""
+import asyncio
+import dataclasses
+from typing import AsyncIterator, Iterable, List, Set, Tuple
+
+from twcompose.concurrency import run_in_thread
+from twcompose.rules import TwitterRule, TwitterRuleAPI, TwitterRulesDiff, _Error
+from twcompose.twitter.counts import MonthlyTwitterCountEstimator
+
+
+@dataclasses.dataclass
+class AsyncTwitterRuleAPI:
+    """Awaitable version of `TwitterRuleAPI`"""
+
+    rule_api: TwitterRuleAPI
+
+    async def get(self) -> Set[TwitterRule]:
+        """Gets twitter rules"""
+        return await run_in_thread(self.rule_api.get)
+
+    async def post(
+        self, changes: TwitterRulesDiff, dry_run: bool = False
+    ) -> List[_Error]:
+        """Update twitter rules from the given changes"""
+        return await run_in_thread(self.rule_api.post, changes, dry_run=dry_run)
+
+
+@dataclasses.dataclass
+class AsyncMonthlyTwitterCountEstimator:
+    """Awaitable version of `MonthlyTwitterCountEstimator`"""
+
+    estimator: MonthlyTwitterCountEstimator
+
+    async def estimate(self, rule: str) -> int:
+        """Estimates the monthly number of tweets matching the given rule"""
+        return await run_in_thread(self.estimator.estimate, rule)
+
+    async def estimate_many(self, rules: Iterable[str]) -> List[int]:
+        """Estimates the given rules concurrently, results are in the same order"""
+        return list(await asyncio.gather(*(self.estimate(r) for r in rules)))
+
+    async def estimate_as_completed(
+        self, rules: Iterable[str], concurrency: int
+    ) -> AsyncIterator[Tuple[str, int]]:
+        """Estimates the given rules, yielding each one as soon as it is done
+
+        Args:
+            rules (Iterable[str]): Twitter rule queries
+            concurrency (int): Maximum number of requests in flight
+
+        Yields:
+            tuple[str, int]: The rule and its estimated monthly volume
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _estimate(rule: str) -> Tuple[str, int]:
+            async with semaphore:
+                return rule, await self.estimate(rule)
+
+        for next_estimate in asyncio.as_completed([_estimate(r) for r in rules]):
+            yield await next_estimate
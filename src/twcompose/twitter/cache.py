@@ -0,0 +1,100 @@
+"""Persistent cache of the responses of the tweet counts endpoint"""
+import dataclasses
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from twcompose.cache import get_cache_dir
+
+_Counts = List[Dict[str, Any]]
+
+
+def _default_cache_path() -> pathlib.Path:
+    return get_cache_dir() / "counts.sqlite"
+
+
+@dataclasses.dataclass
+class CountsCache:
+    """SQLite cache of tweet counts keyed by rule and query window
+
+    Entries expire after `ttl` and the least recently used entries are evicted
+    when the cached counts take more than `max_size` bytes. The SQLite
+    connection is closed by `close` or when used as a context manager.
+
+    Attributes:
+        path (pathlib.Path): The SQLite file.
+            Defaults to `counts.sqlite` in the twcompose cache directory.
+        ttl (float): Time to live of an entry in seconds. Defaults to 6 hours.
+        max_size (int): Maximum size in bytes of the cached counts.
+            Defaults to 64 MiB.
+    """
+
+    path: pathlib.Path = dataclasses.field(default_factory=_default_cache_path)
+    ttl: float = 6 * 60 * 60
+    max_size: int = 64 * 1024 * 1024
+
+    def __post_init__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared by the threads estimating rules concurrently
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS counts ("
+                "rule TEXT NOT NULL, window TEXT NOT NULL, counts TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (rule, window))"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "CountsCache":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def get(self, rule: str, window: str) -> Optional[_Counts]:
+        """The cached counts, `None` if missing or expired"""
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT counts FROM counts "
+                "WHERE rule = ? AND window = ? AND created_at > ?",
+                (rule, window, now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE counts SET accessed_at = ? WHERE rule = ? AND window = ?",
+                (now, rule, window),
+            )
+        return json.loads(row[0])
+
+    def set(self, rule: str, window: str, counts: _Counts) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?)",
+                (rule, window, json.dumps(counts), now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Removes expired entries and the least recently used above the size"""
+        self._connection.execute(
+            "DELETE FROM counts WHERE created_at <= ?", (time.time() - self.ttl,)
+        )
+        # Total size of the entries used more recently than each entry
+        self._connection.execute(
+            "DELETE FROM counts WHERE rowid IN ("
+            "SELECT rowid FROM (SELECT rowid, SUM(LENGTH(counts)) OVER ("
+            "ORDER BY accessed_at DESC, rowid DESC) AS total_size FROM counts) "
+            "WHERE total_size > ?)",
+            (self.max_size,),
+        )
@@ -1,8 +1,8 @@
 from functools import lru_cache
 
-import tweepy
+from twcompose.twitter.http import TwitterHTTPClient
 
 
 @lru_cache(1)  # Only one client per twitter-compose command
-def twitter_client_factory(twitter_token: str) -> tweepy.Client:
-    return tweepy.Client(twitter_token, wait_on_rate_limit=True)
+def twitter_client_factory(twitter_token: str) -> TwitterHTTPClient:
+    return TwitterHTTPClient(twitter_token)
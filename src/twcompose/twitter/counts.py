@@ -1,8 +1,28 @@
 """Interface to get the monthly estimated number of tweets for a query"""
 import dataclasses
-from typing import ClassVar, cast
+import datetime
+from typing import Any, Dict, List, Optional
 
-import tweepy
+from typing_extensions import Literal
+
+from twcompose.profiling import annotate, span
+from twcompose.twitter.cache import CountsCache
+from twcompose.twitter.http import TwitterHTTPClient, get_twitter_api_url
+from twcompose.twitter.ratelimit import TokenBucket
+from twcompose.twitter.timeseries import (
+    SECONDS_PER_DAY,
+    DailyCountsStore,
+    from_epoch_day,
+    parse_twitter_datetime,
+    project_average,
+    project_trend,
+    to_epoch_day,
+)
+
+# Number of days covered by the recent counts endpoint
+RECENT_DAYS = 7
+
+Projection = Literal["average", "trend"]
 
 
 @dataclasses.dataclass
@@ -10,13 +30,81 @@ class MonthlyTwitterCountEstimator:
     """Estimate the monthly number of tweets for a rule
 
     Attributes:
-        tweepy_client (tweepy.Client): The tweepy Client
-            used to call the Twitter API.
+        twitter_client (TwitterHTTPClient): The client used to call the Twitter API.
+        rate_limiter (TokenBucket | None, optional): Shared by the threads
+            estimating rules concurrently. Defaults to `None`.
+        cache (CountsCache | None, optional): Cache checked before calling
+            Twitter. Defaults to `None`.
+        refresh (bool): Ignores cached counts, the cache is still updated.
+            Defaults to `False`.
+        store (DailyCountsStore | None, optional): Keeps the daily counts of
+            the rules so that only the days since the last run are fetched.
+            Defaults to `None`.
+        projection (str): `average` projects the average daily count of the
+            last week, `trend` fits a linear trend on the stored daily counts.
+            Requires a store. Defaults to `average`.
+        history_days (int): Number of stored days used by the `trend`
+            projection. Defaults to 28.
     """
 
-    tweepy_client: tweepy.Client
+    twitter_client: TwitterHTTPClient
+    rate_limiter: Optional[TokenBucket] = None
+    cache: Optional[CountsCache] = None
+    refresh: bool = False
+    store: Optional[DailyCountsStore] = None
+    projection: Projection = "average"
+    history_days: int = 28
+
+    url_tweets_counts: str = dataclasses.field(
+        init=False,
+        default_factory=lambda: f"{get_twitter_api_url()}/2/tweets/counts/recent",
+    )
+
+    def get_counts(
+        self,
+        rule: str,
+        granularity: str = "day",
+        start_time: Optional[datetime.datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Gets the number of tweets matching the rule per time bucket
+
+        Args:
+            rule (str): Twitter rule query
+            granularity (str): One of `minute`, `hour` or `day`
+            start_time (datetime | None, optional): The oldest time to count
+                tweets from. Defaults to 7 days ago.
+
+        Returns:
+            list[dict]: Buckets with `start`, `end` and `tweet_count`
+        """
+        params = {"query": rule, "granularity": granularity}
+        if start_time is not None:
+            params["start_time"] = start_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        window = ":".join(["recent", granularity, params.get("start_time", "")])
+        if self.cache is not None and not self.refresh:
+            cached_counts = self.cache.get(rule, window)
+            if cached_counts is not None:
+                return cached_counts
+
+        if self.rate_limiter is not None:
+            with span("rate limiter"):
+                annotate(rate_limit_wait=self.rate_limiter.acquire())
+        headers: Dict[str, str] = {}
+        try:
+            response = self.twitter_client.request(
+                "get",
+                self.url_tweets_counts,
+                params=params,
+            )
+            headers = dict(response.headers)
+        finally:
+            if self.rate_limiter is not None:
+                self.rate_limiter.update_from_headers(headers)
 
-    url_tweets_counts: ClassVar[str] = "https://api.twitter.com/2/tweets/counts/recent"
+        counts: List[Dict[str, Any]] = response.json().get("data", [])
+        if self.cache is not None:
+            self.cache.set(rule, window, counts)
+        return counts
 
     def estimate(self, rule: str) -> int:
         """Estimates the monthly number of tweets matching the given rule
@@ -27,17 +115,66 @@ class MonthlyTwitterCountEstimator:
         Returns:
             int: Estimated monthly number of tweets
         """
+        if self.store is not None:
+            return self._estimate_from_store(rule, self.store)
+
         # Calling the twitter API
-        response = cast(
-            tweepy.Response,
-            self.tweepy_client.get_recent_tweets_count(rule, granularity="day"),
-        )
+        counts = self.get_counts(rule, granularity="day")
 
         # No matching tweets
-        if response.data is None:
+        if not counts:
             return 0
 
         # Returning the estimated number of tweet for 31 days
-        return int(
-            sum(r["tweet_count"] for r in response.data) / len(response.data) * 31
+        return int(sum(r["tweet_count"] for r in counts) / len(counts) * 31)
+
+    def update_daily_counts(self, rule: str, store: DailyCountsStore) -> Dict[int, int]:
+        """Fetches the complete days missing from the store
+
+        Returns:
+            dict[int, int]: All stored daily counts of the rule by epoch day
+        """
+        today = to_epoch_day(datetime.datetime.now(datetime.timezone.utc))
+        daily_counts = store.load(rule)
+
+        # Complete days covered by the recent endpoint, today is not over
+        missing_days = [
+            day
+            for day in range(today - RECENT_DAYS + 1, today)
+            if self.refresh or day not in daily_counts
+        ]
+        if not missing_days:
+            return daily_counts
+
+        fetched: Dict[int, int] = {}
+        for bucket in self.get_counts(
+            rule, granularity="day", start_time=from_epoch_day(missing_days[0])
+        ):
+            start = parse_twitter_datetime(bucket["start"])
+            end = parse_twitter_datetime(bucket["end"])
+            # Skipping partial days
+            if (end - start).total_seconds() < SECONDS_PER_DAY:
+                continue
+            fetched[to_epoch_day(start)] = bucket["tweet_count"]
+        return store.update(rule, fetched)
+
+    def _estimate_from_store(self, rule: str, store: DailyCountsStore) -> int:
+        daily_counts = self.update_daily_counts(rule, store)
+        last_day = max(daily_counts, default=0)
+
+        if self.projection == "trend":
+            return project_trend(
+                {
+                    day: count
+                    for day, count in daily_counts.items()
+                    if day > last_day - self.history_days
+                }
+            )
+
+        return project_average(
+            [
+                count
+                for day, count in daily_counts.items()
+                if day > last_day - RECENT_DAYS
+            ]
         )
@@ -0,0 +1,245 @@
+"""Pooled HTTP session with retries to call the Twitter API"""
+import dataclasses
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+from functools import lru_cache
+from typing import Dict, FrozenSet, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from twcompose.profiling import annotate, span
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_TWITTER_API_URL = "https://api.twitter.com"
+
+
+def get_twitter_api_url() -> str:
+    """Base URL of the Twitter API
+
+    Defined by `TWCOMPOSE_TWITTER_API_URL` to use a local stand-in
+    of the API, otherwise `https://api.twitter.com`.
+    """
+    url = os.environ.get("TWCOMPOSE_TWITTER_API_URL") or DEFAULT_TWITTER_API_URL
+    return url.rstrip("/")
+
+
+@lru_cache(1)  # Only one session shared by all commands of the process
+def get_http_session() -> requests.Session:
+    """Keep-alive session with a connection pool to the Twitter API"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class CircuitOpenError(Exception):
+    """Raised when requests are refused after too many consecutive failures"""
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """Retries on server errors and connection errors
+
+    Attributes:
+        max_retries (int): Maximum number of retries of a request.
+            Defaults to 3.
+        backoff_factor (float): Delay in seconds before the first retry,
+            doubled at each following retry. Defaults to 0.5.
+        max_backoff (float): Maximum delay in seconds between two retries.
+            Defaults to 30.
+        retry_statuses (frozenset[int]): HTTP statuses that are retried.
+        max_rate_limit_wait (float): Maximum total time in seconds spent
+            waiting for rate limits by a request. Defaults to 900, the
+            length of the Twitter rate limit windows.
+    """
+
+    max_retries: int = 3
+    backoff_factor: float = 0.5
+    max_backoff: float = 30.0
+    retry_statuses: FrozenSet[int] = frozenset({500, 502, 503, 504})
+    max_rate_limit_wait: float = 900.0
+
+    def backoff(self, retry: int) -> float:
+        """Delay in seconds before the given retry (starting at 0)
+
+        The exponential delay is jittered between half and full value
+        to avoid synchronised retries between clients.
+        """
+        delay = min(self.max_backoff, self.backoff_factor * 2**retry)
+        return random.uniform(delay / 2, delay)
+
+
+@dataclasses.dataclass
+class CircuitBreaker:
+    """Stops calling the Twitter API after consecutive failures
+
+    Once opened, requests are refused until `reset_timeout` is elapsed.
+    Then, a single request is let through and closes the circuit on success.
+
+    Attributes:
+        failure_threshold (int): Number of consecutive failed requests
+            that opens the circuit. Defaults to 5.
+        reset_timeout (float): Time in seconds before trying again.
+            Defaults to 60.
+    """
+
+    failure_threshold: int = 5
+    reset_timeout: float = 60.0
+
+    def __post_init__(self):
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raises CircuitOpenError if requests are currently refused"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    f"Twitter API failed {self._failures} times in a row, "
+                    f"retrying after {self.reset_timeout} seconds"
+                )
+            # Half-open: letting this request through, failing again re-opens
+            self._opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+_circuit_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(twitter_token: str) -> CircuitBreaker:
+    """Circuit breaker shared by the clients of a token in the process"""
+    with _circuit_breakers_lock:
+        return _circuit_breakers.setdefault(
+            (get_twitter_api_url(), twitter_token), CircuitBreaker()
+        )
+
+
+@dataclasses.dataclass
+class TwitterHTTPClient:
+    """Authenticated requests to the Twitter API with retries
+
+    Attributes:
+        twitter_token (str): The Twitter bearer token
+        retry_policy (RetryPolicy): Retries for server and connection errors
+        circuit_breaker (CircuitBreaker | None): Stops requests after consecutive
+            failures. Defaults to the circuit breaker of the token.
+        session (requests.Session): Defaults to the session shared by the process
+    """
+
+    twitter_token: str
+    retry_policy: RetryPolicy = dataclasses.field(default_factory=RetryPolicy)
+    circuit_breaker: Optional[CircuitBreaker] = None
+    session: requests.Session = dataclasses.field(default_factory=get_http_session)
+
+    def __post_init__(self):
+        if self.circuit_breaker is None:
+            self.circuit_breaker = get_circuit_breaker(self.twitter_token)
+
+    def _rate_limit_wait(self, response: requests.Response) -> float:
+        """Time to wait in seconds before the rate limit is reset
+
+        At least a second, so that a stale reset time still counts
+        against the maximum rate limit wait.
+        """
+        reset = response.headers.get("x-rate-limit-reset")
+        if reset is None:
+            return self.retry_policy.max_backoff
+        return max(1.0, int(reset) - time.time())
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with span(f"{method.upper()} {urllib.parse.urlsplit(url).path}"):
+            return self._request(method, url, **kwargs)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("headers", {})
+        kwargs["headers"].setdefault("Authorization", f"Bearer {self.twitter_token}")
+        assert self.circuit_breaker is not None
+        retries = 0
+        rate_limit_wait = 0.0
+        start = time.perf_counter()
+        while True:
+            self.circuit_breaker.before_request()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.circuit_breaker.record_failure()
+                if retries >= self.retry_policy.max_retries:
+                    raise
+                delay = self.retry_policy.backoff(retries)
+                _logger.info(
+                    f"Connection error to Twitter ({e}), retrying in {delay:.2f}s"
+                )
+                retries += 1
+                annotate(retries=retries)
+                time.sleep(delay)
+                continue
+
+            # If we hit a rate limit, we wait and continue to the next loop
+            if response.status_code == 429:
+                time_to_sleep = self._rate_limit_wait(response)
+                max_wait = self.retry_policy.max_rate_limit_wait
+                if rate_limit_wait + time_to_sleep <= max_wait:
+                    _logger.info(
+                        "Too many requests to Twitter, waiting for rate limit: "
+                        f"{time_to_sleep} seconds"
+                    )
+                    rate_limit_wait += time_to_sleep
+                    annotate(rate_limit_wait=rate_limit_wait)
+                    time.sleep(time_to_sleep)
+                    continue
+                # Otherwise failing like the other exhausted retries
+                _logger.info(f"Rate limit of Twitter not reset after {max_wait}s")
+
+            if (
+                response.status_code in self.retry_policy.retry_statuses
+                and retries < self.retry_policy.max_retries
+            ):
+                self.circuit_breaker.record_failure()
+                delay = self.retry_policy.backoff(retries)
+                _logger.info(
+                    f"Received status {response.status_code} from Twitter, "
+                    f"retrying in {delay:.2f}s"
+                )
+                retries += 1
+                annotate(retries=retries)
+                time.sleep(delay)
+                continue
+
+            annotate(status=response.status_code)
+            if response.status_code >= 500:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            _logger.info(
+                f"{method.upper()} {url} returned {response.status_code} "
+                f"in {time.perf_counter() - start:.3f}s with {retries} retries"
+            )
+
+            # Otherwise proceed normally and raise for abnormal status
+            if not response.ok:
+                _logger.info(
+                    f"Received error from Twitter with payload: {response.text}"
+                )
+                response.raise_for_status()
+            return response
@@ -0,0 +1,66 @@
+"""Tweet rates statistics from the buckets of the counts endpoint"""
+import dataclasses
+import math
+from typing import Any, Dict, Iterable, List, Mapping, Sequence
+
+from twcompose.twitter.timeseries import parse_twitter_datetime
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of the values, `q` is between 0 and 100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def bucket_rates(buckets: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Tweets per second of each bucket by bucket start time"""
+    rates: Dict[str, float] = {}
+    for bucket in buckets:
+        start = parse_twitter_datetime(bucket["start"])
+        end = parse_twitter_datetime(bucket["end"])
+        duration = (end - start).total_seconds()
+        if duration > 0:
+            rates[bucket["start"]] = bucket["tweet_count"] / duration
+    return rates
+
+
+def sum_rates(all_rates: Iterable[Mapping[str, float]]) -> Dict[str, float]:
+    """Sums the rates of the buckets starting at the same time
+
+    Tweets matching several rules are counted once per rule,
+    so the sum is an upper bound of the rate of the combined rules.
+    """
+    total: Dict[str, float] = {}
+    for rates in all_rates:
+        for start, rate in rates.items():
+            total[start] = total.get(start, 0.0) + rate
+    return total
+
+
+@dataclasses.dataclass
+class RateStats:
+    """Statistics of a tweet rate in tweets per second"""
+
+    p50: float
+    p95: float
+    max: float
+
+    @classmethod
+    def from_rates(cls, rates: Iterable[float]) -> "RateStats":
+        values: List[float] = list(rates)
+        return cls(
+            p50=percentile(values, 50),
+            p95=percentile(values, 95),
+            max=max(values, default=0.0),
+        )
+
+    def scale(self, factor: float) -> "RateStats":
+        return RateStats(
+            p50=self.p50 * factor, p95=self.p95 * factor, max=self.max * factor
+        )
+
+    def to_dict(self, ndigits: int = 3) -> Dict[str, float]:
+        return {k: round(v, ndigits) for k, v in dataclasses.asdict(self).items()}
@@ -0,0 +1,93 @@
+"""Client-side rate limiting from the Twitter rate limit headers"""
+import dataclasses
+import threading
+import time
+from typing import Mapping, Optional
+
+
+@dataclasses.dataclass
+class TokenBucket:
+    """Token bucket shared by the threads calling a Twitter endpoint
+
+    The bucket starts with a single token so that the first request gets
+    the rate limit headers of the endpoint. They are used to size the bucket
+    (see `update_from_headers`), which must be called once for every token
+    taken with `acquire`.
+
+    Attributes:
+        capacity (float): Maximum number of tokens in the bucket
+        refill_rate (float): Tokens added per second when the end of the
+            rate limit window is unknown
+    """
+
+    capacity: float = 1.0
+    refill_rate: float = 1.0
+
+    def __post_init__(self):
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._reset_at: Optional[float] = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if self._reset_at is None:
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_rate)
+        elif now >= self._reset_at:
+            # The rate limit window is over, the whole limit is available again
+            self._tokens = self.capacity
+            self._reset_at = None
+        self._updated_at = now
+
+    def acquire(self) -> float:
+        """Takes a token, blocking until one is available
+
+        Returns:
+            float: The time spent waiting in seconds
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return waited
+                if self._reset_at is None:
+                    wait = (1 - self._tokens) / self.refill_rate
+                else:
+                    wait = self._reset_at - now
+            wait = max(wait, 0.01)
+            time.sleep(wait)
+            waited += wait
+
+    def update_from_headers(
+        self, headers: Mapping[str, str], window: float = 15 * 60
+    ) -> None:
+        """Sizes the bucket from the `x-rate-limit-*` response headers
+
+        Twitter limits requests per window of 15 minutes. The bucket holds
+        the number of remaining requests and is refilled at the end of the
+        window. Then, it refills at the average rate of the limit until the
+        next response gives the new window.
+        Responses without rate limit headers only release their request.
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            try:
+                limit = int(headers["x-rate-limit-limit"])
+                remaining = int(headers["x-rate-limit-remaining"])
+                reset = int(headers["x-rate-limit-reset"])
+            except (KeyError, ValueError):
+                return
+
+            now = time.monotonic()
+            self.capacity = float(max(limit, 1))
+            self.refill_rate = self.capacity / window
+            # The server count is authoritative minus the requests
+            # that are still in flight
+            self._tokens = float(max(0, remaining - self._in_flight))
+            self._reset_at = now + max(0.0, reset - time.time())
+            self._updated_at = now
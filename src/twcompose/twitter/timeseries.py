@@ -0,0 +1,112 @@
+"""Local store of the daily number of tweets matching a rule"""
+import array
+import dataclasses
+import datetime
+import hashlib
+import os
+import pathlib
+from typing import Dict, List, Mapping, Sequence
+
+from twcompose.cache import get_cache_dir
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _default_store_path() -> pathlib.Path:
+    return get_cache_dir() / "daily-counts"
+
+
+def parse_twitter_datetime(value: str) -> datetime.datetime:
+    """Parses dates returned by Twitter such as `2022-11-01T00:00:00.000Z`"""
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def to_epoch_day(date: datetime.datetime) -> int:
+    """Number of days since 1970-01-01 in UTC"""
+    return int(date.timestamp()) // SECONDS_PER_DAY
+
+
+def from_epoch_day(day: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(day * SECONDS_PER_DAY, datetime.timezone.utc)
+
+
+@dataclasses.dataclass
+class DailyCountsStore:
+    """Daily tweet counts per rule, in one binary file per rule
+
+    Each file is an array of 64 bits integers alternating the epoch day
+    and the number of tweets of that day, sorted by day.
+
+    Attributes:
+        path (pathlib.Path): The folder holding the files.
+            Defaults to `daily-counts` in the twcompose cache directory.
+    """
+
+    path: pathlib.Path = dataclasses.field(default_factory=_default_store_path)
+
+    def rule_path(self, rule: str) -> pathlib.Path:
+        return self.path / f"{hashlib.sha1(rule.encode()).hexdigest()}.bin"
+
+    def load(self, rule: str) -> Dict[int, int]:
+        """The daily counts of the rule by epoch day"""
+        values = array.array("q")
+        try:
+            with self.rule_path(rule).open("rb") as f:
+                values.frombytes(f.read())
+        except FileNotFoundError:
+            return {}
+        return dict(zip(values[::2], values[1::2]))
+
+    def update(self, rule: str, counts: Mapping[int, int]) -> Dict[int, int]:
+        """Adds the daily counts of the rule
+
+        Returns:
+            dict[int, int]: All the daily counts of the rule
+        """
+        all_counts = self.load(rule)
+        all_counts.update(counts)
+
+        values = array.array("q")
+        for day in sorted(all_counts):
+            values.extend((day, all_counts[day]))
+
+        # Writing to a temporary file first to never leave a partial file
+        self.path.mkdir(parents=True, exist_ok=True)
+        rule_path = self.rule_path(rule)
+        tmp_path = rule_path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            values.tofile(f)
+        os.replace(tmp_path, rule_path)
+        return all_counts
+
+
+def project_average(counts: Sequence[int], days: int = 31) -> int:
+    """Projects the number of tweets over `days` from the average daily count"""
+    if not counts:
+        return 0
+    return int(sum(counts) / len(counts) * days)
+
+
+def project_trend(daily_counts: Mapping[int, int], days: int = 31) -> int:
+    """Projects the number of tweets over the next `days` with a linear trend
+
+    The trend is a least squares fit of the daily counts by epoch day.
+    Projected daily counts cannot be negative.
+    """
+    n = len(daily_counts)
+    if n < 2:
+        return project_average(list(daily_counts.values()), days)
+
+    mean_x = sum(daily_counts) / n
+    mean_y = sum(daily_counts.values()) / n
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in daily_counts.items())
+    variance = sum((x - mean_x) ** 2 for x in daily_counts)
+    slope = covariance / variance
+    intercept = mean_y - slope * mean_x
+
+    last_day = max(daily_counts)
+    projected: List[float] = [
+        max(0.0, intercept + slope * x)
+        for x in range(last_day + 1, last_day + 1 + days)
+    ]
+    return int(sum(projected))
@@ -1,24 +1,33 @@
 import pathlib
-from typing import Iterable, Set, Union
+from typing import Callable, Iterable, Set, Union
 
 import yaml
+from twcollect.config import parse_credentials_file
 
 from twcompose.backends.abstract import AbstractCollectionBackend
 from twcompose.compose import TwitterComposeModel
-from twcompose.rules import TwitterRule
+from twcompose.rules import TwitterRule, TwitterRuleAPI
 
 
 def print_object_as_yaml(o: Union[dict, Iterable], **kwargs) -> None:
     print(yaml.safe_dump(o), **kwargs)
 
 
-def ensure_backend_stopped(backend: AbstractCollectionBackend, project_name: str):
+def format_object_as_yaml(o: Union[dict, Iterable]) -> str:
+    return yaml.safe_dump(o).rstrip("\n")
+
+
+def ensure_backend_stopped(
+    backend: AbstractCollectionBackend,
+    project_name: str,
+    print_func: Callable[[str], None] = print,
+):
     if backend.is_running(project_name):
-        print(f"Stopping stream collector {project_name}...")
+        print_func(f"Stopping stream collector {project_name}...")
         backend.stop(project_name)
-        print(f"Stopping stream collector {project_name}... Done.")
+        print_func(f"Stopping stream collector {project_name}... Done.")
     else:
-        print(f"Already stopped stream collector {project_name}.")
+        print_func(f"Already stopped stream collector {project_name}.")
 
 
 def update_backend(
@@ -26,10 +35,11 @@ def update_backend(
     project_name: str,
     compose_config: TwitterComposeModel,
     credentials_file: pathlib.Path,
+    print_func: Callable[[str], None] = print,
 ):
-    print(f"Starting stream collector {project_name}...")
+    print_func(f"Starting stream collector {project_name}...")
     backend.update(project_name, compose_config, credentials_file)
-    print(f"Starting stream collector {project_name}... Done.")
+    print_func(f"Starting stream collector {project_name}... Done.")
 
 
 def get_rules_from_compose_config(
@@ -40,3 +50,10 @@ def get_rules_from_compose_config(
         for rules in compose_config.streams.values()
         for r in rules
     }
+
+
+def get_twitter_rule_api(credentials_file: pathlib.Path) -> TwitterRuleAPI:
+    """Connection to the Twitter rules endpoint with the token of the project"""
+    credentials = parse_credentials_file(credentials_file)
+    twitter_token = credentials.__root__["twitter_token"]
+    return TwitterRuleAPI(twitter_token)
@@ -0,0 +1,147 @@
+"""Timing helpers and JSON baselines of the benchmarks
+
+Timings are stored relative to a fixed pure Python workload, timed again
+next to each measure, so that baselines recorded on a machine can roughly be
+compared on another one. Regressions are reported as warnings, set
+`TWCOMPOSE_STRICT_BENCHMARKS=1` to fail on them instead. Baselines are only
+written with `TWCOMPOSE_UPDATE_BASELINES=1`, which records the current measures.
+"""
+import gc
+import json
+import os
+import pathlib
+import statistics
+import time
+import warnings
+from typing import Callable, Dict, Iterator
+
+import pytest
+
+BASELINES_DIR = pathlib.Path(__file__).parent / "baselines"
+# Timings are noisy, failing only on significant regressions
+BASELINE_TOLERANCE = 1.5
+
+
+class BenchmarkRegression(UserWarning):
+    """A measure significantly worse than its baseline"""
+
+
+def _is_set(variable: str) -> bool:
+    return os.environ.get(variable, "") not in ("", "0")
+
+
+def _best_time(func: Callable[[], object], repeat: int = 3) -> float:
+    """Best wall-clock time in seconds of `repeat` calls to `func`
+
+    The garbage collector is disabled while timing like `timeit` does.
+    """
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return min(timings)
+
+
+def _calibration_workload() -> None:
+    values = {}
+    for i in range(200_000):
+        values[str(i)] = i
+    sorted(values.items(), key=lambda item: -item[1])
+
+
+@pytest.fixture
+def best_time() -> Callable[..., float]:
+    return _best_time
+
+
+def _median_time(func: Callable[[], object], repeat: int = 5) -> float:
+    """Median of the best times of `func` over `repeat` rounds"""
+    return statistics.median(_best_time(func) for _ in range(repeat))
+
+
+def _relative_time(seconds: float) -> float:
+    """A timing in seconds relative to the time of the reference workload"""
+    return round(seconds / _median_time(_calibration_workload), 6)
+
+
+@pytest.fixture
+def relative_time() -> Callable[[float], float]:
+    """Converts a timing in seconds to a time relative to the reference workload
+
+    The reference workload is timed when converting, so that the measure
+    should be converted right after it is taken.
+    """
+    return _relative_time
+
+
+@pytest.fixture
+def update_baselines() -> bool:
+    """Whether to record the current measures as baselines"""
+    return _is_set("TWCOMPOSE_UPDATE_BASELINES")
+
+
+@pytest.fixture
+def check_slowdown() -> Callable[[str, float, float], None]:
+    """Reports a measure `slowdown` times worse than its baseline
+
+    Only slowdowns above `tolerance` are reported, as warnings
+    unless `TWCOMPOSE_STRICT_BENCHMARKS=1`.
+    """
+
+    def check(name: str, slowdown: float, tolerance: float) -> None:
+        if slowdown <= tolerance:
+            return
+        message = f"{name} is {slowdown:.2f} times slower than its baseline"
+        if _is_set("TWCOMPOSE_STRICT_BENCHMARKS"):
+            pytest.fail(message)
+        warnings.warn(message, BenchmarkRegression)
+
+    return check
+
+
+@pytest.fixture(scope="module")
+def baselines(request) -> Iterator[Dict[str, float]]:
+    """Baselines of the benchmark module
+
+    They are only written back with `TWCOMPOSE_UPDATE_BASELINES=1`.
+    """
+    baseline_file = BASELINES_DIR / f"{request.module.__name__}.json"
+    values: Dict[str, float] = {}
+    if baseline_file.exists():
+        values = json.loads(baseline_file.read_text())
+    recorded = dict(values)
+    yield values
+    if _is_set("TWCOMPOSE_UPDATE_BASELINES") and values != recorded:
+        baseline_file.write_text(json.dumps(values, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture
+def check_baseline(
+    baselines: Dict[str, float],
+    update_baselines: bool,
+    check_slowdown: Callable[[str, float, float], None],
+) -> Callable[[str, float], None]:
+    """Compares a timing in seconds to its baseline
+
+    The reference workload is timed right after the measure, so that
+    both are affected alike by the load of the machine at that time.
+    Benchmarks without a baseline are skipped.
+    """
+
+    def check(name: str, seconds: float) -> None:
+        relative = _relative_time(seconds)
+        if update_baselines:
+            baselines[name] = relative
+            return
+        if name not in baselines:
+            pytest.skip(f"No baseline for {name}, set TWCOMPOSE_UPDATE_BASELINES=1")
+        check_slowdown(name, relative / baselines[name], BASELINE_TOLERANCE)
+
+    return check
@@ -0,0 +1,83 @@
+"""Cold start of the CLI measured with `python -X importtime`
+
+Set `TWCOMPOSE_UPDATE_BASELINES=1` to record the current measures as baseline.
+"""
+import json
+import pathlib
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import pytest
+
+pytestmark = pytest.mark.benchmark
+
+BASELINE_FILE = pathlib.Path(__file__).parent / "baselines" / "cli_startup.json"
+# Heavy modules that commands should only import if they need them
+LAZY_MODULES = {
+    "config": ["docker", "requests"],
+}
+# Import times are noisy, failing only on significant regressions
+TIME_TOLERANCE = 1.5
+MODULES_TOLERANCE = 1.1
+
+COMPOSE_FILE = """
+image_tag: "0.1.0"
+output: {driver: local, path: ./data/, options: {}}
+parameters: {}
+streams: {cop26: [{tag: cop26, value: "#cop26"}]}
+"""
+
+
+def import_times(args: List[str], cwd: pathlib.Path) -> Dict[str, Tuple[int, int]]:
+    """Self and cumulative import times in microseconds of top-level imports"""
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times: Dict[str, Tuple[int, int]] = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_time), int(cumulative))
+    return times
+
+
+@pytest.mark.parametrize("command", ["config"])
+def test_cli_startup(
+    command, tmp_path, monkeypatch, update_baselines, relative_time, check_slowdown
+):
+    (tmp_path / "twitter-compose.yml").write_text(COMPOSE_FILE)
+    (tmp_path / "credentials.yml").write_text("twitter_token: token")
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+    interpreter = import_times(["-c", "pass"], tmp_path)
+    times = import_times(["-m", "twcompose", command], tmp_path)
+
+    # Only the modules imported by twcompose
+    modules = set(times) - set(interpreter)
+    for lazy_module in LAZY_MODULES.get(command, []):
+        assert lazy_module not in modules
+    measures = {
+        "modules": len(modules),
+        # Relative to the reference workload, like the other baselines
+        "import_time": relative_time(sum(times[m][0] for m in modules) / 1e6),
+    }
+
+    baselines = json.loads(BASELINE_FILE.read_text())
+    if update_baselines:
+        baselines[command] = measures
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=2) + "\n")
+        return
+    if command not in baselines:
+        pytest.skip(f"No baseline for {command}, set TWCOMPOSE_UPDATE_BASELINES=1")
+    baseline = baselines[command]
+    assert measures["modules"] <= baseline["modules"] * MODULES_TOLERANCE
+    check_slowdown(
+        f"twitter-compose {command} import time",
+        measures["import_time"] / baseline["import_time"],
+        TIME_TOLERANCE,
+    )
@@ -0,0 +1,43 @@
+import pathlib
+
+import pytest
+
+from twcompose.compose import parse_compose_file
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [1_000, 10_000]
+
+
+def write_compose_file(path: pathlib.Path, size: int) -> pathlib.Path:
+    lines = [
+        'image_tag: "0.1.0"',
+        "output: {driver: local, path: ./data/, options: {}}",
+        "parameters: {tweet_fields: [text, author_id]}",
+        "streams:",
+    ]
+    for group in range(size // 10):
+        lines.append(f"  group_{group}:")
+        for i in range(10):
+            lines.append(f"    - {{tag: tag_{group}_{i}, value: 'rule {group} {i}'}}")
+    path.write_text("\n".join(lines))
+    return path
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_parse_compose_file_cold_warm(size, best_time, tmp_path, monkeypatch):
+    compose_file = write_compose_file(tmp_path / "twitter-compose.yml", size)
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(cache_dir))
+
+    def cold_parse():
+        for cached_file in cache_dir.glob("compose/*.json"):
+            cached_file.unlink()
+        parse_compose_file(compose_file)
+
+    cold = best_time(cold_parse)
+    parse_compose_file(compose_file)
+    warm = best_time(lambda: parse_compose_file(compose_file))
+    print(f"parse_compose_file({size} rules): cold {cold * 1000:.1f} ms", end="")
+    print(f", warm {warm * 1000:.1f} ms")
+    assert warm < cold
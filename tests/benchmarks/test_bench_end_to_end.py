@@ -0,0 +1,85 @@
+"""Latency and throughput of fleet commands against the fake Twitter API"""
+import pathlib
+import time
+
+import pytest
+
+from twcompose.backends.memory import BackendLatencies, InMemoryCollectionBackend
+from twcompose.commands import fleet
+
+pytestmark = pytest.mark.benchmark
+
+PROJECTS = 16
+COMPOSE_FILE = """
+image_tag: "0.1.0"
+output: {driver: local, path: ./data/, options: {}}
+parameters: {}
+streams:
+"""
+# Latencies of a remote API and of a local Docker daemon
+API_LATENCY = 0.05
+BACKEND_LATENCIES = BackendLatencies(diff=0.01, update=0.2, stop=0.1, is_running=0.01)
+
+
+@pytest.fixture
+def fleet_dir(tmp_path) -> pathlib.Path:
+    for i in range(PROJECTS):
+        project = tmp_path / "fleet" / f"project{i}"
+        project.mkdir(parents=True)
+        streams = "".join(
+            f"  group{j}: [{{tag: group{j}, value: 'rule {i} {j}'}}]\n"
+            for j in range(10)
+        )
+        (project / "twitter-compose.yml").write_text(COMPOSE_FILE + streams)
+        # Each project has its own Twitter app
+        (project / "credentials.yml").write_text(f"twitter_token: token{i}\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize("workers", [1, 8])
+def test_fleet_update(workers, fleet_dir, fake_twitter, monkeypatch, capsys):
+    fake_twitter.state.latency = API_LATENCY
+    backend = InMemoryCollectionBackend(latencies=BACKEND_LATENCIES)
+    monkeypatch.setattr(fleet, "get_collections_backend", lambda config: backend)
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(fleet_dir / "cache"))
+
+    def fleet_up():
+        fleet.fleet_update_command(
+            "fleet",
+            None,
+            pathlib.Path("credentials.yml"),
+            [fleet_dir / "fleet"],
+            workers=workers,
+        )
+
+    # Installing the rules and starting the collectors
+    start = time.perf_counter()
+    fleet_up()
+    first_run = time.perf_counter() - start
+
+    # Nothing to do
+    start = time.perf_counter()
+    fleet_up()
+    no_op = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fleet.fleet_status_command(
+        "fleet",
+        None,
+        pathlib.Path("credentials.yml"),
+        [fleet_dir / "fleet"],
+        workers=workers,
+    )
+    status = time.perf_counter() - start
+
+    output = capsys.readouterr().out
+    assert output.count(f"{PROJECTS} project(s) succeeded") == 3
+    assert backend.calls["update"] == PROJECTS
+    with capsys.disabled():
+        print(
+            f"\nfleet up ({workers} workers): "
+            f"{PROJECTS / first_run:.1f} projects/s updated, "
+            f"{PROJECTS / no_op:.1f} projects/s up to date, "
+            f"{PROJECTS / status:.1f} projects/s status, "
+            f"{len(fake_twitter.state.requests)} API requests"
+        )
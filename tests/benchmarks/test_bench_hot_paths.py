@@ -0,0 +1,139 @@
+"""Rules and compose file hot paths on 10 to 100k rules, compared to baselines"""
+import dataclasses
+import pathlib
+import warnings
+from typing import Callable, Dict, List, Set, Tuple
+
+import pytest
+
+from twcompose.compose import (
+    TwitterComposeModel,
+    TwitterStreamParametersModel,
+    TwitterStreamRuleModel,
+    parse_compose_file,
+)
+from twcompose.rules import TwitterRule, compute_rule_changes, dict_remove_none_fields
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [10, 100, 1_000, 10_000, 100_000]
+# Number of rules processed by each timing, small sizes are repeated
+RULES_PER_TIMING = 100_000
+
+
+def make_rule_sets(size: int) -> Tuple[Set[TwitterRule], Set[TwitterRule]]:
+    """Current and new rules where 10% of the rules changed"""
+    current = {
+        TwitterRule(value=f"rule {i}", tag=f"tag {i}", id=str(10**12 + i))
+        for i in range(size)
+    }
+    changed = max(1, size // 10)
+    new = {
+        TwitterRule(value=f"rule {i}", tag=f"tag {i}")
+        for i in range(changed, size + changed)
+    }
+    return current, new
+
+
+def make_streams(size: int) -> Dict[str, List[TwitterStreamRuleModel]]:
+    """Groups of 10 rules, each tag appearing in two groups"""
+    return {
+        f"group_{group}": [
+            TwitterStreamRuleModel(tag=f"tag_{(group + i) % size}", value=f"rule {i}")
+            for i in range(group * 10, min(size, group * 10 + 10))
+        ]
+        for group in range(max(1, size // 10))
+    }
+
+
+def write_compose_file(path: pathlib.Path, size: int) -> pathlib.Path:
+    lines = [
+        'image_tag: "0.1.0"',
+        "output: {driver: local, path: ./data/, options: {}}",
+        "parameters: {tweet_fields: [text, author_id]}",
+        "streams:",
+    ]
+    for group in range(max(1, size // 10)):
+        lines.append(f"  group_{group}:")
+        for i in range(10):
+            lines.append(f"    - {{tag: tag_{group}_{i}, value: 'rule {group} {i}'}}")
+    path.write_text("\n".join(lines))
+    return path
+
+
+def time_per_call(
+    best_time: Callable[..., float], func: Callable[[], object], size: int
+) -> float:
+    """Best time of a call, small inputs are called many times per timing"""
+    number = max(1, RULES_PER_TIMING // size)
+
+    def repeated():
+        for _ in range(number):
+            func()
+
+    return best_time(repeated) / number
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_compute_rule_changes(size, best_time, check_baseline):
+    current, new = make_rule_sets(size)
+    seconds = time_per_call(best_time, lambda: compute_rule_changes(current, new), size)
+    check_baseline(f"compute_rule_changes[{size}]", seconds)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_to_twitter_payload(size, best_time, check_baseline):
+    changes = compute_rule_changes(*make_rule_sets(size))
+    # Replacing all the rules
+    changes = dataclasses.replace(changes, add=changes.add * 10)
+    seconds = time_per_call(best_time, changes.to_twitter_payload, size)
+    check_baseline(f"to_twitter_payload[{size}]", seconds)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_dict_remove_none_fields(size, best_time, check_baseline):
+    current, new = make_rule_sets(size)
+    payload = {
+        "add": [dataclasses.asdict(r) for r in new],
+        "delete": [dataclasses.asdict(r) for r in current],
+    }
+    seconds = time_per_call(best_time, lambda: dict_remove_none_fields(payload), size)
+    check_baseline(f"dict_remove_none_fields[{size}]", seconds)
+
+
+def test_to_querystring(best_time, check_baseline):
+    # The parameters do not depend on the number of rules
+    parameters = TwitterStreamParametersModel(
+        expansions=["author_id", "geo.place_id"],
+        media_fields=["url", "type"],
+        place_fields=["country", "geo"],
+        poll_fields=["id"],
+        tweet_fields=["text", "author_id", "created_at", "lang"],
+        user_fields=["username", "location"],
+    )
+    seconds = time_per_call(best_time, parameters.to_querystring, 10)
+    check_baseline("to_querystring", seconds)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_parse_compose_file(size, best_time, check_baseline, tmp_path):
+    compose_file = write_compose_file(tmp_path / "twitter-compose.yml", size)
+    seconds = time_per_call(
+        best_time,
+        lambda: parse_compose_file(compose_file, use_cache=False),
+        max(size, RULES_PER_TIMING // 100),
+    )
+    check_baseline(f"parse_compose_file[{size}]", seconds)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_check_tag_unique_to_a_stream(size, best_time, check_baseline):
+    values = {"streams": make_streams(size)}
+
+    def check():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            TwitterComposeModel.check_tag_unique_to_a_stream(values)
+
+    seconds = time_per_call(best_time, check, size)
+    check_baseline(f"check_tag_unique_to_a_stream[{size}]", seconds)
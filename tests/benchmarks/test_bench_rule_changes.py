@@ -0,0 +1,39 @@
+from typing import Dict, Set, Tuple
+
+import pytest
+
+from twcompose.rules import TwitterRule, compute_rule_changes
+
+pytestmark = pytest.mark.benchmark
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def make_rule_sets(size: int) -> Tuple[Set[TwitterRule], Set[TwitterRule]]:
+    """Current and new rules where 10% of the rules changed"""
+    current = {
+        TwitterRule(value=f"rule {i}", tag=f"tag {i}", id=str(10**12 + i))
+        for i in range(size)
+    }
+    changed = size // 10
+    new = {
+        TwitterRule(value=f"rule {i}", tag=f"tag {i}")
+        for i in range(changed, size + changed)
+    }
+    return current, new
+
+
+def test_compute_rule_changes_scaling(best_time):
+    timings: Dict[int, float] = {}
+    for size in SIZES:
+        current, new = make_rule_sets(size)
+        changes = compute_rule_changes(current, new)
+        assert len(changes.add) == len(changes.delete) == size // 10
+        assert len(changes.unchanged) == size - size // 10
+
+        timings[size] = best_time(lambda: compute_rule_changes(current, new))
+        print(f"compute_rule_changes({size} rules): {timings[size] * 1000:.1f} ms")
+
+    # 100 times more rules should cost about 100 times more (linear),
+    # a quadratic diff would be about 10000 times slower
+    assert timings[SIZES[-1]] / timings[SIZES[0]] < 2500
@@ -0,0 +1,14 @@
+from typing import Iterator
+
+import pytest
+from fake_twitter import FakeTwitterServer
+
+
+@pytest.fixture
+def fake_twitter(monkeypatch, tmp_path) -> Iterator[FakeTwitterServer]:
+    """Local stand-in of the Twitter API used by all the Twitter clients"""
+    # The rules applied on the fake server are not kept in the user cache
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+    with FakeTwitterServer() as server:
+        monkeypatch.setenv("TWCOMPOSE_TWITTER_API_URL", server.url)
+        yield server
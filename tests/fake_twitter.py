@@ -0,0 +1,294 @@
+"""Local stand-in of the Twitter rules and counts endpoints
+
+Emulates the rate limit headers and 429 responses of the API,
+the validation errors of rules and injected server errors.
+"""
+import dataclasses
+import datetime
+import hashlib
+import json
+import math
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+RULES_PATH = "/2/tweets/search/stream/rules"
+COUNTS_PATH = "/2/tweets/counts/recent"
+MAX_RULE_LENGTH = 512
+
+
+@dataclasses.dataclass
+class RateLimit:
+    """Requests allowed per window of an endpoint"""
+
+    limit: int = 450
+    window: float = 900.0
+    remaining: int = dataclasses.field(init=False)
+    reset: float = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.remaining = self.limit
+        self.reset = time.time() + self.window
+
+    def consume(self) -> bool:
+        """Consumes a request, `False` if the limit is reached"""
+        if time.time() >= self.reset:
+            self.remaining = self.limit
+            self.reset = time.time() + self.window
+        if self.remaining == 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "x-rate-limit-limit": str(self.limit),
+            "x-rate-limit-remaining": str(self.remaining),
+            # Rounded up, the limit is not reset before this time
+            "x-rate-limit-reset": str(math.ceil(self.reset)),
+        }
+
+
+def tweet_count(query: str, start: datetime.datetime) -> int:
+    """Deterministic number of tweets of a query in a bucket"""
+    digest = hashlib.sha1(f"{query}{start.isoformat()}".encode()).digest()
+    return int.from_bytes(digest[:2], "big")
+
+
+@dataclasses.dataclass
+class FakeTwitterState:
+    """Rules and counters of the fake API
+
+    Attributes:
+        rate_limits (dict[str, RateLimit]): Rate limit of each endpoint path
+        latency (float): Seconds taken by each request
+        errors (list[int]): Statuses returned by the next requests
+        requests (list[tuple[str, str]]): Method and path of received requests
+        apps (dict[str, dict[str, dict[str, str]]]): Rules by id of each
+            bearer token, each token is a different Twitter app
+        max_rules (int | None): Active rules cap of each app
+        refuse_capped_requests (bool): Whether the rules above the cap
+            refuse the whole request instead of each of these rules
+        history (list[set[str]]): Values of the rules of the app after each
+            change of its rules
+    """
+
+    rate_limits: Dict[str, RateLimit] = dataclasses.field(
+        default_factory=lambda: {
+            RULES_PATH: RateLimit(limit=450),
+            COUNTS_PATH: RateLimit(limit=300),
+        }
+    )
+    latency: float = 0.0
+    errors: List[int] = dataclasses.field(default_factory=list)
+    requests: List[Tuple[str, str]] = dataclasses.field(default_factory=list)
+    apps: Dict[str, Dict[str, Dict[str, str]]] = dataclasses.field(default_factory=dict)
+    next_id: int = 10**18
+    max_rules: Optional[int] = None
+    refuse_capped_requests: bool = False
+    history: List[Set[str]] = dataclasses.field(default_factory=list)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+    def rules(self, token: str = "token") -> Dict[str, Dict[str, str]]:
+        """Rules by id of the app of the token"""
+        return self.apps.setdefault(token, {})
+
+    def get_rules(self, token: str) -> Dict[str, Any]:
+        data = [dict(rule, id=rule_id) for rule_id, rule in self.rules(token).items()]
+        response: Dict[str, Any] = {"meta": {"result_count": len(data)}}
+        if data:
+            # Twitter omits the data field when there are no rules
+            response["data"] = data
+        return response
+
+    def post_rules(
+        self, token: str, payload: Dict[str, Any], dry_run: bool
+    ) -> Dict[str, Any]:
+        rules = self.rules(token)
+        errors: List[Dict[str, Any]] = []
+        if "delete" in payload:
+            ids = payload["delete"]["ids"]
+            for rule_id in ids:
+                if rule_id not in rules:
+                    errors.append(
+                        {"value": rule_id, "title": "Not Found", "type": "NotFound"}
+                    )
+                elif not dry_run:
+                    del rules[rule_id]
+            if not dry_run:
+                self.history.append({rule["value"] for rule in rules.values()})
+            response: Dict[str, Any] = {
+                "meta": {"summary": {"deleted": len(ids) - len(errors)}}
+            }
+            if errors:
+                response["errors"] = errors
+            return response
+
+        existing = {rule["value"] for rule in rules.values()}
+        if (
+            self.refuse_capped_requests
+            and self.max_rules is not None
+            and len(existing) + len(payload.get("add", [])) > self.max_rules
+        ):
+            cap_error = {
+                "title": "RulesCapExceeded",
+                "type": "RulesCapExceeded",
+                "detail": f"Rule cap of {self.max_rules} rules exceeded",
+            }
+            return {"meta": {"summary": {"created": 0}}, "errors": [cap_error]}
+        created: List[Dict[str, str]] = []
+        for rule in payload.get("add", []):
+            value = rule.get("value", "")
+            if not value or len(value) > MAX_RULE_LENGTH:
+                errors.append(
+                    {"value": value, "title": "Invalid Rule", "type": "InvalidRule"}
+                )
+            elif value in existing:
+                errors.append(
+                    {"value": value, "title": "DuplicateRule", "type": "DuplicateRule"}
+                )
+            elif self.max_rules is not None and len(existing) >= self.max_rules:
+                errors.append(
+                    {
+                        "value": value,
+                        "title": "RulesCapExceeded",
+                        "type": "RulesCapExceeded",
+                    }
+                )
+            else:
+                existing.add(value)
+                rule_id = str(self.next_id)
+                self.next_id += 1
+                created.append(dict(rule, id=rule_id))
+                if not dry_run:
+                    rules[rule_id] = {k: rule[k] for k in ("value", "tag")}
+        if not dry_run:
+            self.history.append({rule["value"] for rule in rules.values()})
+        response = {"meta": {"summary": {"created": len(created)}}}
+        if created:
+            response["data"] = created
+        if errors:
+            response["errors"] = errors
+        return response
+
+    def get_counts(self, params: Dict[str, str]) -> Dict[str, Any]:
+        granularity = params.get("granularity", "hour")
+        step = {
+            "minute": datetime.timedelta(minutes=1),
+            "hour": datetime.timedelta(hours=1),
+            "day": datetime.timedelta(days=1),
+        }[granularity]
+        now = datetime.datetime.now(datetime.timezone.utc).replace(
+            minute=0, second=0, microsecond=0
+        )
+        if granularity == "day":
+            now = now.replace(hour=0)
+        start = now - datetime.timedelta(days=7)
+        if "start_time" in params:
+            start = max(
+                start,
+                datetime.datetime.strptime(
+                    params["start_time"], "%Y-%m-%dT%H:%M:%SZ"
+                ).replace(tzinfo=datetime.timezone.utc),
+            )
+
+        data = []
+        while start < now:
+            data.append(
+                {
+                    "start": start.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "end": (start + step).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                    "tweet_count": tweet_count(params["query"], start),
+                }
+            )
+            start += step
+        total = sum(d["tweet_count"] for d in data)
+        return {"data": data, "meta": {"total_tweet_count": total}}
+
+
+class _FakeTwitterHandler(BaseHTTPRequestHandler):
+    server: "FakeTwitterServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, payload: Any, headers: Dict[str, str]) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        body: Optional[Dict[str, Any]] = None
+        if method == "POST":
+            body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+
+        state = self.server.state
+        if state.latency:
+            time.sleep(state.latency)
+        with state.lock:
+            state.requests.append((method, url.path))
+            authorization = self.headers.get("Authorization", "")
+            if not authorization.startswith("Bearer "):
+                return self._send(401, {"title": "Unauthorized"}, {})
+            token = authorization[len("Bearer ") :]
+            rate_limit = state.rate_limits.get(url.path)
+            if rate_limit is None:
+                return self._send(404, {"title": "Not Found"}, {})
+            if not rate_limit.consume():
+                return self._send(
+                    429, {"title": "Too Many Requests"}, rate_limit.headers()
+                )
+            if state.errors:
+                status = state.errors.pop(0)
+                return self._send(status, {"title": "Error"}, rate_limit.headers())
+
+            if url.path == COUNTS_PATH:
+                payload = state.get_counts(params)
+            elif method == "GET":
+                payload = state.get_rules(token)
+            else:
+                assert body is not None
+                payload = state.post_rules(token, body, params.get("dry_run") == "True")
+            self._send(200, payload, rate_limit.headers())
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+
+class FakeTwitterServer(ThreadingHTTPServer):
+    """Fake Twitter API running in a background thread
+
+    Use it as a context manager, its `url` replaces `https://api.twitter.com`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, state: Optional[FakeTwitterState] = None):
+        super().__init__(("127.0.0.1", 0), _FakeTwitterHandler)
+        self.state = state or FakeTwitterState()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeTwitterServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.shutdown()
+        self.server_close()
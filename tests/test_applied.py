@@ -0,0 +1,182 @@
+import pathlib
+import time
+
+import pytest
+from fake_twitter import RULES_PATH
+
+from twcompose.applied import AppliedRules, AppliedRulesStore, get_group_hash
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.update import update_project
+from twcompose.compose import TwitterComposeModel
+from twcompose.utils import get_twitter_rule_api
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {
+        "cop26": [{"tag": "cop26", "value": "#cop26"}],
+        "climate": [{"tag": "climate", "value": "#climate"}],
+    },
+}
+
+
+@pytest.fixture
+def credentials_file(tmp_path) -> pathlib.Path:
+    credentials_file = tmp_path / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    return credentials_file
+
+
+@pytest.fixture
+def backend() -> InMemoryCollectionBackend:
+    return InMemoryCollectionBackend()
+
+
+def get_config(**streams) -> TwitterComposeModel:
+    return TwitterComposeModel.parse_obj(
+        dict(COMPOSE_CONFIG, streams=streams or COMPOSE_CONFIG["streams"])
+    )
+
+
+def installed_rules(fake_twitter) -> set:
+    return {(r["tag"], r["value"]) for r in fake_twitter.state.rules().values()}
+
+
+def rule_requests(fake_twitter) -> list:
+    return [m for m, path in fake_twitter.state.requests if path == RULES_PATH]
+
+
+def test_group_hash():
+    config = get_config()
+    rules = config.streams["cop26"] + config.streams["climate"]
+    assert get_group_hash(rules) == get_group_hash(reversed(rules))
+    assert get_group_hash(rules) != get_group_hash(config.streams["cop26"])
+
+
+def test_store(tmp_path, fake_twitter, credentials_file):
+    store = AppliedRulesStore(tmp_path / "applied")
+    twitter_api = get_twitter_rule_api(credentials_file)
+    assert store.load(twitter_api, "project") is None
+
+    applied_rules = AppliedRules.from_installed_rules(
+        "project", get_config(), [], checked_at=time.time()
+    )
+    store.save(twitter_api, applied_rules)
+    assert store.load(twitter_api, "project") == applied_rules
+    # Rules applied by another project with the same Twitter app
+    assert store.load(twitter_api, "other") is None
+    # The token is not written in clear
+    assert "token" not in "".join(p.name for p in store.path.iterdir())
+
+    store.clear(twitter_api)
+    assert store.load(twitter_api, "project") is None
+
+
+def test_noop_update_without_get(fake_twitter, credentials_file, backend):
+    update_project(
+        "project", get_config(), credentials_file, backend, print_func=lambda m: None
+    )
+    fake_twitter.state.requests.clear()
+
+    messages = []
+    update_project(
+        "project", get_config(), credentials_file, backend, print_func=messages.append
+    )
+    assert messages == ["Nothing to do."]
+    assert rule_requests(fake_twitter) == []
+
+
+def test_update_changed_groups_only(fake_twitter, credentials_file, backend):
+    update_project(
+        "project", get_config(), credentials_file, backend, print_func=lambda m: None
+    )
+    fake_twitter.state.requests.clear()
+
+    config = get_config(
+        cop26=[{"tag": "cop26", "value": "#cop26 OR #cop27"}],
+        climate=[{"tag": "climate", "value": "#climate"}],
+    )
+    messages = []
+    update_project(
+        "project", config, credentials_file, backend, print_func=messages.append
+    )
+    assert installed_rules(fake_twitter) == {
+        ("cop26", "#cop26 OR #cop27"),
+        ("climate", "#climate"),
+    }
+    assert "GET" not in rule_requests(fake_twitter)
+    # The rules of the unchanged group are not compared
+    assert not any("#climate" in m for m in messages)
+
+    # The ids of the created rules were saved, their deletion succeeds
+    update_project(
+        "project",
+        get_config(climate=[{"tag": "climate", "value": "#climate"}]),
+        credentials_file,
+        backend,
+        print_func=lambda m: None,
+    )
+    assert installed_rules(fake_twitter) == {("climate", "#climate")}
+
+
+@pytest.mark.parametrize("drift_check", [True, False])
+def test_drift_check(fake_twitter, credentials_file, backend, drift_check):
+    update_project(
+        "project", get_config(), credentials_file, backend, print_func=lambda m: None
+    )
+    # A rule deleted outside of twcompose
+    rules = fake_twitter.state.rules()
+    rule_id = next(i for i, r in rules.items() if r["tag"] == "climate")
+    del rules[rule_id]
+    fake_twitter.state.requests.clear()
+
+    messages = []
+    update_project(
+        "project",
+        get_config(),
+        credentials_file,
+        backend,
+        print_func=messages.append,
+        drift_check=drift_check,
+        # Otherwise, the installed rules are checked periodically
+        drift_check_interval=3600 if drift_check else 0,
+    )
+    assert "Twitter rules were changed since the last update." in messages
+    assert rule_requests(fake_twitter)[0] == "GET"
+    assert installed_rules(fake_twitter) == {
+        ("cop26", "#cop26"),
+        ("climate", "#climate"),
+    }
+
+
+def test_failed_update_clears_state(fake_twitter, credentials_file, backend):
+    update_project(
+        "project", get_config(), credentials_file, backend, print_func=lambda m: None
+    )
+    twitter_api = get_twitter_rule_api(credentials_file)
+    assert AppliedRulesStore().load(twitter_api, "project") is not None
+
+    with pytest.raises(ValueError, match="Invalid Rule"):
+        update_project(
+            "project",
+            get_config(long=[{"tag": "long", "value": "a" * 600}]),
+            credentials_file,
+            backend,
+            print_func=lambda m: None,
+        )
+    assert AppliedRulesStore().load(twitter_api, "project") is None
+
+
+def test_check_does_not_save(fake_twitter, credentials_file, backend):
+    update_project(
+        "project",
+        get_config(),
+        credentials_file,
+        backend,
+        check=True,
+        print_func=lambda m: None,
+    )
+    twitter_api = get_twitter_rule_api(credentials_file)
+    assert AppliedRulesStore().load(twitter_api, "project") is None
+    assert installed_rules(fake_twitter) == set()
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from twcompose.compose import TwitterComposeModel, parse_compose_file
+
+COMPOSE_FILE = """
+image_tag: "0.1.0"
+output:
+  driver: local
+  path: ./data/
+  options: {}
+parameters: {}
+streams:
+  cop26:
+    - tag: cop26
+      value: "#cop26"
+  climate:
+    - tag: cop26
+      value: "#climate"
+"""
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+    return tmp_path / "cache"
+
+
+def test_parse_compose_file_cached(tmp_path, cache_dir):
+    compose_file = tmp_path / "twitter-compose.yml"
+    compose_file.write_text(COMPOSE_FILE)
+
+    with pytest.warns(UserWarning, match="Found tag 'cop26'"):
+        cold = parse_compose_file(compose_file)
+    assert len(list((cache_dir / "compose").glob("*.json"))) == 1
+
+    # Warnings are raised again when reading from cache
+    with pytest.warns(UserWarning, match="Found tag 'cop26'"):
+        warm = parse_compose_file(compose_file)
+    assert warm == cold
+
+    # The cache is keyed by content
+    compose_file.write_text(COMPOSE_FILE.replace("0.1.0", "0.2.0"))
+    with pytest.warns(UserWarning):
+        assert parse_compose_file(compose_file).image_tag == "0.2.0"
+
+
+@pytest.mark.filterwarnings("ignore:Found tag")
+def test_parse_compose_file_invalid_cache(tmp_path, cache_dir):
+    compose_file = tmp_path / "twitter-compose.yml"
+    compose_file.write_text(COMPOSE_FILE)
+    parse_compose_file(compose_file)
+    (cache_file,) = (cache_dir / "compose").glob("*.json")
+
+    # Cache files that were not written by twcompose are ignored
+    cache_file.write_text('{"image_tag": 1}')
+    assert parse_compose_file(compose_file).image_tag == "0.1.0"
+    cache_file.write_text("not json")
+    assert parse_compose_file(compose_file).image_tag == "0.1.0"
+    content = json.loads(cache_file.read_text())
+    content["config"] = content["config"].replace("0.1.0", "0.3.0")
+    cache_file.write_text(json.dumps(content))
+    assert parse_compose_file(compose_file).image_tag == "0.1.0"
+
+
+def test_parse_compose_file_cached_not_validated(tmp_path, cache_dir, monkeypatch):
+    compose_file = tmp_path / "twitter-compose.yml"
+    compose_file.write_text(COMPOSE_FILE.replace("climate", "cop27"))
+    cold = parse_compose_file(compose_file)
+
+    def fail_parse_obj(obj):
+        raise AssertionError("The cached file is validated again")
+
+    monkeypatch.setattr(TwitterComposeModel, "parse_obj", fail_parse_obj)
+    warm = parse_compose_file(compose_file)
+    assert warm == cold
+    assert warm.streams["cop27"][0].value == "#cop27"
+    assert warm.output.driver == "local"
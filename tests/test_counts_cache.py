@@ -0,0 +1,58 @@
+import itertools
+import json
+import sqlite3
+
+import pytest
+
+from twcompose.twitter import cache as cache_module
+from twcompose.twitter.cache import CountsCache
+
+COUNTS = [{"start": "2022-11-01", "end": "2022-11-02", "tweet_count": 10}]
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Time increasing by one second at each call"""
+    ticks = itertools.count(1_000_000)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+
+def test_cache_get_set(tmp_path):
+    cache = CountsCache(tmp_path / "counts.sqlite")
+    assert cache.get("#cop26", "recent:day") is None
+    cache.set("#cop26", "recent:day", COUNTS)
+    assert cache.get("#cop26", "recent:day") == COUNTS
+    assert cache.get("#cop26", "recent:hour") is None
+
+
+def test_cache_ttl(tmp_path):
+    cache = CountsCache(tmp_path / "counts.sqlite", ttl=3)
+    cache.set("#cop26", "recent:day", COUNTS)
+    assert cache.get("#cop26", "recent:day") == COUNTS
+    assert cache.get("#cop26", "recent:day") is None
+
+
+def test_cache_lru_eviction(tmp_path):
+    # Room for the counts of two rules
+    cache = CountsCache(
+        tmp_path / "counts.sqlite", max_size=2 * len(json.dumps(COUNTS))
+    )
+    cache.set("a", "recent:day", COUNTS)
+    cache.set("b", "recent:day", COUNTS)
+    # Using "a" so that "b" is the least recently used
+    cache.get("a", "recent:day")
+    cache.set("c", "recent:day", COUNTS)
+    assert cache.get("b", "recent:day") is None
+    assert cache.get("a", "recent:day") == COUNTS
+    assert cache.get("c", "recent:day") == COUNTS
+
+
+def test_cache_close(tmp_path):
+    with CountsCache(tmp_path / "counts.sqlite") as cache:
+        cache.set("#cop26", "recent:day", COUNTS)
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.get("#cop26", "recent:day")
+
+    # The counts were saved
+    with CountsCache(tmp_path / "counts.sqlite") as cache:
+        assert cache.get("#cop26", "recent:day") == COUNTS
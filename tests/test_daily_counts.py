@@ -0,0 +1,79 @@
+import datetime
+import json
+
+import requests
+
+from twcompose.twitter.counts import MonthlyTwitterCountEstimator
+from twcompose.twitter.timeseries import (
+    DailyCountsStore,
+    from_epoch_day,
+    project_average,
+    project_trend,
+    to_epoch_day,
+)
+
+TODAY = to_epoch_day(datetime.datetime.now(datetime.timezone.utc))
+
+
+def _format_day(day: int) -> str:
+    return from_epoch_day(day).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class FakeTwitterClient:
+    """Returns 100 tweets per day from the requested start day"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def request(self, method: str, url: str, params: dict) -> requests.Response:
+        self.calls += 1
+        start_day = to_epoch_day(
+            datetime.datetime.fromisoformat(params["start_time"].replace("Z", "+00:00"))
+        )
+        buckets = [
+            {"start": _format_day(d), "end": _format_day(d + 1), "tweet_count": 100}
+            for d in range(start_day, TODAY)
+        ]
+        # Partial day
+        buckets.append(
+            {
+                "start": _format_day(TODAY),
+                "end": f"{from_epoch_day(TODAY):%Y-%m-%d}T01:00:00.000Z",
+                "tweet_count": 4,
+            }
+        )
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"data": buckets}).encode()
+        return response
+
+
+def test_daily_counts_store(tmp_path):
+    store = DailyCountsStore(tmp_path)
+    assert store.load("#cop26") == {}
+    store.update("#cop26", {10: 1, 12: 3})
+    assert store.update("#cop26", {11: 2}) == {10: 1, 11: 2, 12: 3}
+    assert store.load("#cop26") == {10: 1, 11: 2, 12: 3}
+
+
+def test_estimate_fetches_only_missing_days(tmp_path):
+    client = FakeTwitterClient()
+    store = DailyCountsStore(tmp_path)
+    estimator = MonthlyTwitterCountEstimator(client, store=store)  # type: ignore
+
+    assert estimator.estimate("#cop26") == 3100
+    assert client.calls == 1
+    # The partial day is not stored
+    assert TODAY not in store.load("#cop26")
+
+    # All complete days are already stored
+    assert estimator.estimate("#cop26") == 3100
+    assert client.calls == 1
+
+
+def test_projections():
+    assert project_average([]) == 0
+    assert project_average([10, 20]) == 465
+    assert project_trend({1: 10, 2: 20, 3: 30}, days=2) == 40 + 50
+    # Projected daily counts are never negative
+    assert project_trend({1: 30, 2: 20, 3: 10}, days=5) == 0
@@ -0,0 +1,293 @@
+import pathlib
+from typing import Any, Dict, List
+from unittest import mock
+
+import docker.errors
+import pytest
+from docker.models.containers import Container
+from docker.models.images import Image
+
+from twcompose.backends.abstract import CollectorDoesNotExist
+from twcompose.backends.docker import DockerCollectionBackend
+from twcompose.compose import TwitterComposeModel
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {"cop26": [{"tag": "cop26", "value": "#cop26"}]},
+}
+
+
+def container_attrs(name: str, status: str = "running") -> Dict[str, Any]:
+    """Attributes of `containers.list(sparse=True)`"""
+    return {"Id": name, "Names": [f"/{name}"], "State": status}
+
+
+class FakeContainers:
+    """Counts the calls to the containers API of the Docker client"""
+
+    def __init__(self, containers: List[Dict[str, Any]]):
+        self.client = mock.Mock()
+        self.attrs = {attrs["Names"][0].lstrip("/"): attrs for attrs in containers}
+        self.calls: List[str] = []
+        self.logs = b""
+
+    def _container(self, attrs):
+        container = Container(attrs=dict(attrs), client=self.client)
+        container.reload = mock.Mock()
+        container.start = mock.Mock()
+        container.stop = mock.Mock()
+        container.remove = mock.Mock()
+        container.rename = mock.Mock()
+        container.logs = mock.Mock(return_value=self.logs)
+        return container
+
+    def get(self, name: str):
+        self.calls.append("get")
+        if name not in self.attrs:
+            raise docker.errors.NotFound(name)
+        return self._container(self.attrs[name])
+
+    def list(self, **kwargs):
+        self.calls.append("list")
+        return [self._container(attrs) for attrs in self.attrs.values()]
+
+    def run(self, name: str, labels: Dict[str, str], **kwargs):
+        self.calls.append("run")
+        self.run_kwargs = dict(kwargs, name=name, labels=labels)
+        self.run_container = self._container(
+            {
+                "Name": f"/{name}",
+                "State": {"Status": "running"},
+                "Config": {"Labels": labels},
+            }
+        )
+        return self.run_container
+
+
+@pytest.fixture
+def containers() -> FakeContainers:
+    return FakeContainers(
+        [container_attrs("stream_alpha"), container_attrs("stream_beta", "exited")]
+    )
+
+
+@pytest.fixture
+def images() -> mock.Mock:
+    images = mock.Mock()
+    images.get.side_effect = docker.errors.ImageNotFound("not pulled")
+    return images
+
+
+@pytest.fixture
+def backend(containers, images) -> DockerCollectionBackend:
+    return DockerCollectionBackend(
+        docker_client=mock.Mock(containers=containers, images=images)
+    )
+
+
+def test_single_lookup_per_command(backend, containers):
+    assert backend.is_running("alpha")
+    assert backend.is_running("alpha")
+    assert not backend.is_running("missing")
+    assert not backend.is_running("missing")
+    assert containers.calls == ["get", "get"]
+
+
+def test_prefetch_lists_all_containers(backend, containers):
+    backend.prefetch(["alpha", "beta", "missing"])
+
+    assert backend.is_running("alpha")
+    assert not backend.is_running("beta")
+    assert not backend.is_running("missing")
+    assert containers.calls == ["list"]
+
+
+def test_invalidate_after_stop(backend, containers):
+    backend.stop("alpha")
+    assert containers.calls == ["get"]
+
+    # The container state is fetched again
+    backend.is_running("alpha")
+    assert containers.calls == ["get", "get"]
+
+
+def test_diff_of_missing_collector(backend):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    with pytest.raises(CollectorDoesNotExist):
+        backend.diff("missing", compose_config, pathlib.Path("credentials.yml"))
+
+
+def test_diff_compares_config_hash_label(backend, containers):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    credentials_file = pathlib.Path("credentials.yml")
+    config_hash = backend._get_config_hash(compose_config, credentials_file)
+    containers.attrs["stream_alpha"]["Labels"] = {"twcompose.config-hash": config_hash}
+
+    backend.prefetch()
+    assert backend.diff("alpha", compose_config, credentials_file) == {}
+    # The sparse container was not inspected
+    assert backend.get_container("alpha").reload.call_count == 0
+
+
+def test_diff_details_on_config_hash_mismatch(backend, containers):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    credentials_file = pathlib.Path("credentials.yml")
+    containers.attrs["stream_alpha"].update(
+        {
+            "Name": "/stream_alpha",
+            "Config": {"Image": "old/image:0.0.1", "Labels": {}},
+            "Args": backend._get_container_command(compose_config),
+            "Mounts": [
+                {"Source": source, "Destination": destination}
+                for source, destination in (
+                    v.split(":")
+                    for v in backend._get_volumes(compose_config, credentials_file)
+                )
+            ],
+        }
+    )
+
+    differences = backend.diff("alpha", compose_config, credentials_file)
+    assert list(differences) == ["image_name"]
+    assert differences["image_name"].current == "old/image:0.0.1"
+
+
+@pytest.fixture
+def outdated_alpha(containers, tmp_path):
+    """A running collector with an outdated image and the handoff strategy"""
+    compose_config = TwitterComposeModel.parse_obj(
+        dict(
+            COMPOSE_CONFIG,
+            output={"driver": "local", "path": str(tmp_path), "options": {}},
+            update_strategy="handoff",
+            handoff_warmup=0,
+        )
+    )
+    containers.attrs["stream_alpha"].update(
+        {
+            "Name": "/stream_alpha",
+            "Config": {"Image": "old/image:0.0.1", "Labels": {}},
+            "Args": [],
+            "Mounts": [],
+        }
+    )
+    return compose_config
+
+
+def test_handoff_update(backend, containers, outdated_alpha):
+    credentials_file = pathlib.Path("credentials.yml")
+    old_container = backend.get_container("alpha")
+
+    backend.update("alpha", outdated_alpha, credentials_file)
+
+    # The new collector writes in a slot of the output
+    assert containers.run_kwargs["name"] == "stream_alpha_next"
+    assert containers.run_kwargs["labels"]["twcompose.slot"] == "blue"
+    assert any(
+        v.endswith("/blue:/app/output") for v in containers.run_kwargs["volumes"]
+    )
+    # The old collector is stopped once the new one is streaming
+    old_container.stop.assert_called_once()
+    old_container.remove.assert_called_once()
+
+
+def test_handoff_cancelled(backend, containers, outdated_alpha):
+    credentials_file = pathlib.Path("credentials.yml")
+    old_container = backend.get_container("alpha")
+    containers.logs = b"ERROR:twcollect.streams:Error returned by Twitter stream API"
+
+    with pytest.raises(ValueError, match="failed to stream"):
+        backend.update("alpha", outdated_alpha, credentials_file)
+
+    # The old collector is still running
+    old_container.stop.assert_not_called()
+
+
+def test_handoff_ignores_tweets_mentioning_errors(backend, containers, outdated_alpha):
+    containers.logs = b'INFO:twcollect.streams:Received a tweet {"text": "Error"}'
+
+    backend.update("alpha", outdated_alpha, pathlib.Path("credentials.yml"))
+    assert containers.run_kwargs["name"] == "stream_alpha_next"
+
+
+def test_handoff_reads_new_logs(backend, containers, outdated_alpha):
+    backend.poll_interval = 0.1
+    compose_config = outdated_alpha.copy(update={"handoff_warmup": 1})
+
+    backend.update("alpha", compose_config, pathlib.Path("credentials.yml"))
+    first, *others = containers.run_container.logs.call_args_list
+    assert first.kwargs == {}
+    assert others and all("since" in c.kwargs for c in others)
+
+
+def test_pull_images_pins_digests(backend, images, containers):
+    digest = "ghcr.io/smassonnet/twcollect@sha256:0123"
+    images.pull.return_value = Image(
+        attrs={"Id": "sha256:abcd", "RepoDigests": [digest]}
+    )
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+
+    (image_pull,) = backend.pull_images([compose_config, compose_config])
+    assert image_pull.image == "ghcr.io/smassonnet/twcollect:0.1.0"
+    assert image_pull.digest == digest
+    images.pull.assert_called_once_with("ghcr.io/smassonnet/twcollect", tag="0.1.0")
+
+    # Collectors are run and compared with the digest
+    backend.update("new", compose_config, pathlib.Path("credentials.yml"))
+    assert containers.run_kwargs["image"] == digest
+
+
+def test_prepare_check_does_not_pull(backend, images, containers):
+    images.get_registry_data.return_value = mock.Mock(id="sha256:0123")
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+
+    (message,) = backend.prepare([compose_config], check=True)
+    digest = "ghcr.io/smassonnet/twcollect@sha256:0123"
+    assert (
+        message
+        == f"Resolved image ghcr.io/smassonnet/twcollect:0.1.0 ({digest}), not pulled"
+    )
+    images.pull.assert_not_called()
+    images.get_registry_data.assert_called_once_with(
+        "ghcr.io/smassonnet/twcollect:0.1.0"
+    )
+
+    # The collectors are compared with the digest of the registry
+    backend.update("new", compose_config, pathlib.Path("credentials.yml"))
+    assert containers.run_kwargs["image"] == digest
+
+
+def test_pull_images_reports_errors(backend, images):
+    images.pull.side_effect = docker.errors.APIError("unauthorized")
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+
+    (image_pull,) = backend.pull_images([compose_config])
+    assert image_pull.error is not None
+    assert str(image_pull).startswith("Failed to pull image")
+
+
+def test_pin_image(backend, images, containers):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    with pytest.raises(ValueError, match="digest of the image"):
+        backend.get_pinned_image(compose_config)
+
+    # The image of a plan is run without being pulled
+    digest = "ghcr.io/smassonnet/twcollect@sha256:0123"
+    backend.pin_image(compose_config, digest)
+    assert backend.get_pinned_image(compose_config) == digest
+    backend.update("new", compose_config, pathlib.Path("credentials.yml"))
+    assert containers.run_kwargs["image"] == digest
+    images.pull.assert_not_called()
+
+
+def test_container_lookup_outside_lock(backend, containers):
+    def get(name: str):
+        # Other projects can be read from the snapshot during the lookup
+        assert not backend._lock.locked()
+        return FakeContainers.get(containers, name)
+
+    containers.get = get
+    assert backend.get_container("alpha") is not None
+    assert containers.calls == ["get"]
@@ -0,0 +1,77 @@
+import pathlib
+
+import pytest
+from fake_twitter import RULES_PATH, RateLimit
+
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.update import update_project
+from twcompose.compose import TwitterComposeModel
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {
+        "cop26": [{"tag": "cop26", "value": "#cop26"}],
+        "climate": [{"tag": "climate", "value": "#climate"}],
+    },
+}
+
+
+@pytest.fixture
+def credentials_file(tmp_path) -> pathlib.Path:
+    credentials_file = tmp_path / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    return credentials_file
+
+
+def test_update_project(fake_twitter, credentials_file):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    backend = InMemoryCollectionBackend()
+    messages = []
+
+    update_project(
+        "project", compose_config, credentials_file, backend, print_func=messages.append
+    )
+    assert {r["value"] for r in fake_twitter.state.rules().values()} == {
+        "#cop26",
+        "#climate",
+    }
+    assert backend.is_running("project")
+
+    # Up to date
+    messages.clear()
+    update_project(
+        "project", compose_config, credentials_file, backend, print_func=messages.append
+    )
+    assert messages == ["Nothing to do."]
+
+
+def test_update_project_retries(fake_twitter, credentials_file):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    # A server error, then the rate limit of the rules endpoint is reached
+    fake_twitter.state.errors.append(503)
+    fake_twitter.state.rate_limits[RULES_PATH] = RateLimit(limit=2, window=1)
+
+    update_project(
+        "project",
+        compose_config,
+        credentials_file,
+        InMemoryCollectionBackend(),
+        print_func=lambda m: None,
+    )
+    assert len(fake_twitter.state.rules()) == 2
+
+
+def test_update_project_invalid_rule(fake_twitter, credentials_file):
+    compose_config = TwitterComposeModel.parse_obj(
+        dict(COMPOSE_CONFIG, streams={"long": [{"tag": "long", "value": "a" * 600}]})
+    )
+    with pytest.raises(ValueError, match="Invalid Rule"):
+        update_project(
+            "project",
+            compose_config,
+            credentials_file,
+            InMemoryCollectionBackend(),
+            print_func=lambda m: None,
+        )
@@ -0,0 +1,117 @@
+import pathlib
+
+import pytest
+
+from twcompose.commands.fleet import (
+    FleetProject,
+    FleetProjectReport,
+    find_compose_files,
+    find_fleet_projects,
+    print_fleet_reports,
+    refuse_shared_twitter_apps,
+)
+from twcompose.compose import TwitterComposeModel
+
+COMPOSE_FILE = """
+image_tag: "0.1.0"
+output:
+  driver: local
+  path: ./data/
+  options: {}
+parameters: {}
+streams:
+  cop26:
+    - tag: cop26
+      value: "#cop26"
+"""
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def fleet_dir(tmp_path: pathlib.Path) -> pathlib.Path:
+    fleet = tmp_path / "fleet"
+    for name in ("alpha", "beta"):
+        (fleet / name).mkdir(parents=True)
+        (fleet / name / "twitter-compose.yml").write_text(COMPOSE_FILE)
+    (fleet / "beta" / "credentials.yml").write_text("twitter_token: beta\n")
+    (fleet / "not-a-project").mkdir()
+    return fleet
+
+
+def test_find_compose_files(fleet_dir):
+    single = fleet_dir / "alpha" / "twitter-compose.yml"
+    assert find_compose_files([fleet_dir], "twitter-compose.yml") == [
+        fleet_dir / "alpha" / "twitter-compose.yml",
+        fleet_dir / "beta" / "twitter-compose.yml",
+    ]
+    assert find_compose_files([fleet_dir / "alpha"], "twitter-compose.yml") == [single]
+    assert find_compose_files([single], "twitter-compose.yml") == [single]
+    # A project given as a folder and as a compose file is found once
+    assert find_compose_files([fleet_dir / "alpha", single], "twitter-compose.yml") == [
+        single
+    ]
+
+
+def test_fleet_projects_with_same_name(fleet_dir, tmp_path):
+    other = tmp_path / "other" / "alpha"
+    other.mkdir(parents=True)
+    (other / "twitter-compose.yml").write_text(COMPOSE_FILE)
+    paths = [fleet_dir, other]
+    with pytest.raises(ValueError, match="both named alpha"):
+        find_fleet_projects(paths, "twitter-compose.yml", pathlib.Path("c.yml"))
+
+
+def test_fleet_project(fleet_dir):
+    default_credentials = pathlib.Path("credentials.yml")
+    alpha, beta = (
+        FleetProject.from_compose_file(f, default_credentials)
+        for f in find_compose_files([fleet_dir], "twitter-compose.yml")
+    )
+    assert alpha.project_name == "alpha"
+    assert alpha.credentials_file == default_credentials
+    assert beta.credentials_file == fleet_dir / "beta" / "credentials.yml"
+
+    # Output is relative to the project folder
+    compose_config = alpha.parse_compose_file()
+    assert pathlib.Path(compose_config.output.path) == fleet_dir / "alpha" / "data"
+
+
+def test_refuse_shared_twitter_apps(fleet_dir):
+    (fleet_dir / "gamma").mkdir()
+    (fleet_dir / "gamma" / "twitter-compose.yml").write_text(COMPOSE_FILE)
+    default_credentials = fleet_dir / "credentials.yml"
+    default_credentials.write_text("twitter_token: shared\n")
+    projects = [
+        FleetProject.from_compose_file(f, default_credentials)
+        for f in find_compose_files([fleet_dir], "twitter-compose.yml")
+    ]
+    compose_configs = {p.project_name: p.parse_compose_file() for p in projects}
+
+    # alpha and gamma use the default credentials
+    refuse_shared_twitter_apps(projects, compose_configs)
+    assert isinstance(compose_configs["beta"], TwitterComposeModel)
+    assert str(compose_configs["alpha"]) == (
+        "The Twitter app of alpha is used by gamma, "
+        "each project needs its own credentials file"
+    )
+    assert isinstance(compose_configs["gamma"], ValueError)
+
+
+def test_print_fleet_reports(capsys):
+    reports = [
+        FleetProjectReport("alpha", messages=["Nothing to do."]),
+        FleetProjectReport("beta", error="ValueError: invalid rule"),
+    ]
+    with pytest.raises(SystemExit) as exit_info:
+        print_fleet_reports(reports)
+    assert exit_info.value.code == 1
+
+    output = capsys.readouterr().out
+    assert "=== alpha (OK)\nNothing to do." in output
+    assert "=== beta (FAILED)\nValueError: invalid rule" in output
+    assert "1 project(s) succeeded, 1 failed." in output
+    assert "Command failed for projects: beta" in output
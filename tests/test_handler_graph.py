@@ -0,0 +1,164 @@
+import dataclasses
+import pathlib
+import time
+from typing import List
+
+import pytest
+
+from twcompose.commands.volume import volume_command
+from twcompose.compose import TwitterComposeModel
+from twcompose.handlers import CommandHandler
+from twcompose.handlers.graph import CommandHandlerGraph
+from twcompose.handlers.messages import PrintMessagesHandler, SaveMessageHandler
+from twcompose.handlers.state import CommandHandlerState
+
+
+@dataclasses.dataclass
+class SleepHandler(CommandHandler):
+    """Adds its name to a dictionary of the state after sleeping"""
+
+    name: str
+    seconds: float = 0.0
+    field: str = "volume_per_rule"
+
+    def handle(self, state: CommandHandlerState):
+        time.sleep(self.seconds)
+        setattr(
+            state, self.field, dict(getattr(state, self.field) or {}, **{self.name: 1})
+        )
+        state.messages.append(self.name)
+        super().handle(state)
+
+
+@dataclasses.dataclass
+class FailingHandler(CommandHandler):
+    def handle(self, state: CommandHandlerState):
+        raise ValueError("Invalid rule")
+
+
+@pytest.fixture
+def state() -> CommandHandlerState:
+    return CommandHandlerState(
+        project_name="project",
+        twitter_compose_file=pathlib.Path(),
+        credentials_file=pathlib.Path(),
+        log_level="",
+        command_args={},
+    )
+
+
+def test_independent_handlers_run_concurrently(state):
+    graph = CommandHandlerGraph()
+    graph.add("first", SaveMessageHandler(lambda s: "first"))
+    graph.add("second", SaveMessageHandler(lambda s: "second"))
+    graph.add("rules", SleepHandler("rules", 0.2))
+    graph.add(
+        "collector",
+        SleepHandler("collector", 0.2, field="peak_rates"),
+        depends_on=["first"],
+    )
+
+    start = time.perf_counter()
+    graph.handle(state)
+    # Bounded by the slowest branch
+    assert time.perf_counter() - start < 0.35
+    assert state.volume_per_rule == {"rules": 1}
+    assert state.peak_rates == {"collector": 1}
+    assert sorted(state.messages) == ["collector", "first", "rules", "second"]
+
+
+def test_conflicting_handlers(state):
+    graph = CommandHandlerGraph()
+    graph.add("first", SleepHandler("first"))
+    graph.add("second", SleepHandler("second"))
+    with pytest.raises(ValueError, match="both set volume_per_rule"):
+        graph.handle(state)
+
+
+@dataclasses.dataclass
+class SetArgumentHandler(CommandHandler):
+    """Sets a command argument in place"""
+
+    name: str
+
+    def handle(self, state: CommandHandlerState):
+        state.command_args[self.name] = True
+        super().handle(state)
+
+
+def test_handlers_changing_state_in_place(state):
+    graph = CommandHandlerGraph()
+    graph.add("first", SetArgumentHandler("first"))
+    graph.handle(state)
+    assert state.command_args == {"first": True}
+
+    # Each node changed its own copy
+    graph = CommandHandlerGraph()
+    graph.add("second", SetArgumentHandler("second"))
+    graph.add("third", SetArgumentHandler("third"))
+    with pytest.raises(ValueError, match="both set command_args"):
+        graph.handle(state)
+
+
+def test_dependencies(state):
+    printed: List[str] = []
+    graph = CommandHandlerGraph()
+    graph.add("slow", SleepHandler("slow", 0.1))
+    graph.add("fast", SleepHandler("fast"), depends_on=["slow"])
+    graph.add("print", PrintMessagesHandler(print_func=printed.append), ["fast"])
+    graph.handle(state)
+
+    # The dependent handler sees the state set by its dependencies
+    assert state.volume_per_rule == {"slow": 1, "fast": 1}
+    assert state.messages == ["slow", "fast"]
+    assert printed == ["slow", "fast"]
+
+
+def test_next_handler(state):
+    printed: List[str] = []
+    graph = CommandHandlerGraph()
+    graph.add("first", SaveMessageHandler(lambda s: "first"))
+    graph.add("second", SaveMessageHandler(lambda s: "second"))
+    graph.set_next_handler(PrintMessagesHandler(print_func=printed.append))
+    graph.handle(state)
+    assert sorted(printed) == ["first", "second"]
+
+
+def test_failing_handler(state):
+    graph = CommandHandlerGraph()
+    graph.add("failing", FailingHandler())
+    graph.add("after", SleepHandler("after"), depends_on=["failing"])
+    with pytest.raises(ValueError, match="Invalid rule"):
+        graph.handle(state)
+    assert state.volume_per_rule is None
+
+
+def test_invalid_graph():
+    graph = CommandHandlerGraph().add("first", CommandHandler())
+    with pytest.raises(ValueError):
+        graph.add("first", CommandHandler())
+    with pytest.raises(ValueError):
+        graph.add("second", CommandHandler(), depends_on=["third"])
+
+
+def test_volume_command_peak(fake_twitter, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+    credentials_file = tmp_path / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    compose_config = TwitterComposeModel.parse_obj(
+        {
+            "image_tag": "0.1.0",
+            "output": {"driver": "local", "path": "./data/", "options": {}},
+            "parameters": {},
+            "streams": {"cop26": [{"tag": "cop26", "value": "#cop26"}]},
+        }
+    )
+    volume_command(
+        "project",
+        compose_config,
+        credentials_file,
+        peak=True,
+        tweet_size=1024,
+        granularity="hour",
+    )
+    assert "#cop26" in capsys.readouterr().out
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+import stat
+
+import pytest
+
+from twcompose.output import deduplicate_handoff, read_lines, remove_tweets
+
+
+def write_tweets(file_path, tweet_ids, mtime=None):
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(file_path, "ab") as f:
+        for tweet_id in tweet_ids:
+            f.write(json.dumps({"data": {"id": tweet_id}}).encode() + b"\n")
+    if mtime is not None:
+        os.utime(file_path, (mtime, mtime))
+
+
+def tweet_ids(file_path):
+    return [json.loads(line)["data"]["id"] for line in read_lines(file_path)]
+
+
+def test_deduplicate_handoff(tmp_path):
+    old_folder, new_folder = tmp_path / "blue", tmp_path / "green"
+    # Older files are not read nor rewritten
+    write_tweets(old_folder / "tweets-0.jsonl.gz", ["1", "2", "3"], mtime=100)
+    write_tweets(new_folder / "tweets-0.jsonl.gz", ["2", "3"], mtime=100)
+    # Files written during the overlap
+    write_tweets(old_folder / "tweets-1.jsonl.gz", ["4", "5", "6"])
+    write_tweets(new_folder / "tweets-1.jsonl.gz", ["5", "6", "7"])
+
+    assert deduplicate_handoff(old_folder, new_folder, since=1000) == 2
+
+    assert tweet_ids(old_folder / "tweets-0.jsonl.gz") == ["1", "2", "3"]
+    assert tweet_ids(old_folder / "tweets-1.jsonl.gz") == ["4"]
+    assert tweet_ids(new_folder / "tweets-1.jsonl.gz") == ["5", "6", "7"]
+
+
+def test_read_lines_of_incomplete_file(tmp_path):
+    file_path = tmp_path / "tweets-0.jsonl.gz"
+    write_tweets(file_path, ["1"])
+    # A member being written by a collector
+    with file_path.open("ab") as f:
+        f.write(gzip.compress(b'{"data": {"id": "2"}}\n')[:-8])
+
+    # Reading stops without errors at the end of the flushed data
+    assert tweet_ids(file_path)[:1] == ["1"]
+
+
+def test_remove_tweets_keeps_mode(tmp_path):
+    file_path = tmp_path / "tweets-0.jsonl.gz"
+    write_tweets(file_path, ["1", "2"])
+    file_path.chmod(0o644)
+
+    assert remove_tweets(file_path, {"1"}) == 1
+    assert tweet_ids(file_path) == ["2"]
+    assert stat.S_IMODE(file_path.stat().st_mode) == 0o644
+
+
+def test_remove_tweets_of_corrupted_file(tmp_path):
+    file_path = tmp_path / "tweets-0.jsonl.gz"
+    write_tweets(file_path, ["1"])
+    with file_path.open("ab") as f:
+        f.write(b"not gzip")
+    content = file_path.read_bytes()
+
+    with pytest.raises(ValueError, match="is corrupted"):
+        remove_tweets(file_path, {"1"})
+    # The file is left unchanged
+    assert file_path.read_bytes() == content
+    assert list(tmp_path.iterdir()) == [file_path]
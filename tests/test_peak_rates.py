@@ -0,0 +1,27 @@
+from twcompose.twitter.peak import RateStats, bucket_rates, percentile, sum_rates
+
+BUCKETS = [
+    {
+        "start": f"2022-11-01T{h:02d}:00:00.000Z",
+        "end": f"2022-11-01T{h + 1:02d}:00:00.000Z",
+        "tweet_count": 3600 * (h + 1),
+    }
+    for h in range(20)
+]
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([], 95) == 0
+
+
+def test_bucket_rates():
+    rates = bucket_rates(BUCKETS)
+    assert rates["2022-11-01T00:00:00.000Z"] == 1
+    assert RateStats.from_rates(rates.values()) == RateStats(p50=10, p95=19, max=20)
+
+
+def test_sum_rates():
+    assert sum_rates([{"a": 1, "b": 2}, {"b": 1}]) == {"a": 1, "b": 3}
@@ -0,0 +1,159 @@
+import json
+import pathlib
+from typing import List
+
+import pytest
+from fake_twitter import RULES_PATH
+
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.update import (
+    PLAN_FILE_VERSION,
+    UpdatePlan,
+    apply_plans,
+    load_plans,
+    save_plans,
+    update_project,
+)
+from twcompose.compose import TwitterComposeModel
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {
+        "cop26": [{"tag": "cop26", "value": "#cop26"}],
+        "climate": [{"tag": "climate", "value": "#climate"}],
+    },
+}
+
+
+@pytest.fixture
+def credentials_file(tmp_path) -> pathlib.Path:
+    credentials_file = tmp_path / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    return credentials_file
+
+
+@pytest.fixture
+def backend() -> InMemoryCollectionBackend:
+    return InMemoryCollectionBackend()
+
+
+def installed_rules(fake_twitter) -> set:
+    return {(r["tag"], r["value"]) for r in fake_twitter.state.rules().values()}
+
+
+def make_plans(
+    credentials_file: pathlib.Path, backend: InMemoryCollectionBackend, **update
+) -> List[UpdatePlan]:
+    plans: List[UpdatePlan] = []
+    update_project(
+        "project",
+        TwitterComposeModel.parse_obj(dict(COMPOSE_CONFIG, **update)),
+        credentials_file,
+        backend,
+        check=True,
+        drift_check=True,
+        print_func=lambda m: None,
+        plans=plans,
+    )
+    return plans
+
+
+def test_plan_file(tmp_path, fake_twitter, credentials_file, backend):
+    plans = make_plans(credentials_file, backend)
+    assert len(plans) == 1
+    assert plans[0].rules_changes is not None
+    assert plans[0].collector_changed
+    # Planning does not change anything
+    assert installed_rules(fake_twitter) == set()
+    assert not backend.is_running("project")
+
+    plan_file = tmp_path / "plan.json"
+    save_plans(plan_file, plans)
+    assert load_plans(plan_file) == plans
+
+    plan_file.write_text('{"version": 0, "plans": []}')
+    with pytest.raises(ValueError, match="not a plan file"):
+        load_plans(plan_file)
+
+    plan_file.write_text(json.dumps({"version": PLAN_FILE_VERSION, "plans": []}))
+    with pytest.raises(ValueError, match="has no plans"):
+        load_plans(plan_file)
+
+
+def test_apply_plans(fake_twitter, credentials_file, backend):
+    plans = make_plans(credentials_file, backend)
+    fake_twitter.state.requests.clear()
+
+    apply_plans(plans, backend, print_func=lambda m: None)
+    assert installed_rules(fake_twitter) == {
+        ("cop26", "#cop26"),
+        ("climate", "#climate"),
+    }
+    assert backend.is_running("project")
+    # A single GET to check that the plan is current
+    assert [m for m, p in fake_twitter.state.requests if p == RULES_PATH] == [
+        "GET",
+        "POST",
+    ]
+
+    # The applied rules are saved for the next update
+    fake_twitter.state.requests.clear()
+    messages: List[str] = []
+    update_project(
+        "project",
+        TwitterComposeModel.parse_obj(COMPOSE_CONFIG),
+        credentials_file,
+        backend,
+        print_func=messages.append,
+    )
+    assert messages == ["Nothing to do."]
+    assert fake_twitter.state.requests == []
+
+
+def test_apply_stale_plan(fake_twitter, credentials_file, backend):
+    plans = make_plans(credentials_file, backend)
+    # The rules are changed after the plan was made
+    update_project(
+        "project",
+        TwitterComposeModel.parse_obj(COMPOSE_CONFIG),
+        credentials_file,
+        backend,
+        print_func=lambda m: None,
+    )
+    backend.stop("project")
+
+    with pytest.raises(ValueError, match="changed since the plan"):
+        apply_plans(plans, backend, print_func=lambda m: None)
+    assert not backend.is_running("project")
+
+
+def test_apply_sharded_plans(tmp_path, fake_twitter, backend):
+    shards = []
+    for index in range(3):
+        shard_credentials = tmp_path / f"app{index}.yml"
+        shard_credentials.write_text(f"twitter_token: token{index}\n")
+        shards.append({"credentials": str(shard_credentials)})
+    plans = make_plans(tmp_path / "credentials.yml", backend, shards=shards)
+    # Two stream groups on three shards
+    assert len(plans) == 3
+    empty_shard = next(p for p in plans if not p.compose_config.streams)
+    backend.update(empty_shard.project_name, empty_shard.compose_config, tmp_path)
+
+    apply_plans(plans, backend, print_func=lambda m: None)
+    assert sum(len(fake_twitter.state.rules(f"token{i}")) for i in range(3)) == 2
+    for plan in plans:
+        assert backend.is_running(plan.project_name) == (plan is not empty_shard)
+
+
+def test_apply_plan_with_changed_collector(
+    tmp_path, fake_twitter, credentials_file, backend
+):
+    plans = make_plans(credentials_file, backend)
+    # The collector is started after the plan was made
+    backend.update("project", plans[0].compose_config, credentials_file)
+
+    with pytest.raises(ValueError, match="collector of project changed"):
+        apply_plans(plans, backend, print_func=lambda m: None)
+    assert installed_rules(fake_twitter) == set()
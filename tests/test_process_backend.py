@@ -0,0 +1,174 @@
+import pathlib
+import socket
+import sys
+import threading
+import time
+from typing import List
+
+import pytest
+from pydantic import ValidationError
+
+from twcompose.backends import get_collections_backend
+from twcompose.backends.abstract import CollectorDoesNotExist
+from twcompose.backends.process import (
+    SubprocessCollectionBackend,
+    Supervisor,
+    _is_alive,
+)
+from twcompose.compose import TwitterComposeModel
+from twcompose.twitter.http import RetryPolicy
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {"cop26": [{"tag": "cop26", "value": "#cop26"}]},
+    "backend": "subprocess",
+}
+
+
+def test_get_collections_backend():
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    assert isinstance(
+        get_collections_backend(compose_config), SubprocessCollectionBackend
+    )
+
+
+def test_handoff_refused():
+    with pytest.raises(ValidationError, match="only supported by the docker"):
+        TwitterComposeModel.parse_obj(dict(COMPOSE_CONFIG, update_strategy="handoff"))
+
+
+def test_supervisor_restarts_with_backoff(tmp_path):
+    pid_file = tmp_path / "collector.pid"
+    supervisor = Supervisor(
+        command=[sys.executable, "-c", "import sys; sys.exit(1)"],
+        pid_file=pid_file,
+        retry_policy=RetryPolicy(max_retries=2, backoff_factor=0.01),
+    )
+    # Gives up after the first run and 2 restarts
+    assert supervisor.run() == 3
+    assert not pid_file.exists()
+
+
+def wait_for_file(path: pathlib.Path) -> None:
+    deadline = time.monotonic() + 10
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert path.exists()
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch) -> SubprocessCollectionBackend:
+    backend = SubprocessCollectionBackend(state_dir=tmp_path / "collectors")
+    # A collector streaming forever
+    monkeypatch.setattr(
+        backend,
+        "_get_command",
+        lambda compose_config, credentials_file: [
+            sys.executable,
+            "-c",
+            f"import time; time.sleep(60)  # {compose_config.image_tag}",
+        ],
+    )
+    return backend
+
+
+def test_subprocess_backend_lifecycle(backend):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    credentials_file = pathlib.Path("credentials.yml")
+    with pytest.raises(CollectorDoesNotExist):
+        backend.diff("project", compose_config, credentials_file)
+
+    backend.update("project", compose_config, credentials_file)
+    try:
+        assert backend.is_running("project")
+        assert backend.diff("project", compose_config, credentials_file) == {}
+
+        # The collector is supervised
+        wait_for_file(backend.state_dir / "project.collector.pid")
+
+        new_config = compose_config.copy(update={"image_tag": "0.2.0"})
+        assert list(backend.diff("project", new_config, credentials_file)) == [
+            "command"
+        ]
+    finally:
+        backend.stop("project")
+    assert not backend.is_running("project")
+
+
+def test_stop_kills_collector(tmp_path, monkeypatch):
+    backend = SubprocessCollectionBackend(
+        state_dir=tmp_path / "collectors", stop_timeout=0.5
+    )
+    # A collector ignoring the termination sent by the supervisor
+    monkeypatch.setattr(
+        backend,
+        "_get_command",
+        lambda compose_config, credentials_file: [
+            sys.executable,
+            "-c",
+            "import pathlib, signal, time; "
+            "signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+            f"pathlib.Path('{tmp_path / 'ready'}').touch(); time.sleep(60)",
+        ],
+    )
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    backend.update("project", compose_config, pathlib.Path("credentials.yml"))
+    collector_pid_file = backend.state_dir / "project.collector.pid"
+    wait_for_file(collector_pid_file)
+    collector_pid = int(collector_pid_file.read_text())
+    wait_for_file(tmp_path / "ready")
+
+    backend.stop("project")
+    deadline = time.monotonic() + 10
+    while _is_alive(collector_pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not _is_alive(collector_pid)
+    assert not backend.is_running("project")
+
+
+@pytest.fixture
+def proxy(monkeypatch) -> List[bytes]:
+    """First line of the requests sent through a local HTTPS proxy"""
+    requests: List[bytes] = []
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            with connection:
+                requests.append(connection.makefile("rb").readline())
+                connection.sendall(b"HTTP/1.1 502 Bad Gateway\r\n\r\n")
+
+    threading.Thread(target=serve, daemon=True).start()
+    monkeypatch.setenv("HTTPS_PROXY", f"http://127.0.0.1:{server.getsockname()[1]}")
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    monkeypatch.delenv("no_proxy", raising=False)
+    yield requests
+    server.close()
+
+
+def test_twcollect_command(tmp_path, monkeypatch, proxy):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "credentials.yml").write_text("twitter_token: token\n")
+    config = dict(
+        COMPOSE_CONFIG,
+        parameters={"tweet_fields": ["created_at"]},
+        output={"driver": "local", "path": "./data/", "options": {"max_file_size": 10}},
+    )
+    compose_config = TwitterComposeModel.parse_obj(config)
+    backend = SubprocessCollectionBackend(state_dir=tmp_path / "collectors")
+
+    backend.update("project", compose_config, pathlib.Path("credentials.yml"))
+    try:
+        # twcollect accepted its arguments and connects to the stream
+        deadline = time.monotonic() + 20
+        while not proxy and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert proxy[:1] == [b"CONNECT api.twitter.com:443 HTTP/1.0\r\n"]
+    finally:
+        backend.stop("project")
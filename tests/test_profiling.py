@@ -0,0 +1,156 @@
+import json
+import pathlib
+from typing import Any, Dict, Iterator, List
+
+import pytest
+from fake_twitter import RULES_PATH, RateLimit
+
+from twcompose import profiling
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.update import update_project
+from twcompose.compose import TwitterComposeModel
+from twcompose.concurrency import run_in_thread, run_sync
+from twcompose.handlers import CommandHandler
+from twcompose.handlers.messages import SaveMessageHandler
+from twcompose.handlers.state import CommandHandlerState
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {"cop26": [{"tag": "cop26", "value": "#cop26"}]},
+}
+
+
+@pytest.fixture
+def profiler() -> Iterator[profiling.Profiler]:
+    yield profiling.enable()
+    profiling.disable()
+
+
+def find_spans(spans: List[Dict[str, Any]], name: str) -> List[Dict[str, Any]]:
+    found = []
+    for s in spans:
+        if s["name"] == name:
+            found.append(s)
+        found += find_spans(s["spans"], name)
+    return found
+
+
+def test_span_disabled():
+    with profiling.span("phase"):
+        profiling.annotate(retries=1)
+    assert profiling.disable() is None
+
+
+def test_spans_nested_across_threads(profiler):
+    def blocking():
+        with profiling.span("child"):
+            profiling.annotate(retries=2)
+
+    async def main():
+        await run_in_thread(blocking)
+
+    with profiling.span("parent", project="project"):
+        run_sync(main())
+
+    (parent,) = profiler.to_json()["spans"]
+    assert parent["name"] == "parent"
+    assert parent["args"] == {"project": "project"}
+    (child,) = parent["spans"]
+    assert child["name"] == "child"
+    assert child["args"] == {"retries": 2}
+    assert child["thread"] != parent["thread"]
+    assert parent["start"] <= child["start"]
+    assert child["duration"] <= parent["duration"]
+
+
+def test_span_records_errors(profiler):
+    with pytest.raises(ValueError):
+        with profiling.span("failing"):
+            raise ValueError("Invalid rule")
+    assert profiler.spans[0].args == {"error": "ValueError('Invalid rule')"}
+
+
+class ParentHandler(CommandHandler):
+    def handle(self, state: CommandHandlerState):
+        state.messages.append("parent")
+        super().handle(state)
+
+
+class ChildHandler(ParentHandler):
+    def handle(self, state: CommandHandlerState):
+        state.messages.append("child")
+        super().handle(state)
+
+
+def test_handler_spans(profiler):
+    state = CommandHandlerState(
+        project_name="project",
+        twitter_compose_file=pathlib.Path(),
+        credentials_file=pathlib.Path(),
+        log_level="",
+        command_args={},
+    )
+    SaveMessageHandler(lambda s: "first").chain(ChildHandler()).handle(state)
+    assert state.messages == ["first", "child", "parent"]
+
+    # The first handler of the chain is timed, and each handler once
+    (first,) = profiler.to_json()["spans"]
+    assert first["name"] == "SaveMessageHandler"
+    (child,) = first["spans"]
+    assert child["name"] == "ChildHandler"
+    assert child["spans"] == []
+
+
+def test_write_chrome_trace(profiler, tmp_path):
+    with profiling.span("parent"):
+        with profiling.span("child"):
+            pass
+    trace_file = tmp_path / "trace.json"
+    profiler.write(trace_file, "chrome")
+
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["parent", "child"]
+    assert all(e["ph"] == "X" for e in events)
+    assert events[0]["dur"] >= events[1]["dur"]
+
+    with pytest.raises(ValueError):
+        profiler.write(trace_file, "xml")
+
+
+def test_update_project_profile(profiler, fake_twitter, tmp_path):
+    credentials_file = tmp_path / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    fake_twitter.state.errors.append(503)
+    fake_twitter.state.rate_limits[RULES_PATH] = RateLimit(limit=2, window=1)
+
+    update_project(
+        "project",
+        TwitterComposeModel.parse_obj(COMPOSE_CONFIG),
+        credentials_file,
+        InMemoryCollectionBackend(),
+        print_func=lambda m: None,
+    )
+
+    spans = profiler.to_json()["spans"]
+    (fetch,) = find_spans(spans, "fetch current state")
+    # The rules and the collector are fetched concurrently
+    (graph,) = fetch["spans"]
+    assert graph["name"] == "CommandHandlerGraph"
+    twitter_rules, collector_state = graph["spans"]
+    assert {twitter_rules["name"], collector_state["name"]} == {
+        "twitter rules",
+        "collector state",
+    }
+    assert twitter_rules["thread"] != collector_state["thread"]
+    (get_rules,) = find_spans(spans, f"GET {RULES_PATH}")
+    # Timed in the span of its handler
+    (get_rules_handler,) = find_spans(spans, "GetTwitterRulesHandler")
+    assert get_rules_handler in find_spans(spans, "twitter rules")[0]["spans"]
+    assert get_rules_handler["spans"] == [get_rules]
+    assert get_rules["args"] == {"retries": 1, "status": 200}
+    # The rules update waits for the rate limit, reset after the second request
+    (post_rules,) = find_spans(spans, f"POST {RULES_PATH}")
+    assert 0 < post_rules["args"]["rate_limit_wait"] <= 2
+    assert find_spans(spans, "collector update")
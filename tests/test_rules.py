@@ -2,12 +2,20 @@ from typing import Set
 
 import pytest
 
-from twcompose.rules import TwitterRule, TwitterRulesDiff, compute_rule_changes
+from twcompose.rules import (
+    TwitterRule,
+    TwitterRuleAPI,
+    TwitterRulesDiff,
+    compute_rule_changes,
+    format_rule_errors,
+)
 
 COP26_RULE = TwitterRule(value="#cop26", tag="COP26")
 COP26_NEW_TAG = TwitterRule(value="#cop26", tag="COP26 hashtag")
 COP26_RULE_ID = "12345"
 COP26_RULE_WITH_ID = TwitterRule(value="#cop26", tag="COP26", id=COP26_RULE_ID)
+COP26_RULE_DUPLICATE = TwitterRule(value="#cop26", tag="COP26", id="123456")
+CLIMATE_RULE = TwitterRule(value="#climate", tag="climate")
 
 
 @pytest.mark.parametrize(
@@ -25,8 +33,13 @@ COP26_RULE_WITH_ID = TwitterRule(value="#cop26", tag="COP26", id=COP26_RULE_ID)
             {COP26_RULE},
             TwitterRulesDiff(),
         ),
+        (
+            {COP26_RULE_DUPLICATE, COP26_RULE_WITH_ID},
+            {COP26_RULE},
+            TwitterRulesDiff(delete=[COP26_RULE_DUPLICATE]),
+        ),
     ],
-    ids=["current_empty", "new_empty", "rename_tag", "no_changes"],
+    ids=["current_empty", "new_empty", "rename_tag", "no_changes", "duplicates"],
 )
 def test_compute_rule_changes(
     current_rules: Set[TwitterRule],
@@ -37,6 +50,19 @@ def test_compute_rule_changes(
     assert compute_rule_changes(current_rules, new_rules) == post_payload
 
 
+def test_compute_rule_changes_unchanged():
+    changes = compute_rule_changes(
+        {COP26_RULE_WITH_ID, COP26_RULE_DUPLICATE}, {COP26_RULE, COP26_NEW_TAG}
+    )
+    assert changes.unchanged == [COP26_RULE_WITH_ID]
+    assert changes.add == [COP26_NEW_TAG]
+
+
+def test_compute_rule_changes_delete_without_id():
+    with pytest.raises(ValueError):
+        compute_rule_changes({COP26_RULE}, set())
+
+
 @pytest.mark.parametrize(
     ("rules_diff", "payload"),
     [
@@ -60,3 +86,105 @@ def test_compute_rule_changes(
 )
 def test_rules_diff_to_payload(rules_diff: TwitterRulesDiff, payload: dict):
     assert rules_diff.to_twitter_payload() == payload
+
+
+def test_rules_diff_to_payload_add_first():
+    new_value = TwitterRule(value="#cop26 OR #cop27", tag="COP26")
+    changes = TwitterRulesDiff(
+        add=[new_value, COP26_NEW_TAG],
+        delete=[COP26_RULE_WITH_ID, COP26_RULE_DUPLICATE],
+    )
+    # Both old rules have the value of a new rule, they are deleted first
+    assert changes.to_twitter_payload(add_first=True) == changes.to_twitter_payload()
+
+    changes = TwitterRulesDiff(add=[new_value], delete=[COP26_RULE_WITH_ID])
+    assert changes.to_twitter_payload(add_first=True) == [
+        {"add": [{"value": new_value.value, "tag": new_value.tag}]},
+        {"delete": {"ids": [COP26_RULE_ID]}},
+    ]
+
+
+@pytest.fixture
+def rule_api(fake_twitter) -> TwitterRuleAPI:
+    rule_api = TwitterRuleAPI("token")
+    rule_api.post(TwitterRulesDiff(add=[COP26_RULE, CLIMATE_RULE]))
+    return rule_api
+
+
+def test_post_add_first(fake_twitter, rule_api):
+    installed = rule_api.get()
+    changes = compute_rule_changes(
+        installed, {TwitterRule(value="#cop26 OR #cop27", tag="COP26"), CLIMATE_RULE}
+    )
+    fake_twitter.state.history.clear()
+
+    created, errors = rule_api.post_and_get_created(changes)
+    assert errors == []
+    assert [r.value for r in created] == ["#cop26 OR #cop27"]
+    # The rule of the tag is active at all times
+    assert fake_twitter.state.history == [
+        {"#cop26", "#cop26 OR #cop27", "#climate"},
+        {"#cop26 OR #cop27", "#climate"},
+    ]
+
+
+def test_post_keeps_rules_of_failed_tags(fake_twitter, rule_api):
+    installed = rule_api.get()
+    changes = compute_rule_changes(
+        installed,
+        {
+            TwitterRule(value="a" * 600, tag="COP26"),
+            TwitterRule(value="#ipcc", tag="ipcc"),
+        },
+    )
+
+    _, errors = rule_api.post_and_get_created(changes)
+    # The invalid rule and the rule it replaces are reported
+    assert [e["title"] for e in errors] == ["Invalid Rule", "Not deleted"]
+    assert errors[1]["value"] == "#cop26"
+    assert {r.value for r in rule_api.get()} == {"#cop26", "#ipcc"}
+    assert format_rule_errors(errors).splitlines() == [
+        f"- {'a' * 600}: Invalid Rule",
+        "- #cop26: Not deleted (the new rules of its tag were not created)",
+    ]
+
+
+@pytest.mark.parametrize("max_rules", [2, None])
+def test_post_rules_cap(fake_twitter, rule_api, max_rules):
+    installed = rule_api.get()
+    changes = compute_rule_changes(
+        installed, {TwitterRule(value="#cop26 OR #cop27", tag="COP26"), CLIMATE_RULE}
+    )
+    fake_twitter.state.max_rules = 2
+    if max_rules is not None:
+        # The cap is known, the old rules are deleted first
+        rule_api.max_rules = max_rules
+        assert not rule_api.can_add_first(changes)
+
+    _, errors = rule_api.post_and_get_created(changes)
+    assert errors == []
+    assert {r.value for r in rule_api.get()} == {"#cop26 OR #cop27", "#climate"}
+
+
+def test_post_refused_batch(fake_twitter, rule_api):
+    rule_api.post(TwitterRulesDiff(add=[TwitterRule(value="#ipcc", tag="ipcc")]))
+    installed = rule_api.get()
+    changes = compute_rule_changes(
+        installed, {TwitterRule(value="#cop26 OR #cop27", tag="COP26"), CLIMATE_RULE}
+    )
+    fake_twitter.state.max_rules = 3
+    fake_twitter.state.refuse_capped_requests = True
+
+    # The batch is added once the rule of the removed tag is deleted
+    _, errors = rule_api.post_and_get_created(changes)
+    assert errors == []
+    assert {r.value for r in rule_api.get()} == {"#cop26 OR #cop27", "#climate"}
+
+    # Still above the cap, the old rule is kept and the error is returned
+    fake_twitter.state.max_rules = 2
+    changes = compute_rule_changes(
+        rule_api.get(), {TwitterRule(value="#cop26", tag="COP26"), CLIMATE_RULE}
+    )
+    _, errors = rule_api.post_and_get_created(changes)
+    assert [e["title"] for e in errors] == ["RulesCapExceeded", "Not deleted"]
+    assert {r.value for r in rule_api.get()} == {"#cop26 OR #cop27", "#climate"}
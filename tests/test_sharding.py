@@ -0,0 +1,146 @@
+import pathlib
+
+from fake_twitter import RULES_PATH
+
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.update import update_project
+from twcompose.compose import TwitterComposeModel
+from twcompose.rules import TwitterRule
+from twcompose.sharding import (
+    assign_groups,
+    current_assignment,
+    estimate_group_volumes,
+    get_collectors,
+    get_shards,
+)
+from twcompose.twitter.timeseries import DailyCountsStore
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {
+        "cop26": [{"tag": "cop26", "value": "#cop26"}],
+        "climate": [
+            {"tag": "climate", "value": "#climate"},
+            {"tag": "climate", "value": "#ipcc"},
+        ],
+        "energy": [{"tag": "energy", "value": "#energy"}],
+    },
+    "shards": [{"credentials": "app0.yml"}, {"credentials": "app1.yml"}],
+}
+
+
+def test_assign_groups_balances_volume():
+    volumes = {"a": 10, "b": 7, "c": 5, "d": 4, "e": 2}
+    assignment = assign_groups(volumes, 2)
+
+    loads = [0, 0]
+    for group, shard in assignment.items():
+        loads[shard] += volumes[group]
+    assert sorted(loads) == [14, 14]
+
+
+def test_assign_groups_keeps_current_shard():
+    volumes = {"a": 10, "b": 10, "c": 1}
+    # Both large groups stay on shard 0, the new one goes to the empty shard
+    assignment = assign_groups(volumes, 2, current={"a": 0, "b": 0, "gone": 1})
+    assert assignment == {"a": 0, "b": 0, "c": 1}
+
+    # Groups of removed shards are assigned again
+    assert assign_groups(volumes, 1, current={"a": 0, "b": 3}) == {
+        "a": 0,
+        "b": 0,
+        "c": 0,
+    }
+
+
+def test_estimate_group_volumes(tmp_path):
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    store = DailyCountsStore(tmp_path)
+    store.update("#cop26", {1: 100, 2: 100})
+    store.update("#climate", {1: 10, 2: 10})
+
+    assert estimate_group_volumes(compose_config, store) == {
+        "cop26": 3100,
+        # Rules without counts have the average volume of the others
+        "climate": 310 + 1705,
+        "energy": 1705,
+    }
+
+
+def test_current_assignment():
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    installed = [
+        {TwitterRule(value="#ipcc", tag="climate", id="1")},
+        {TwitterRule(value="#cop26", tag="cop26", id="2")},
+    ]
+    assert current_assignment(compose_config, installed) == {
+        "climate": 0,
+        "cop26": 1,
+    }
+
+
+def test_get_shards():
+    compose_config = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    shard0, shard1 = get_shards(
+        "project", compose_config, {"cop26": 1, "climate": 0, "energy": 1}
+    )
+
+    assert shard0.project_name == "project-shard0"
+    assert list(shard0.compose_config.streams) == ["climate"]
+    assert shard0.credentials_file == pathlib.Path("app0.yml")
+    assert pathlib.Path(shard1.compose_config.output.path) == pathlib.Path(
+        "data/shard1"
+    )
+    assert list(shard1.compose_config.streams) == ["cop26", "energy"]
+    assert get_collectors("project", compose_config, pathlib.Path("c.yml")) == [
+        ("project-shard0", pathlib.Path("app0.yml")),
+        ("project-shard1", pathlib.Path("app1.yml")),
+    ]
+
+
+def test_update_removes_rules_of_unused_shards(tmp_path, fake_twitter):
+    shards = []
+    for index in range(2):
+        credentials = tmp_path / f"app{index}.yml"
+        credentials.write_text(f"twitter_token: token{index}\n")
+        shards.append({"credentials": str(credentials)})
+    backend = InMemoryCollectionBackend()
+
+    def update(**config):
+        update_project(
+            "project",
+            TwitterComposeModel.parse_obj(dict(COMPOSE_CONFIG, **config)),
+            tmp_path / "credentials.yml",
+            backend,
+            print_func=lambda m: None,
+        )
+
+    def installed(token: str) -> set:
+        return {r["value"] for r in fake_twitter.state.rules(token).values()}
+
+    streams = {
+        "cop26": COMPOSE_CONFIG["streams"]["cop26"],
+        "climate": COMPOSE_CONFIG["streams"]["climate"][:1],
+    }
+    update(streams=streams, shards=shards)
+    assert installed("token0") == {"#climate"}
+    assert installed("token1") == {"#cop26"}
+
+    # The rules of the shards applied by the last update are not fetched again
+    fake_twitter.state.requests.clear()
+    update(streams=streams, shards=shards)
+    assert ("GET", RULES_PATH) not in fake_twitter.state.requests
+
+    # The shard without stream groups is stopped and its rules deleted
+    update(streams={"cop26": streams["cop26"]}, shards=shards)
+    assert installed("token0") == set()
+    assert not backend.is_running("project-shard0")
+    assert backend.is_running("project-shard1")
+
+    # The rules of a shard removed from the compose file are deleted too
+    update(streams=streams, shards=shards[:1])
+    assert installed("token0") == {"#climate", "#cop26"}
+    assert installed("token1") == set()
+    assert not backend.is_running("project-shard1")
@@ -0,0 +1,18 @@
+import time
+
+from twcompose.concurrency import run_sync
+from twcompose.twitter.aio import AsyncMonthlyTwitterCountEstimator
+
+
+class SlowEstimator:
+    def estimate(self, rule: str) -> int:
+        time.sleep(0.1)
+        return len(rule)
+
+
+def test_estimate_many_is_concurrent():
+    estimator = AsyncMonthlyTwitterCountEstimator(SlowEstimator())  # type: ignore
+    start = time.perf_counter()
+    volumes = run_sync(estimator.estimate_many(["a", "bb", "ccc", "dddd"]))
+    assert volumes == [1, 2, 3, 4]
+    assert time.perf_counter() - start < 0.3
@@ -0,0 +1,97 @@
+from typing import List
+
+import pytest
+import requests
+
+from twcompose.twitter import http
+from twcompose.twitter.http import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    TwitterHTTPClient,
+    get_circuit_breaker,
+)
+
+
+def make_response(status_code: int, headers: dict = {}) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    response._content = b"{}"
+    return response
+
+
+class FakeSession:
+    """Returns the given responses in order"""
+
+    def __init__(self, responses: List[requests.Response]):
+        self.responses = responses
+        self.calls = 0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        self.calls += 1
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(http.time, "sleep", lambda s: None)
+
+
+@pytest.fixture(autouse=True)
+def circuit_breakers(monkeypatch):
+    # Failures of a test do not open the circuit of the next ones
+    monkeypatch.setattr(http, "_circuit_breakers", {})
+
+
+def test_retry_on_server_error():
+    session = FakeSession([make_response(503), make_response(429), make_response(200)])
+    client = TwitterHTTPClient("token", session=session)  # type: ignore
+    assert client.request("get", "https://twitter").status_code == 200
+    assert session.calls == 3
+
+
+def test_retry_exhausted():
+    session = FakeSession([make_response(500) for _ in range(3)])
+    policy = RetryPolicy(max_retries=2)
+    client = TwitterHTTPClient("token", policy, session=session)  # type: ignore
+    with pytest.raises(requests.HTTPError):
+        client.request("get", "https://twitter")
+    assert session.calls == 3
+
+
+def test_rate_limit_wait_is_bounded(monkeypatch):
+    # The reset time of the rate limit is stuck in the past
+    session = FakeSession(
+        [make_response(429, {"x-rate-limit-reset": "0"}) for _ in range(4)]
+    )
+    policy = RetryPolicy(max_rate_limit_wait=3)
+    client = TwitterHTTPClient("token", policy, session=session)  # type: ignore
+    with pytest.raises(requests.HTTPError):
+        client.request("get", "https://twitter")
+    # Waiting a second after each of the first 3 responses
+    assert session.calls == 4
+
+
+def test_circuit_breaker_shared_by_token():
+    assert TwitterHTTPClient("token").circuit_breaker is get_circuit_breaker("token")
+    assert TwitterHTTPClient("token").circuit_breaker is not (
+        TwitterHTTPClient("other").circuit_breaker
+    )
+
+
+def test_circuit_breaker_opens():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    breaker.before_request()
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=4)
+    assert 0.5 <= policy.backoff(0) <= 1
+    assert 2 <= policy.backoff(10) <= 4
@@ -0,0 +1,34 @@
+import time
+
+from twcompose.twitter.ratelimit import TokenBucket
+
+
+def rate_limit_headers(limit: int, remaining: int, reset_in: float) -> dict:
+    return {
+        "x-rate-limit-limit": str(limit),
+        "x-rate-limit-remaining": str(remaining),
+        "x-rate-limit-reset": str(int(time.time() + reset_in)),
+    }
+
+
+def test_bucket_sized_from_headers():
+    bucket = TokenBucket()
+    assert bucket.acquire() == 0
+    bucket.update_from_headers(rate_limit_headers(300, 3, 900))
+    # The 3 remaining requests are available without waiting
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+
+
+def test_bucket_waits_for_reset():
+    bucket = TokenBucket()
+    bucket.acquire()
+    bucket.update_from_headers(rate_limit_headers(300, 0, 1))
+    assert bucket.acquire() > 0
+
+
+def test_bucket_without_headers():
+    bucket = TokenBucket(capacity=2, refill_rate=100)
+    bucket.acquire()
+    bucket.update_from_headers({})
+    bucket.acquire()
+    assert bucket.acquire() < 0.1
@@ -0,0 +1,60 @@
+from typing import Dict, List
+
+from twcompose.concurrency import run_sync
+from twcompose.handlers.volume import (
+    GroupedVolumeEstimatorCommandHandler,
+    group_rules,
+    or_query,
+)
+
+
+class FakeEstimator:
+    """Volume of a query is the sum of the volume of its rules"""
+
+    def __init__(self, volumes: Dict[str, int]):
+        self.volumes = volumes
+        self.queries: List[str] = []
+
+    async def estimate(self, query: str) -> int:
+        self.queries.append(query)
+        return sum(
+            v for r, v in self.volumes.items() if query == r or f"({r})" in query
+        )
+
+
+def test_or_query():
+    assert or_query(["a"]) == "a"
+    assert or_query(["a", "b c"]) == "(a) OR (b c)"
+
+
+def test_group_rules():
+    assert group_rules(["a", "b", "c"], max_query_length=12) == [["a", "b"], ["c"]]
+    assert group_rules(["a very long rule", "b"], max_query_length=5) == [
+        ["a very long rule"],
+        ["b"],
+    ]
+
+
+def test_grouped_estimation():
+    volumes = {f"rule{i}": 1 for i in range(16)}
+    volumes["rule3"] = 1000
+    estimator = FakeEstimator(volumes)
+    handler = GroupedVolumeEstimatorCommandHandler()
+
+    result = run_sync(
+        handler._estimate_rules(
+            estimator, list(volumes), concurrency=2, min_volume=100  # type: ignore
+        )
+    )
+    assert result == [("rule3", 1000)]
+    # One call for the group then two per level of the bisection
+    assert len(estimator.queries) == 1 + 2 * 4
+
+    # A minimum of 0 only counts the groups
+    estimator = FakeEstimator(volumes)
+    result = run_sync(
+        handler._estimate_rules(
+            estimator, ["rule0", "rule1"], concurrency=2, min_volume=0  # type: ignore
+        )
+    )
+    assert result == [("rule0", 1), ("rule1", 1)]
@@ -0,0 +1,164 @@
+import pathlib
+import threading
+import time
+from typing import List
+
+import pytest
+import yaml
+from fake_twitter import RULES_PATH
+
+from twcompose.backends.memory import InMemoryCollectionBackend
+from twcompose.commands.watch import (
+    WatchSession,
+    changed_stream_groups,
+    only_streams_changed,
+    watch,
+)
+from twcompose.compose import TwitterComposeModel
+from twcompose.filewatch import InotifyWatcher, PollingWatcher, get_file_watcher
+
+COMPOSE_CONFIG = {
+    "image_tag": "0.1.0",
+    "output": {"driver": "local", "path": "./data/", "options": {}},
+    "parameters": {},
+    "streams": {
+        "cop26": [{"tag": "cop26", "value": "#cop26"}],
+        "climate": [{"tag": "climate", "value": "#climate"}],
+    },
+}
+
+
+def write_compose_file(path: pathlib.Path, **update) -> pathlib.Path:
+    path.write_text(yaml.safe_dump(dict(COMPOSE_CONFIG, **update)))
+    return path
+
+
+@pytest.fixture
+def compose_file(tmp_path, monkeypatch) -> pathlib.Path:
+    monkeypatch.setenv("TWCOMPOSE_CACHE_DIR", str(tmp_path / "cache"))
+    return write_compose_file(tmp_path / "twitter-compose.yml")
+
+
+@pytest.mark.parametrize("watcher_class", [InotifyWatcher, PollingWatcher])
+def test_file_watcher(watcher_class, compose_file):
+    with watcher_class(compose_file) as watcher:
+        assert not watcher.wait(timeout=0.1)
+        # Other files of the folder are ignored
+        (compose_file.parent / "credentials.yml").write_text("")
+        assert not watcher.wait(timeout=0.1)
+
+        write_compose_file(compose_file, image_tag="0.2.0")
+        assert watcher.wait(timeout=2)
+
+        # Replacing the file as editors do
+        new_file = compose_file.parent / "twitter-compose.yml.tmp"
+        write_compose_file(new_file, image_tag="0.3.0")
+        new_file.replace(compose_file)
+        assert watcher.wait(timeout=2)
+
+
+def test_changed_stream_groups():
+    current = TwitterComposeModel.parse_obj(COMPOSE_CONFIG)
+    new = TwitterComposeModel.parse_obj(
+        dict(
+            COMPOSE_CONFIG,
+            streams={
+                "cop26": [{"tag": "cop26", "value": "#cop26 OR #cop27"}],
+                "climate": [{"tag": "climate", "value": "#climate"}],
+                "ipcc": [{"tag": "ipcc", "value": "#ipcc"}],
+            },
+        )
+    )
+    assert changed_stream_groups(current, new) == {"cop26", "ipcc"}
+    assert only_streams_changed(current, new)
+    assert not only_streams_changed(current, current.copy(update={"image_tag": "0"}))
+
+
+@pytest.fixture
+def session(fake_twitter, compose_file) -> WatchSession:
+    credentials_file = compose_file.parent / "credentials.yml"
+    credentials_file.write_text("twitter_token: token\n")
+    return WatchSession(
+        "project",
+        compose_file,
+        credentials_file,
+        InMemoryCollectionBackend(),
+        print_func=lambda m: None,
+    )
+
+
+def installed_rules(fake_twitter) -> set:
+    return {(r["tag"], r["value"]) for r in fake_twitter.state.rules().values()}
+
+
+def test_watch_session(session, fake_twitter, compose_file):
+    session.apply()
+    assert installed_rules(fake_twitter) == {
+        ("cop26", "#cop26"),
+        ("climate", "#climate"),
+    }
+
+    # Only the rules of the changed groups are pushed
+    fake_twitter.state.requests.clear()
+    write_compose_file(
+        compose_file,
+        streams={
+            "cop26": [{"tag": "cop26", "value": "#cop26 OR #cop27"}],
+            "ipcc": [{"tag": "ipcc", "value": "#ipcc"}],
+        },
+    )
+    session.apply()
+    assert installed_rules(fake_twitter) == {
+        ("cop26", "#cop26 OR #cop27"),
+        ("ipcc", "#ipcc"),
+    }
+    assert {m for m, _ in fake_twitter.state.requests} == {"POST"}
+
+    # The created rules are known without fetching them
+    fake_twitter.state.requests.clear()
+    write_compose_file(compose_file, streams={"ipcc": [{"tag": "ipcc", "value": "a"}]})
+    session.apply()
+    assert installed_rules(fake_twitter) == {("ipcc", "a")}
+    assert {m for m, _ in fake_twitter.state.requests} == {"POST"}
+
+    # The collector changes with the image, from the rules applied by the session
+    fake_twitter.state.requests.clear()
+    write_compose_file(
+        compose_file,
+        streams={"ipcc": [{"tag": "ipcc", "value": "a"}]},
+        image_tag="0.2.0",
+    )
+    session.apply()
+    assert session.backend.calls["update"] == 2
+    assert ("GET", RULES_PATH) not in fake_twitter.state.requests
+
+
+def test_watch_debounce(session, fake_twitter, compose_file):
+    session.apply()
+    messages: List[str] = []
+    session.print_func = messages.append
+    stop_event = threading.Event()
+    with get_file_watcher(compose_file) as watcher:
+        thread = threading.Thread(
+            target=watch, args=(session, watcher, 0.2, stop_event)
+        )
+        thread.start()
+        try:
+            # A burst of edits is applied at once
+            for value in ("#cop", "#cop2", "#cop26 OR #cop27"):
+                write_compose_file(
+                    compose_file,
+                    streams={"cop26": [{"tag": "cop26", "value": value}]},
+                )
+                time.sleep(0.05)
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline and not any(
+                m.endswith("Done.") for m in messages
+            ):
+                time.sleep(0.02)
+        finally:
+            stop_event.set()
+            thread.join()
+
+    assert installed_rules(fake_twitter) == {("cop26", "#cop26 OR #cop27")}
+    assert messages.count(f"{compose_file} changed.") == 1